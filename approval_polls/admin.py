@@ -53,6 +53,18 @@ class ChoiceInline(admin.TabularInline):
     extra = 3
 
 
+def set_visibility(polls, is_private):
+    """
+    Make `polls` private or public, saving each so that its tags' statistics
+    follow. Returns how many changed.
+    """
+    changed = polls.exclude(is_private=is_private)
+    for poll in changed:
+        poll.is_private = is_private
+        poll.save()
+    return len(changed)
+
+
 @admin.register(Poll)
 class PollAdmin(admin.ModelAdmin):
     """
@@ -110,7 +122,7 @@ class PollAdmin(admin.ModelAdmin):
 
     @admin.action(description="Mark selected polls as private (hide from front page)")
     def make_private(self, request, queryset):
-        updated = queryset.update(is_private=True)
+        updated = set_visibility(queryset, is_private=True)
         self.message_user(
             request,
             f"{updated} poll(s) marked as private and hidden from front page.",
@@ -118,7 +130,7 @@ class PollAdmin(admin.ModelAdmin):
 
     @admin.action(description="Mark selected polls as public (show on front page)")
     def make_public(self, request, queryset):
-        updated = queryset.update(is_private=False)
+        updated = set_visibility(queryset, is_private=False)
         self.message_user(
             request,
             f"{updated} poll(s) marked as public and shown on front page.",
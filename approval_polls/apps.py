@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class ApprovalPollsConfig(AppConfig):
+    name = "approval_polls"
+
+    def ready(self):
+        from approval_polls.sqlite import configure_connection
+
+        connection_created.connect(
+            configure_connection, dispatch_uid="approval_polls.sqlite"
+        )
@@ -0,0 +1,8 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+
+# Static files are served by AsyncWhiteNoiseMiddleware
+application = get_asgi_application()
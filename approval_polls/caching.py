@@ -0,0 +1,62 @@
+"""
+Caching of values derived from a poll's ballots and choices.
+
+Entries are keyed by ``(poll.id, poll.revision)``. Every ballot, vote or
+choice change bumps the revision, so a cached value is never invalidated,
+only left behind to be evicted by the cache backend (least recently used
+first with the default local-memory cache).
+"""
+
+from collections import Counter
+
+from django.core.cache import cache
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Hits and misses per cache name since this process started.
+stats = Counter()
+
+
+def cached_for_revision(name, poll, compute, timeout=CACHE_TIMEOUT):
+    """
+    Return the ``name`` value for the poll's current revision, calling
+    ``compute()`` and caching the result on a miss.
+    """
+    key = f"{name}:{poll.id}:{poll.revision}"
+    value = cache.get(key)
+    if value is None:
+        stats[name, "misses"] += 1
+        value = compute()
+        cache.set(key, value, timeout)
+    else:
+        stats[name, "hits"] += 1
+    return value
+
+
+async def acached_for_revision(
+    name, poll, compute, timeout=CACHE_TIMEOUT, revision=None
+):
+    """
+    cached_for_revision() for async callers, awaiting ``compute()``. Pass
+    ``revision`` to cache a value derived from an earlier revision of the
+    poll, such as that of its background snapshot, under that revision.
+    """
+    if revision is None:
+        revision = poll.revision
+    key = f"{name}:{poll.id}:{revision}"
+    value = await cache.aget(key)
+    if value is None:
+        stats[name, "misses"] += 1
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    else:
+        stats[name, "hits"] += 1
+    return value
+
+
+def cache_stats():
+    names = sorted({name for name, _ in stats})
+    return {
+        name: {"hits": stats[name, "hits"], "misses": stats[name, "misses"]}
+        for name in names
+    }
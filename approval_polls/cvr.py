@@ -0,0 +1,259 @@
+"""
+Importing cast vote records: ballots counted elsewhere, on paper or in
+another voting tool, loaded into a poll.
+
+A CSV file has a header row naming one of the poll's choices per column, by
+its text or ID, and a row per ballot marking each approved choice with 1, x,
+yes or true, and the others with 0, no, false or nothing. An NDJSON file has
+a line per ballot holding the approved choices' texts or IDs in a JSON
+array, or an object with an "approvals" array. A line with a "choices" list,
+like the first line of the raw ballots export, gives the texts of the IDs
+used by the lines after it, so an export of another poll can be imported.
+
+The file is read twice as a stream: first to check every record, so that an
+invalid file imports nothing, then to insert its ballots a batch at a time
+with BallotImport.add_ballots(). Each batch commits with the import's
+progress, and importing the same file into the poll again carries on after
+the last batch saved.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+
+from django.conf import settings
+
+from approval_polls.models import BallotImport, write_in_key
+
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+APPROVED = {"1", "x", "yes", "y", "true"}
+NOT_APPROVED = {"", "0", "no", "n", "false"}
+
+# Invalid records listed in the error of a file that fails validation.
+MAX_REPORTED_ERRORS = 10
+
+
+class InvalidFile(ValueError):
+    pass
+
+
+def file_format(name):
+    """The format of a file of cast vote records, from its name."""
+    extension = os.path.splitext(name)[1].lower()
+    if extension not in FORMATS:
+        raise InvalidFile(
+            f"{name}: expected a .csv or .ndjson file of cast vote records."
+        )
+    return FORMATS[extension]
+
+
+class ChoiceResolver:
+    """Map choice IDs and texts, compared like write-ins, to a poll's choices."""
+
+    def __init__(self, poll):
+        self.ids = set()
+        self.by_key = {}
+        # Highest ID first, so the oldest of choices with the same text wins
+        for choice_id, text in poll.choice_set.order_by("-id").values_list(
+            "id", "choice_text"
+        ):
+            self.ids.add(choice_id)
+            self.by_key[write_in_key(text)] = choice_id
+
+    def __call__(self, value):
+        """The choice ID `value` refers to, or None."""
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            return value if value in self.ids else None
+        if not isinstance(value, str):
+            return None
+        choice_id = self.by_key.get(write_in_key(value))
+        if choice_id is None and value.strip().isdigit():
+            choice_id = self(int(value))
+        return choice_id
+
+
+def csv_records(text, resolve):
+    """
+    Yield `(number, choice_ids, error)` for each ballot row of a CSV file,
+    with either the set of approved choice IDs or an error message.
+    """
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        raise InvalidFile("The file is empty.")
+    columns = [resolve(name) for name in header]
+    unknown = [name for name, column in zip(header, columns) if column is None]
+    if unknown:
+        raise InvalidFile(
+            f"Columns not matching a choice of the poll: {', '.join(unknown)}"
+        )
+
+    for number, row in enumerate(reader, 1):
+        if len(row) > len(columns):
+            yield number, None, f"{len(row)} values for {len(columns)} columns"
+            continue
+        approved, invalid = set(), []
+        for column, value in zip(columns, row):
+            value = value.strip().lower()
+            if value in APPROVED:
+                approved.add(column)
+            elif value not in NOT_APPROVED:
+                invalid.append(value)
+        if invalid:
+            yield number, None, f"not an approval mark: {invalid[0]!r}"
+        else:
+            yield number, approved, None
+
+
+def ndjson_records(text, resolve):
+    """Yield `(number, choice_ids, error)` for each ballot line of an NDJSON file."""
+    number = 0
+    # Choice texts by the IDs of another poll, from a "choices" line
+    texts = {}
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            number += 1
+            yield number, None, "not valid JSON"
+            continue
+        if isinstance(record, dict) and "choices" in record:
+            texts = choice_texts(record["choices"])
+            continue
+
+        number += 1
+        if isinstance(record, dict):
+            record = record.get("approvals")
+        if not isinstance(record, list):
+            yield number, None, "expected a list of approved choices"
+            continue
+        approved = set()
+        for value in record:
+            if isinstance(value, (int, str)):
+                value = texts.get(value, value)
+            choice_id = resolve(value)
+            if choice_id is None:
+                yield number, None, f"unknown choice {value!r}"
+                break
+            approved.add(choice_id)
+        else:
+            yield number, approved, None
+
+
+def choice_texts(choices):
+    """Choice texts by ID, from the list of a "choices" line."""
+    if not isinstance(choices, list):
+        raise InvalidFile('The "choices" line must hold a list.')
+    texts = {}
+    for choice in choices:
+        if not isinstance(choice, dict) or "id" not in choice:
+            continue
+        choice_id = choice["id"]
+        if isinstance(choice_id, bool) or not isinstance(choice_id, (int, str)):
+            raise InvalidFile(
+                f'The "choices" line has an ID that is not a number or text: '
+                f"{choice_id!r}"
+            )
+        if isinstance(choice.get("choice_text"), str):
+            texts[choice_id] = choice["choice_text"]
+    return texts
+
+
+READERS = {"csv": csv_records, "ndjson": ndjson_records}
+
+
+def records(file, file_format, resolve):
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        yield from READERS[file_format](text, resolve)
+    except UnicodeDecodeError:
+        raise InvalidFile("The file is not UTF-8 text.")
+    except csv.Error as error:
+        raise InvalidFile(f"The file is not valid CSV: {error}.")
+    finally:
+        # Leave the underlying file open for the next pass
+        text.detach()
+
+
+def validate(file, file_format, resolve):
+    """
+    Check every record of the file, returning how many there are and the
+    messages of the invalid ones.
+    """
+    total, errors = 0, []
+    for number, _, error in records(file, file_format, resolve):
+        total = number
+        if error:
+            errors.append(f"record {number}: {error}")
+    return total, errors
+
+
+def import_ballots(
+    poll, file, name, file_format, skip_invalid=False, batch_size=None, progress=None
+):
+    """
+    Import the cast vote records of a binary, seekable `file` into `poll`,
+    resuming an earlier import of the same file. Invalid records are
+    skipped with `skip_invalid`, and otherwise stop the import before it
+    saves anything. `progress(ballot_import, total)` is called after each
+    batch.
+
+    Returns the BallotImport; raises InvalidFile if the file can't be
+    imported.
+    """
+    batch_size = batch_size or settings.CVR_IMPORT_BATCH_SIZE
+    file.seek(0)
+    digest = hashlib.file_digest(file, "sha256").hexdigest()
+    resolve = ChoiceResolver(poll)
+
+    total, errors = validate(file, file_format, resolve)
+    if errors and not skip_invalid:
+        listed = "; ".join(errors[:MAX_REPORTED_ERRORS])
+        more = len(errors) - MAX_REPORTED_ERRORS
+        raise InvalidFile(
+            f"{len(errors)} invalid records: {listed}"
+            + (f"; and {more} more" if more > 0 else "")
+        )
+
+    ballot_import, _ = BallotImport.objects.get_or_create(
+        poll=poll, digest=digest, defaults={"name": name}
+    )
+    if ballot_import.finished_at is not None:
+        raise InvalidFile(
+            f"{name} was already imported into this poll on "
+            f"{ballot_import.finished_at:%Y-%m-%d} ({ballot_import.ballots} ballots)."
+        )
+
+    batch, skipped, number = [], 0, ballot_import.records
+    for number, approved, error in records(file, file_format, resolve):
+        if number <= ballot_import.records:
+            continue
+        if error:
+            skipped += 1
+        else:
+            batch.append(approved)
+        if len(batch) + skipped >= batch_size:
+            save(ballot_import, batch, number, skipped, total, progress)
+            batch, skipped = [], 0
+    if batch or skipped:
+        save(ballot_import, batch, number, skipped, total, progress)
+    ballot_import.finish()
+    return ballot_import
+
+
+def save(ballot_import, batch, number, skipped, total, progress):
+    if not ballot_import.add_ballots(batch, number, skipped):
+        raise InvalidFile(
+            f"{ballot_import.name} is being imported into this poll by another "
+            "process."
+        )
+    if progress:
+        progress(ballot_import, total)
@@ -0,0 +1,75 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from approval_polls import cvr
+from approval_polls.models import Poll
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a CSV or NDJSON file of cast vote records into a poll as "
+        "ballots. Running it again with the same file resumes an interrupted "
+        "import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("poll_id", type=int)
+        parser.add_argument("path", help="A .csv, .ndjson or .jsonl file.")
+        parser.add_argument(
+            "--format",
+            choices=sorted(set(cvr.FORMATS.values())),
+            help="The file's format, if its extension doesn't say.",
+        )
+        parser.add_argument(
+            "--skip-invalid",
+            action="store_true",
+            help="Import the valid records of a file with invalid ones.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Ballots saved per transaction (default "
+            "settings.CVR_IMPORT_BATCH_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            poll = Poll.objects.get(id=options["poll_id"])
+        except Poll.DoesNotExist:
+            raise CommandError(f"Poll {options['poll_id']} does not exist.")
+
+        started = time.monotonic()
+
+        def progress(ballot_import, total):
+            self.stdout.write(
+                f"{ballot_import.records}/{total} records read,"
+                f" {ballot_import.ballots} ballots imported"
+                f" ({ballot_import.skipped} skipped),"
+                f" {time.monotonic() - started:.1f}s"
+            )
+
+        try:
+            file_format = options["format"] or cvr.file_format(options["path"])
+            with open(options["path"], "rb") as file:
+                ballot_import = cvr.import_ballots(
+                    poll,
+                    file,
+                    os.path.basename(options["path"]),
+                    file_format,
+                    skip_invalid=options["skip_invalid"],
+                    batch_size=options["batch_size"],
+                    progress=progress,
+                )
+        except (OSError, cvr.InvalidFile) as error:
+            raise CommandError(str(error))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {ballot_import.ballots} ballots into poll {poll.id}"
+                f" ({ballot_import.skipped} invalid records skipped) in"
+                f" {elapsed:.1f}s"
+            )
+        )
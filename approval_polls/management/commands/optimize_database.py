@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from approval_polls.sqlite import checkpoint, optimize, pragma
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh SQLite's query planner statistics and checkpoint its "
+        "write-ahead log. run_results_worker runs this hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run a full ANALYZE instead of PRAGMA optimize.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            choices=["PASSIVE", "FULL", "RESTART", "TRUNCATE"],
+            default="PASSIVE",
+            help="WAL checkpoint mode.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor != "sqlite":
+            self.stdout.write("Nothing to do: not an SQLite database.")
+            return
+        self.maintain(connection, options)
+
+    def maintain(self, connection, options):
+        started = time.perf_counter()
+        optimize(connection, analyze=options["analyze"])
+        message = "Analyzed" if options["analyze"] else "Optimized"
+        if pragma(connection, "journal_mode") == "wal":
+            busy, log, checkpointed = checkpoint(connection, options["checkpoint"])
+            message += (
+                f", checkpointed {checkpointed} of {log} WAL frames"
+                f"{' (busy)' if busy else ''}"
+            )
+        self.stdout.write(f"{message} in {time.perf_counter() - started:.2f}s")
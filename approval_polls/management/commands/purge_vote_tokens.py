@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from approval_polls.models import VoteToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete vote form tokens older than settings.VOTE_TOKEN_TTL. "
+        "run_results_worker runs this hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Tokens deleted per statement.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = VoteToken.purge(options["batch_size"])
+        self.stdout.write(f"Deleted {deleted} expired vote tokens")
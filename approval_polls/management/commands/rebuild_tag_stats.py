@@ -0,0 +1,72 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+
+from approval_polls.models import TagStats
+from approval_polls.sqlite import write_transaction
+
+
+def differs(stored, expected):
+    return (
+        stored.public_polls != expected.public_polls
+        or stored.last_used != expected.last_used
+        or (stored.activity is None) != (expected.activity is None)
+        or (
+            stored.activity is not None
+            # Logs of sums, so their absolute difference is the relative error
+            and not math.isclose(stored.activity, expected.activity, abs_tol=1e-9)
+        )
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the stored statistics of every tag, read by the tag cloud and "
+        "the popular tags sidebar, from the public polls it is on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report tags whose statistics disagree with their polls, "
+            "and exit with an error if there are any.",
+        )
+
+    def handle(self, *args, **options):
+        with write_transaction():
+            expected = TagStats.counted()
+            stored = {stats.tag_id: stats for stats in TagStats.objects.all()}
+            # A tag without public polls may or may not have a row of zeros
+            stale = [
+                tag_id
+                for tag_id in expected.keys() | stored.keys()
+                if differs(
+                    stored.get(tag_id, TagStats()), expected.get(tag_id, TagStats())
+                )
+            ]
+            for tag_id in sorted(stale):
+                before = stored.get(tag_id, TagStats())
+                after = expected.get(tag_id, TagStats())
+                self.stdout.write(
+                    f"Tag {tag_id}: {before.public_polls} public polls stored; "
+                    f"{after.public_polls} counted"
+                )
+
+            if options["verify"]:
+                if stale:
+                    raise CommandError(
+                        f"The statistics of {len(stale)} tags are out of date."
+                    )
+                self.stdout.write("All tag statistics are up to date.")
+                return
+
+            # Rewritten rather than deleted, so the tag index sees the change
+            TagStats.objects.filter(tag_id__in=stale).delete()
+            TagStats.objects.bulk_create(
+                expected.get(tag_id, TagStats(tag_id=tag_id)) for tag_id in stale
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt the statistics of {len(stale)} tags.")
+        )
@@ -0,0 +1,191 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from approval_polls.models import (
+    ApprovalSizeCount,
+    Ballot,
+    Choice,
+    CoApprovalCount,
+    Poll,
+    Vote,
+)
+from approval_polls.sqlite import write_transaction
+from approval_polls.tally import BallotMatrix
+
+
+def expected_counts(poll):
+    """
+    The co-approval and approval-size counts of `poll`, recounted from its
+    votes, as `{(choice_a_id, choice_b_id): n}` and `{(choice_id, size): n}`.
+    """
+    matrix = BallotMatrix.from_poll(poll)
+    ids = matrix.choice_ids
+    co_approvals = matrix.co_approval_counts()
+    distributions = matrix.candidate_approval_distributions()
+    pairs = {
+        (ids[i], ids[j]): int(co_approvals[i, j])
+        for i in range(len(ids))
+        for j in range(i + 1, len(ids))
+        if co_approvals[i, j]
+    }
+    sizes = {
+        (ids[i], size): int(distributions[i, size])
+        for i, size in zip(*distributions.nonzero())
+    }
+    return pairs, sizes
+
+
+def stored_counts(poll):
+    pairs = dict(
+        ((a, b), n)
+        for a, b, n in CoApprovalCount.objects.filter(
+            poll=poll, ballots__gt=0
+        ).values_list("choice_a_id", "choice_b_id", "ballots")
+    )
+    sizes = dict(
+        ((choice_id, size), n)
+        for choice_id, size, n in ApprovalSizeCount.objects.filter(
+            poll=poll, ballots__gt=0
+        ).values_list("choice_id", "size", "ballots")
+    )
+    return pairs, sizes
+
+
+def count_of(model, **filters):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**filters)
+            .order_by()
+            .values(*filters)
+            .annotate(n=Count("pk"))
+            .values("n")
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the stored ballot and vote counters of polls and choices, and "
+        "the co-approval and approval-size counts of polls, from the raw "
+        "Ballot and Vote rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "poll_ids", nargs="*", type=int, help="Limit to these polls."
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report counters that disagree with the raw rows, and "
+            "exit with an error if there are any.",
+        )
+
+    def handle(self, *args, **options):
+        polls = Poll.objects.all()
+        if options["poll_ids"]:
+            polls = polls.filter(id__in=options["poll_ids"])
+
+        if options["verify"]:
+            with transaction.atomic():
+                stale = self.find_stale(polls)
+            if any(stale):
+                stale_polls, stale_choices, stale_stores = stale
+                raise CommandError(
+                    f"{len(stale_polls)} poll and {len(stale_choices)} "
+                    f"choice counters and the counts of {len(stale_stores)} "
+                    "polls are out of date."
+                )
+            self.stdout.write("All counters are up to date.")
+            return
+
+        # A transaction per poll, so that votes on other polls only wait for
+        # one poll's recount at a time.
+        rebuilt = [0, 0, 0]
+        for poll_id in polls.order_by("id").values_list("id", flat=True):
+            with write_transaction():
+                stale = self.find_stale(Poll.objects.filter(id=poll_id))
+                if any(stale):
+                    self.repair(*stale)
+                    # Cached results and ETags of the poll are out of date
+                    Poll.objects.get(id=poll_id).bump_revision()
+            rebuilt = [total + len(items) for total, items in zip(rebuilt, stale)]
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {rebuilt[0]} poll and {rebuilt[1]} choice counters "
+                f"and the counts of {rebuilt[2]} polls."
+            )
+        )
+
+    def find_stale(self, polls):
+        """
+        Report and return the polls and choices of `polls` whose counters
+        disagree with the raw rows, and the expected co-approval and
+        approval-size counts of those whose counts do.
+        """
+        stale_polls = [
+            poll
+            for poll in polls.annotate(
+                expected_ballots=count_of(Ballot, poll=OuterRef("pk")),
+                expected_votes=count_of(Vote, choice__poll=OuterRef("pk")),
+            ).only("id", "ballot_count", "vote_count")
+            if (poll.ballot_count, poll.vote_count)
+            != (poll.expected_ballots, poll.expected_votes)
+        ]
+        stale_choices = [
+            choice
+            for choice in Choice.objects.filter(poll__in=polls)
+            .annotate(expected_votes=count_of(Vote, choice=OuterRef("pk")))
+            .only("id", "poll_id", "vote_count")
+            if choice.vote_count != choice.expected_votes
+        ]
+
+        stale_stores = {}
+        for poll in polls.only("id", "ballot_count"):
+            expected = expected_counts(poll)
+            if expected != stored_counts(poll):
+                stale_stores[poll] = expected
+
+        for poll in stale_polls:
+            self.stdout.write(
+                f"Poll {poll.id}: {poll.ballot_count} ballots, "
+                f"{poll.vote_count} votes stored; {poll.expected_ballots} "
+                f"ballots, {poll.expected_votes} votes counted"
+            )
+        for choice in stale_choices:
+            self.stdout.write(
+                f"Choice {choice.id} (poll {choice.poll_id}): "
+                f"{choice.vote_count} votes stored; "
+                f"{choice.expected_votes} votes counted"
+            )
+        for poll in stale_stores:
+            self.stdout.write(
+                f"Poll {poll.id}: co-approval and approval-size counts "
+                "differ from the votes"
+            )
+        return stale_polls, stale_choices, stale_stores
+
+    def repair(self, stale_polls, stale_choices, stale_stores):
+        for poll in stale_polls:
+            poll.ballot_count = poll.expected_ballots
+            poll.vote_count = poll.expected_votes
+        for choice in stale_choices:
+            choice.vote_count = choice.expected_votes
+        Poll.objects.bulk_update(stale_polls, ["ballot_count", "vote_count"])
+        Choice.objects.bulk_update(stale_choices, ["vote_count"])
+
+        for poll, (pairs, sizes) in stale_stores.items():
+            CoApprovalCount.objects.filter(poll=poll).delete()
+            ApprovalSizeCount.objects.filter(poll=poll).delete()
+            CoApprovalCount.objects.bulk_create(
+                CoApprovalCount(poll=poll, choice_a_id=a, choice_b_id=b, ballots=n)
+                for (a, b), n in pairs.items()
+            )
+            ApprovalSizeCount.objects.bulk_create(
+                ApprovalSizeCount(poll=poll, choice_id=c, size=size, ballots=n)
+                for (c, size), n in sizes.items()
+            )
@@ -0,0 +1,106 @@
+import time
+
+import structlog
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from approval_polls import ratelimit
+from approval_polls.models import Poll, ResultsJob, ResultsSnapshot
+from approval_polls.tally import compute_snapshot_ballots, compute_spav_sweep
+from approval_polls.views import results_context
+
+logger = structlog.get_logger(__name__)
+
+# Longest wait, in seconds, between tries after a job or the database fails.
+MAX_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute queued results snapshots of large polls, furthest behind "
+        "first, and maintain the database every --maintain-every seconds. "
+        "Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for jobs.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between checks of an empty queue.",
+        )
+        parser.add_argument(
+            "--maintain-every",
+            type=float,
+            default=3600,
+            help="Seconds between runs of optimize_database and "
+            "purge_vote_tokens, or 0 never to run them.",
+        )
+
+    def handle(self, *args, **options):
+        failures = 0
+        maintain_every = options["maintain_every"]
+        next_maintenance = time.monotonic() + maintain_every
+        while True:
+            try:
+                if maintain_every and time.monotonic() >= next_maintenance:
+                    # Not retried sooner if it fails
+                    next_maintenance = time.monotonic() + maintain_every
+                    self.maintain()
+                job = ResultsJob.claim()
+                if job is not None:
+                    self.compute(job.poll_id)
+            except Exception:
+                # A job that failed is queued again by the poll's next view
+                if options["once"]:
+                    raise
+                failures += 1
+                logger.exception("Results worker failed")
+                close_old_connections()
+                time.sleep(min(MAX_BACKOFF, options["interval"] * 2**failures))
+                continue
+            failures = 0
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+
+    def maintain(self):
+        """
+        Keep SQLite's planner statistics fresh and its write-ahead log short,
+        and delete expired vote tokens and rate limit counters, here rather
+        than in processes of their own.
+        """
+        call_command("optimize_database", stdout=self.stdout)
+        call_command("purge_vote_tokens", stdout=self.stdout)
+        self.stdout.write(f"Deleted {ratelimit.purge()} expired rate limit counters")
+
+    def compute(self, poll_id):
+        poll = Poll.objects.filter(pk=poll_id).first()
+        if poll is None:
+            return
+        started = time.perf_counter()
+        data = {
+            "results": results_context(poll),
+            "spav": compute_spav_sweep(poll),
+            "ballots": compute_snapshot_ballots(poll),
+        }
+        ResultsSnapshot.objects.update_or_create(
+            poll=poll,
+            defaults={
+                "revision": poll.revision,
+                "data": data,
+                "computed_at": timezone.now(),
+            },
+        )
+        self.stdout.write(
+            f"Poll {poll.id} at revision {poll.revision}: "
+            f"{time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,93 @@
+import time
+
+import structlog
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from approval_polls.models import QueuedVote
+
+logger = structlog.get_logger(__name__)
+
+# Longest wait, in seconds, between tries after the database fails.
+MAX_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Record the votes queued while settings.VOTE_QUEUE is on, many per "
+        "transaction. Runs until interrupted unless --once is given. Run a "
+        "single writer per database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for votes.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.05,
+            help="Seconds to wait between checks of an empty queue.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.VOTE_QUEUE_BATCH_SIZE,
+            help="Most votes recorded per transaction.",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="First queue again the votes given up on after "
+            "settings.VOTE_QUEUE_MAX_ATTEMPTS failures.",
+        )
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            self.stdout.write(f"Queued {QueuedVote.retry_failed()} failed votes again")
+        failures = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = QueuedVote.record_batch(options["batch_size"])
+            except Exception:
+                # Such as "database is locked": the batch was rolled back and
+                # is still queued, so wait and try again.
+                if options["once"]:
+                    raise
+                failures += 1
+                logger.exception("Could not record a batch of queued votes")
+                close_old_connections()
+                time.sleep(min(MAX_BACKOFF, options["interval"] * 2**failures))
+                continue
+            failures = 0
+            if batch:
+                self.report(batch, time.perf_counter() - started)
+            elif options["once"]:
+                return
+            else:
+                time.sleep(options["interval"])
+
+    def report(self, batch, seconds):
+        latencies = sorted(
+            (queued.recorded_at - queued.queued_at).total_seconds()
+            for queued in batch
+            if queued.recorded_at is not None
+        )
+        failed = len(batch) - len(latencies)
+        message = (
+            f"{timezone.now():%H:%M:%S} recorded {len(latencies)} votes in "
+            f"{seconds:.3f}s ({len(latencies) / seconds:.0f}/s)"
+        )
+        if latencies:
+            message += (
+                f", latency median {latencies[len(latencies) // 2]:.3f}s "
+                f"max {latencies[-1]:.3f}s"
+            )
+        if failed:
+            message += f", {failed} failed"
+        self.stdout.write(message)
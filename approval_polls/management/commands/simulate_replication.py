@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from approval_polls.replication import database_path, replicate
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the default database to the replica database every --lag "
+        "seconds, recording the position copied the way LiteFS does, to try "
+        "replica reads locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lag",
+            type=float,
+            default=2.0,
+            help="Seconds between copies.",
+        )
+        parser.add_argument("--once", action="store_true", help="Copy once and exit.")
+
+    def handle(self, *args, **options):
+        if settings.REPLICA_DATABASE is None:
+            raise CommandError("Set DATABASE_REPLICA_PATH to simulate a replica.")
+        primary = database_path("default")
+        replica = database_path(settings.REPLICA_DATABASE)
+        while True:
+            copied = replicate(primary, replica)
+            self.stdout.write(f"Copied position {copied} to {replica}")
+            if options["once"]:
+                return
+            time.sleep(options["lag"])
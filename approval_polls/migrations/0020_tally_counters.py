@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, **filters):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**filters)
+            .order_by()
+            .values(*filters)
+            .annotate(n=Count("pk"))
+            .values("n")
+        ),
+        Value(0),
+    )
+
+
+def populate_counters(apps, schema_editor):
+    Ballot = apps.get_model("approval_polls", "Ballot")
+    Choice = apps.get_model("approval_polls", "Choice")
+    Poll = apps.get_model("approval_polls", "Poll")
+    Vote = apps.get_model("approval_polls", "Vote")
+
+    Choice.objects.update(vote_count=count_of(Vote, choice=OuterRef("pk")))
+    Poll.objects.update(
+        ballot_count=count_of(Ballot, poll=OuterRef("pk")),
+        vote_count=count_of(Vote, choice__poll=OuterRef("pk")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0019_alter_ballot_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="choice",
+            name="vote_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="poll",
+            name="ballot_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="poll",
+            name="vote_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
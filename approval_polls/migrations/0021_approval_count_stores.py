@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:02
+
+from collections import Counter
+from itertools import combinations, groupby
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_counts(apps, schema_editor):
+    ApprovalSizeCount = apps.get_model("approval_polls", "ApprovalSizeCount")
+    CoApprovalCount = apps.get_model("approval_polls", "CoApprovalCount")
+    Vote = apps.get_model("approval_polls", "Vote")
+
+    pairs = Counter()
+    sizes = Counter()
+    rows = (
+        Vote.objects.order_by("ballot_id")
+        .values_list("ballot_id", "choice__poll_id", "choice_id")
+        .iterator(chunk_size=10_000)
+    )
+    for (_, poll_id), ballot_rows in groupby(rows, key=lambda row: row[:2]):
+        approved = sorted({choice_id for _, _, choice_id in ballot_rows})
+        for a, b in combinations(approved, 2):
+            pairs[poll_id, a, b] += 1
+        for choice_id in approved:
+            sizes[poll_id, choice_id, len(approved)] += 1
+
+    CoApprovalCount.objects.bulk_create(
+        (
+            CoApprovalCount(poll_id=poll_id, choice_a_id=a, choice_b_id=b, ballots=n)
+            for (poll_id, a, b), n in pairs.items()
+        ),
+        batch_size=1000,
+    )
+    ApprovalSizeCount.objects.bulk_create(
+        (
+            ApprovalSizeCount(poll_id=poll_id, choice_id=c, size=size, ballots=n)
+            for (poll_id, c, size), n in sizes.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0020_tally_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ApprovalSizeCount",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("size", models.IntegerField()),
+                ("ballots", models.IntegerField(default=0)),
+                (
+                    "choice",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.choice",
+                    ),
+                ),
+                (
+                    "poll",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.poll",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("choice", "size"), name="unique_approval_size"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="CoApprovalCount",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ballots", models.IntegerField(default=0)),
+                (
+                    "choice_a",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="approval_polls.choice",
+                    ),
+                ),
+                (
+                    "choice_b",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="approval_polls.choice",
+                    ),
+                ),
+                (
+                    "poll",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.poll",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("choice_a", "choice_b"), name="unique_co_approval_pair"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0021_approval_count_stores"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="poll",
+            name="revision",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0022_poll_revision"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="poll",
+            name="revised_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
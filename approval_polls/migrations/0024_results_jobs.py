@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0023_poll_revised_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResultsJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("requests", models.IntegerField(default=1)),
+                ("requested_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "poll",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.poll",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ResultsSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("revision", models.IntegerField()),
+                ("data", models.JSONField()),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "poll",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.poll",
+                    ),
+                ),
+            ],
+        ),
+    ]
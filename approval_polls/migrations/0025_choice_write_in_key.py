@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0024_results_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="choice",
+            name="write_in_key",
+            field=models.CharField(blank=True, max_length=400, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="choice",
+            constraint=models.UniqueConstraint(
+                fields=("poll", "write_in_key"), name="unique_write_in_key"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0026_queued_votes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteToken",
+            fields=[
+                ("key", models.UUIDField(primary_key=True, serialize=False)),
+                ("used_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "poll",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.poll",
+                    ),
+                ),
+            ],
+        ),
+    ]
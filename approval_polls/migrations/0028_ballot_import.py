@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0027_vote_tokens"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BallotImport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest", models.CharField(max_length=64)),
+                ("name", models.CharField(max_length=255)),
+                ("records", models.IntegerField(default=0)),
+                ("skipped", models.IntegerField(default=0)),
+                ("ballots", models.IntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "poll",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="approval_polls.poll",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("poll", "digest"), name="unique_ballot_import"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from approval_polls.models import activity_exponent, add_activity
+
+
+def populate_stats(apps, schema_editor):
+    Poll = apps.get_model("approval_polls", "Poll")
+    TagStats = apps.get_model("approval_polls", "TagStats")
+
+    stats = {}
+    rows = (
+        Poll.objects.filter(is_private=False, polltag__isnull=False)
+        .values_list("polltag", "pub_date")
+        .iterator(chunk_size=10_000)
+    )
+    for tag_id, pub_date in rows:
+        tag_stats = stats.setdefault(tag_id, TagStats(tag_id=tag_id))
+        tag_stats.public_polls += 1
+        tag_stats.activity = add_activity(
+            tag_stats.activity if tag_stats.public_polls > 1 else None,
+            activity_exponent(pub_date),
+        )
+        if tag_stats.last_used is None or pub_date > tag_stats.last_used:
+            tag_stats.last_used = pub_date
+    TagStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0028_ballot_import"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagStats",
+            fields=[
+                (
+                    "tag",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="approval_polls.polltag",
+                    ),
+                ),
+                ("public_polls", models.IntegerField(default=0)),
+                ("activity", models.FloatField(default=0)),
+                ("last_used", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-public_polls"], name="tag_stats_public_polls"
+                    ),
+                    models.Index(fields=["-activity"], name="tag_stats_activity"),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0029_tag_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tagstats",
+            name="updated",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="tagstats",
+            index=models.Index(fields=["updated"], name="tag_stats_updated"),
+        ),
+    ]
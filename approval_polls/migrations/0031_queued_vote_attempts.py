@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0030_tag_stats_updated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="queuedvote",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="queuedvote",
+            name="last_error",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AlterField(
+            model_name="queuedvote",
+            name="queued_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
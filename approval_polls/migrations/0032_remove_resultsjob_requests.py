@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0031_queued_vote_attempts"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="resultsjob",
+            name="requests",
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+from approval_polls.models import activity_exponent, add_activity
+
+
+def log_activity(apps, schema_editor):
+    Poll = apps.get_model("approval_polls", "Poll")
+    TagStats = apps.get_model("approval_polls", "TagStats")
+
+    activity = {}
+    rows = (
+        Poll.objects.filter(is_private=False, polltag__isnull=False)
+        .values_list("polltag", "pub_date")
+        .iterator(chunk_size=10_000)
+    )
+    for tag_id, pub_date in rows:
+        activity[tag_id] = add_activity(
+            activity.get(tag_id), activity_exponent(pub_date)
+        )
+    tag_stats = list(TagStats.objects.all())
+    for stats in tag_stats:
+        stats.activity = activity.get(stats.tag_id)
+    TagStats.objects.bulk_update(tag_stats, ["activity"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("approval_polls", "0032_remove_resultsjob_requests"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tagstats",
+            name="activity",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(log_activity, migrations.RunPython.noop),
+    ]
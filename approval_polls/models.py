@@ -1,15 +1,28 @@
+import math
 import re
+from collections import Counter, defaultdict
+from datetime import UTC, datetime, timedelta
+from itertools import combinations
 
+import structlog
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.mail import EmailMultiAlternatives
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.dispatch import Signal
 from django.template import RequestContext
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.crypto import get_random_string
-from django.utils.functional import cached_property
+
+from approval_polls.caching import cached_for_revision
+from approval_polls.sqlite import write_transaction
+
+logger = structlog.get_logger(__name__)
 
 
 class Poll(models.Model):
@@ -25,17 +38,100 @@ class Poll(models.Model):
     is_private = models.BooleanField(default=False)
     is_suspended = models.BooleanField(default=False)
     show_email_opt_in = models.BooleanField(default=False)
+    # Denormalized counters, kept in step with Ballot and Vote writes by
+    # record_tally_change() and rebuilt by the rebuild_tallies command.
+    ballot_count = models.IntegerField(default=0)
+    vote_count = models.IntegerField(default=0)
+    # Bumped on every change to the poll, its ballots or its choices, so
+    # anything derived from them can be cached under (poll.id, poll.revision).
+    revision = models.IntegerField(default=0)
+    revised_at = models.DateTimeField(null=True, blank=True)
+
+    # Only ever changed with F() expressions, never written back by save().
+    COUNTER_FIELDS = ("ballot_count", "vote_count", "revision", "revised_at")
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get("update_fields") is not None:
+            return super(Poll, self).save(*args, **kwargs)
+        # Saving the counters from memory would undo concurrent ballots.
+        kwargs["update_fields"] = [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.COUNTER_FIELDS
+        ]
+        with write_transaction(using=router.db_for_write(Poll)):
+            saved = (
+                Poll.objects.filter(pk=self.pk)
+                .values_list("is_private", "pub_date")
+                .first()
+            )
+            super(Poll, self).save(*args, **kwargs)
+            if saved is not None and saved != (self.is_private, self.pub_date):
+                # Move the poll's tags' stats to its new visibility and date
+                tag_ids = list(self.polltag_set.values_list("id", flat=True))
+                is_private, pub_date = saved
+                if not is_private:
+                    TagStats.record_change(
+                        tag_ids, pub_date, -1, deleted=Poll.objects.filter(pk=self.pk)
+                    )
+                if not self.is_private:
+                    TagStats.record_change(tag_ids, self.pub_date, 1)
+        self.bump_revision()
 
     def is_closed(self):
         if self.close_date:
             return timezone.now() > self.close_date
 
     def total_ballots(self):
-        return self.ballot_set.count()
+        return self.ballot_count
 
-    @cached_property
+    @property
     def total_votes(self):
-        return Vote.objects.filter(choice__poll=self).count()
+        return self.vote_count
+
+    def record_tally_change(self, votes=None, ballots=0):
+        """
+        Apply a change in ballots and votes to the stored counters.
+
+        `votes` maps choice IDs to the number of votes added (or removed, if
+        negative). Choices sharing the same delta are updated together, so a
+        whole ballot costs at most one query per distinct delta plus one for
+        the poll.
+        """
+        votes = votes or {}
+        by_delta = defaultdict(list)
+        for choice_id, delta in votes.items():
+            if delta:
+                by_delta[delta].append(choice_id)
+        for delta, choice_ids in by_delta.items():
+            Choice.objects.filter(id__in=choice_ids).update(
+                vote_count=F("vote_count") + delta
+            )
+
+        total = sum(votes.values())
+        if by_delta or ballots:
+            now = timezone.now()
+            Poll.objects.filter(pk=self.pk).update(
+                vote_count=F("vote_count") + total,
+                ballot_count=F("ballot_count") + ballots,
+                revision=F("revision") + 1,
+                revised_at=now,
+            )
+            self.vote_count += total
+            self.ballot_count += ballots
+            self.revision += 1
+            self.revised_at = now
+
+    def bump_revision(self):
+        now = timezone.now()
+        Poll.objects.filter(pk=self.pk).update(
+            revision=F("revision") + 1, revised_at=now
+        )
+        self.revision += 1
+        self.revised_at = now
+
+    def last_modified(self):
+        return self.revised_at or self.pub_date
 
     def voters(self):
         return list(self.ballot_set.values_list("user", flat=True).distinct())
@@ -52,6 +148,7 @@ class Poll(models.Model):
             for n in ids
         ]
         Choice.objects.bulk_create(choices)
+        self.bump_revision()
 
     def update_choices(self, ids, text_data, link_data):
         choices = Choice.objects.filter(id__in=ids)
@@ -60,9 +157,85 @@ class Poll(models.Model):
             if not (choice.choice_link is None and len(link_data[choice.id]) == 0):
                 choice.choice_link = link_data[choice.id]
         Choice.objects.bulk_update(choices, ["choice_text", "choice_link"])
+        self.bump_revision()
 
     def delete_choices(self, ids):
+        # choice_deleted() updates the counters
         Choice.objects.filter(id__in=ids, poll=self).delete()
+        self.refresh_from_db(fields=["vote_count", "revision", "revised_at"])
+
+    def cast_ballot(
+        self, approvals, write_ins=(), user=None, ballot=None, permit_email=False
+    ):
+        """
+        Record a vote approving the choice IDs `approvals` and the `(text,
+        link)` write-ins, and return the ballot.
+
+        The vote updates `ballot` if given, else the user's ballot, else a
+        new anonymous one. Approvals of choices deleted since the form was
+        submitted are dropped.
+        """
+        if ballot is None:
+            if user is None:
+                ballot = self.ballot_set.create(permit_email=permit_email)
+            else:
+                ballot, _ = self.ballot_set.get_or_create(
+                    user=user, defaults={"permit_email": permit_email}
+                )
+        choice_ids = set(self.choice_set.values_list("id", flat=True))
+        write_in_ids = self.resolve_write_ins(write_ins)
+        choice_ids.update(write_in_ids)
+        ballot.set_approvals(
+            [choice_id for choice_id in approvals if choice_id in choice_ids]
+            + write_in_ids,
+            choice_ids,
+        )
+        return ballot
+
+    def resolve_write_ins(self, write_ins):
+        """
+        Return the choice IDs for a list of `(text, link)` write-ins, matching
+        existing choices by write_in_key() and creating the rest together.
+        """
+        keys = {}
+        for text, link in write_ins:
+            keys.setdefault(write_in_key(text), (" ".join(text.split()), link))
+        keys.pop("", None)
+        choice_ids = self.write_in_lookup()
+        missing = [key for key in keys if key not in choice_ids]
+        if missing:
+            # Ignoring conflicts makes this an upsert: a choice another voter
+            # has just written in is picked up by the query below.
+            Choice.objects.bulk_create(
+                [
+                    Choice(
+                        poll=self,
+                        choice_text=keys[key][0],
+                        choice_link=keys[key][1],
+                        write_in_key=key,
+                    )
+                    for key in missing
+                ],
+                ignore_conflicts=True,
+            )
+            choice_ids = {
+                **choice_ids,
+                **dict(
+                    self.choice_set.filter(write_in_key__in=missing).values_list(
+                        "write_in_key", "id"
+                    )
+                ),
+            }
+        return [choice_ids[key] for key in keys]
+
+    def write_in_lookup(self):
+        """Map write_in_key() of every choice's text to its ID, oldest first."""
+
+        def compute():
+            choices = self.choice_set.order_by("-id").values_list("id", "choice_text")
+            return {write_in_key(text): choice_id for choice_id, text in choices}
+
+        return cached_for_revision("write_ins", self, compute)
 
     def send_vote_invitations(self, emails):
         # Get unique valid email addresses
@@ -81,6 +254,7 @@ class Poll(models.Model):
             for email in email_list
         ]
         created_invitations = VoteInvitation.objects.bulk_create(invitations)
+        self.bump_revision()
 
         # Send emails after creation
         for invitation in created_invitations:
@@ -112,12 +286,32 @@ class Poll(models.Model):
             existing_tags.update({tag.tag_text: tag for tag in new_tag_objects})
 
         # Add all tags to the poll
+        linked = set(
+            self.polltag_set.filter(tag_text__in=cleaned_tags).values_list(
+                "id", flat=True
+            )
+        )
         self.polltag_set.add(*[existing_tags[tag] for tag in cleaned_tags])
+        if not self.is_private:
+            added = [existing_tags[tag].id for tag in cleaned_tags]
+            TagStats.record_change(
+                [tag_id for tag_id in added if tag_id not in linked], self.pub_date, 1
+            )
+        self.bump_revision()
 
     def delete_tags(self, tags):
-        for tagtext in tags:
-            tag = PollTag.objects.filter(tag_text=tagtext.strip()).first()
-            self.polltag_set.remove(tag)
+        removed = list(
+            self.polltag_set.filter(
+                tag_text__in=[tagtext.strip() for tagtext in tags]
+            ).values_list("id", flat=True)
+        )
+        self.polltag_set.remove(*removed)
+        if not self.is_private:
+            TagStats.record_change(removed, self.pub_date, -1)
+        self.bump_revision()
+
+    def clear_tags(self):
+        self.delete_tags(self.polltag_set.values_list("tag_text", flat=True))
 
     def all_tags(self):
         from django.db.models import CharField
@@ -138,17 +332,33 @@ class Poll(models.Model):
         return self.question
 
 
+def write_in_key(text):
+    """Write-ins match choices ignoring case and runs of whitespace."""
+    return " ".join(text.split()).casefold()
+
+
 class Choice(models.Model):
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
     choice_link = models.CharField(max_length=2048, null=True, blank=True)
+    vote_count = models.IntegerField(default=0)
+    # Set on choices added as write-ins, so that concurrent voters writing
+    # in the same choice can't create it twice.
+    write_in_key = models.CharField(max_length=400, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["poll", "write_in_key"], name="unique_write_in_key"
+            )
+        ]
 
     def votes(self):
-        return self.vote_set.count()
+        return self.vote_count
 
     def percentage(self):
         total = self.poll.total_ballots()
-        return self.votes() / total if total > 0 else 0
+        return self.vote_count / total if total > 0 else 0
 
     def __unicode__(self):
         return self.choice_text
@@ -164,6 +374,52 @@ class Ballot(models.Model):
     permit_email = models.BooleanField(default=False)
     email = models.EmailField(null=True, blank=True)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(Ballot, self).save(*args, **kwargs)
+        if adding and self.poll_id:
+            self.poll.record_tally_change(ballots=1)
+
+    def set_approvals(self, choice_ids, poll_choice_ids=None):
+        """
+        Make the ballot approve exactly `choice_ids`, with one bulk insert
+        and one delete however many choices change, and update the stored
+        tallies once for the whole change.
+
+        Pass `poll_choice_ids` if the poll's choice IDs are already loaded;
+        every approved choice must be one of them.
+        """
+        after = set(choice_ids)
+        if poll_choice_ids is None:
+            poll_choice_ids = self.poll.choice_set.values_list("id", flat=True)
+        if not after <= set(poll_choice_ids):
+            raise ValueError("The ballot and choice must belong to the same poll.")
+        before = set(self.vote_set.values_list("choice_id", flat=True))
+        added, removed = after - before, before - after
+
+        # Queryset delete and bulk_create skip the Vote hooks, so the
+        # tallies are recorded below instead.
+        if removed:
+            self.vote_set.filter(choice_id__in=removed).delete()
+        if added:
+            Vote.objects.bulk_create(
+                [Vote(ballot=self, choice_id=choice_id) for choice_id in sorted(added)]
+            )
+        changes = {choice_id: 1 for choice_id in added}
+        changes.update({choice_id: -1 for choice_id in removed})
+        self.poll.record_tally_change(changes)
+        self.record_approval_change(before, after)
+
+    def record_approval_change(self, before, after):
+        """
+        Update the poll's co-approval and approval-size counts for this
+        ballot's approved choice IDs changing from `before` to `after`.
+        """
+        if before == after or not self.poll_id:
+            return
+        CoApprovalCount.record_change(self.poll_id, before, after)
+        ApprovalSizeCount.record_change(self.poll_id, before, after)
+
     def __unicode__(self):
         return str(self.id) + " at " + str(self.timestamp)
 
@@ -175,12 +431,515 @@ class Vote(models.Model):
     def save(self, *args, **kwargs):
         if self.ballot.poll != self.choice.poll:
             raise ValueError("The ballot and choice must belong to the same poll.")
+        adding = self._state.adding
         super(Vote, self).save(*args, **kwargs)
+        if adding:
+            self.choice.poll.record_tally_change({self.choice_id: 1})
+            others = self.other_choice_ids()
+            self.ballot.record_approval_change(others, others | {self.choice_id})
+
+    def delete(self, *args, **kwargs):
+        others = self.other_choice_ids()
+        result = super(Vote, self).delete(*args, **kwargs)
+        self.choice.poll.record_tally_change({self.choice_id: -1})
+        self.ballot.record_approval_change(others | {self.choice_id}, others)
+        return result
+
+    def other_choice_ids(self):
+        """The choice IDs of the ballot's other votes."""
+        return set(
+            self.ballot.vote_set.exclude(pk=self.pk).values_list("choice_id", flat=True)
+        )
 
     def __unicode__(self):
         return str(self.ballot) + " for " + str(self.choice)
 
 
+def deletes_poll(origin, poll):
+    """
+    Whether the delete started from `origin` takes `poll` with it, so that
+    there is no point keeping its counters in step.
+    """
+    if isinstance(origin, models.QuerySet):
+        if origin.model is Poll:
+            return origin.filter(pk=poll.pk).exists()
+        if origin.model is User:
+            return origin.filter(pk=poll.user_id).exists()
+        return False
+    if isinstance(origin, Poll):
+        return origin.pk == poll.pk
+    if isinstance(origin, User):
+        return origin.pk == poll.user_id
+    return False
+
+
+def ballot_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Take a ballot out of its poll's counters before it is deleted, however
+    the delete came about: Ballot.delete(), a queryset delete, or a cascade
+    from its user.
+    """
+    if instance.poll_id is None or deletes_poll(origin, instance.poll):
+        return
+    choice_ids = list(instance.vote_set.values_list("choice_id", flat=True))
+    instance.poll.record_tally_change(
+        {choice_id: -n for choice_id, n in Counter(choice_ids).items()},
+        ballots=-1,
+    )
+    instance.record_approval_change(set(choice_ids), set())
+
+
+pre_delete.connect(
+    ballot_deleted, sender=Ballot, dispatch_uid="approval_polls.ballot_deleted"
+)
+
+
+def choice_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Take a choice's votes out of its poll's vote count before it is deleted,
+    and move the ballots that approved it down an approval-size bucket for
+    their other choices. The choice's own counts are deleted with it.
+    """
+    poll = instance.poll
+    if deletes_poll(origin, poll):
+        return
+    deleted = {instance.id}
+    if isinstance(origin, models.QuerySet) and origin.model is Choice:
+        deleted = set(origin.values_list("id", flat=True))
+    # Choices deleted together are taken out in ID order, each from ballots
+    # without the choices before it.
+    taken_out = {choice_id for choice_id in deleted if choice_id < instance.id}
+    approvals = defaultdict(set)
+    for ballot_id, choice_id in Vote.objects.filter(
+        ballot__vote__choice=instance
+    ).values_list("ballot_id", "choice_id"):
+        approvals[ballot_id].add(choice_id)
+    ApprovalSizeCount.record_choice_deletion(
+        poll.id, [approved - taken_out for approved in approvals.values()], deleted
+    )
+    if approvals:
+        poll.record_tally_change({instance.id: -len(approvals)})
+    else:
+        poll.bump_revision()
+
+
+pre_delete.connect(
+    choice_deleted, sender=Choice, dispatch_uid="approval_polls.choice_deleted"
+)
+
+
+def polls_deleted_with(origin, poll):
+    """The polls that the delete started from `origin` takes with `poll`."""
+    if isinstance(origin, models.QuerySet):
+        if origin.model is Poll:
+            return origin
+        if origin.model is User:
+            return Poll.objects.filter(user__in=origin)
+    if isinstance(origin, User):
+        return Poll.objects.filter(user=origin)
+    return Poll.objects.filter(pk=poll.pk)
+
+
+def poll_deleted(sender, instance, origin=None, **kwargs):
+    """Count a public poll out of its tags' stats, however it is deleted."""
+    if not instance.is_private:
+        TagStats.record_change(
+            list(instance.polltag_set.values_list("id", flat=True)),
+            instance.pub_date,
+            -1,
+            deleted=polls_deleted_with(origin, instance),
+        )
+
+
+pre_delete.connect(
+    poll_deleted, sender=Poll, dispatch_uid="approval_polls.poll_deleted"
+)
+
+
+def add_to_ballot_counts(model, key_fields, rows):
+    """
+    Add to the `ballots` column of `model` for each `(poll_id, *key, delta)`
+    row, creating rows that don't exist yet, in a single upsert statement.
+    `key_fields` must match a unique constraint on the model.
+    """
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [
+        quote(model._meta.get_field(name).column)
+        for name in ["poll", *key_fields, "ballots"]
+    ]
+    keys = ", ".join(columns[1:-1])
+    placeholders = ", ".join(["%s"] * len(columns))
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({keys}) DO UPDATE "
+        f"SET {columns[-1]} = {table}.{columns[-1]} + excluded.{columns[-1]}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+class CoApprovalCount(models.Model):
+    """
+    Number of a poll's ballots approving both `choice_a` and `choice_b`,
+    stored once per pair with the lower choice ID as `choice_a`.
+    """
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    choice_a = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name="+")
+    choice_b = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name="+")
+    ballots = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["choice_a", "choice_b"], name="unique_co_approval_pair"
+            )
+        ]
+
+    @classmethod
+    def record_change(cls, poll_id, before, after):
+        before_pairs = set(combinations(sorted(before), 2))
+        after_pairs = set(combinations(sorted(after), 2))
+        rows = [(poll_id, a, b, 1) for a, b in after_pairs - before_pairs]
+        rows += [(poll_id, a, b, -1) for a, b in before_pairs - after_pairs]
+        add_to_ballot_counts(cls, ["choice_a", "choice_b"], rows)
+
+    @classmethod
+    def record_new_ballots(cls, poll_id, approvals):
+        """record_change() for many new ballots' approved choice IDs at once."""
+        pairs = Counter(
+            pair for approved in approvals for pair in combinations(sorted(approved), 2)
+        )
+        rows = [(poll_id, a, b, n) for (a, b), n in pairs.items()]
+        add_to_ballot_counts(cls, ["choice_a", "choice_b"], rows)
+
+
+class ApprovalSizeCount(models.Model):
+    """
+    Number of a poll's ballots approving `choice` that approved exactly
+    `size` choices in total.
+    """
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    size = models.IntegerField()
+    ballots = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["choice", "size"], name="unique_approval_size"
+            )
+        ]
+
+    @classmethod
+    def record_change(cls, poll_id, before, after):
+        before_size, after_size = len(before), len(after)
+        if before_size == after_size:
+            # Choices approved both times stay in the same size bucket.
+            before, after = before - after, after - before
+        rows = [(poll_id, c, before_size, -1) for c in before]
+        rows += [(poll_id, c, after_size, 1) for c in after]
+        add_to_ballot_counts(cls, ["choice", "size"], rows)
+
+    @classmethod
+    def record_new_ballots(cls, poll_id, approvals):
+        """record_change() for many new ballots' approved choice IDs at once."""
+        sizes = Counter(
+            (choice_id, len(approved))
+            for approved in approvals
+            for choice_id in approved
+        )
+        rows = [(poll_id, c, size, n) for (c, size), n in sizes.items()]
+        add_to_ballot_counts(cls, ["choice", "size"], rows)
+
+    @classmethod
+    def record_choice_deletion(cls, poll_id, approvals, deleted):
+        """
+        Move the ballots approving the choice IDs `approvals` down a size
+        bucket, for a choice they all approve being deleted. Choice IDs in
+        `deleted`, which are being deleted too, are left alone.
+        """
+        moves = Counter()
+        for approved in approvals:
+            for choice_id in approved - deleted:
+                moves[choice_id, len(approved)] -= 1
+                moves[choice_id, len(approved) - 1] += 1
+        rows = [(poll_id, c, size, n) for (c, size), n in moves.items() if n]
+        add_to_ballot_counts(cls, ["choice", "size"], rows)
+
+
+class ResultsJob(models.Model):
+    """
+    A pending recomputation of a large poll's ResultsSnapshot, run by the
+    run_results_worker command.
+
+    There is at most one job per poll. The worker takes first the job of
+    the poll whose snapshot is the most revisions behind, so the polls
+    getting the most votes are refreshed first.
+    """
+
+    poll = models.OneToOneField(Poll, on_delete=models.CASCADE)
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def request(cls, poll):
+        """
+        Queue `poll` unless it is queued already. Checking first keeps the
+        results page of a poll waiting for the worker from writing, and so
+        from waiting on SQLite's write lock, on every view.
+        """
+        if cls.objects.filter(poll=poll).exists():
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(poll=poll)
+        except IntegrityError:
+            # Another request queued the poll first.
+            pass
+
+    @classmethod
+    def claim(cls):
+        """
+        Remove the job of the poll furthest behind from the queue and return
+        it, or None if the queue is empty. Deleting is what claims the job,
+        so two workers never take the same one.
+        """
+        behind = F("poll__revision") - Coalesce(
+            "poll__resultssnapshot__revision", Value(0)
+        )
+        while True:
+            job = cls.objects.order_by(behind.desc(), "requested_at").first()
+            if job is None:
+                return None
+            deleted, _ = cls.objects.filter(pk=job.pk).delete()
+            if deleted:
+                return job
+
+
+class ResultsSnapshot(models.Model):
+    """
+    The results page analytics, SPAV sweep and unique ballots of a poll, as
+    computed at `revision` by the background worker.
+    """
+
+    poll = models.OneToOneField(Poll, on_delete=models.CASCADE)
+    revision = models.IntegerField()
+    data = models.JSONField()
+    computed_at = models.DateTimeField()
+
+
+class QueuedVote(models.Model):
+    """
+    A validated vote waiting to be recorded by the run_vote_writer command,
+    when settings.VOTE_QUEUE is on. See Poll.cast_ballot for the fields.
+
+    A vote that fails to record stays queued, to be tried again, with
+    `attempts` counting the failures and `last_error` the latest. After
+    settings.VOTE_QUEUE_MAX_ATTEMPTS it is given up on and left in the
+    table until run_vote_writer --retry-failed queues it again.
+    """
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    ballot = models.ForeignKey(Ballot, on_delete=models.CASCADE, null=True, blank=True)
+    permit_email = models.BooleanField(default=False)
+    approvals = models.JSONField(default=list)
+    write_ins = models.JSONField(default=list)
+    # Not auto_now_add, which would reset it when a failed vote is requeued
+    queued_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    @classmethod
+    def record_batch(cls, batch_size):
+        """
+        Record up to `batch_size` of the oldest queued votes in a single
+        transaction and return them, with `recorded_at` set on each, or
+        None on those that failed.
+
+        A vote that fails doesn't undo the rest of the batch, and is put
+        back in the queue with its attempt counted. The transaction starts
+        by deleting the batch, which both claims it from any other writer
+        and takes SQLite's write lock before anything is read. If the
+        transaction fails, the whole batch stays queued.
+        """
+        while True:
+            batch = list(
+                cls.objects.filter(attempts__lt=settings.VOTE_QUEUE_MAX_ATTEMPTS)
+                .select_related("poll", "user", "ballot")
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                return []
+            with write_transaction():
+                deleted, _ = cls.objects.filter(
+                    pk__in=[queued.pk for queued in batch]
+                ).delete()
+                if deleted == len(batch):
+                    failed = [queued for queued in batch if not queued.record()]
+                    # Back in the queue under the same IDs, so still in order
+                    cls.objects.bulk_create(failed)
+                    recorded_at = timezone.now()
+                    for queued in batch:
+                        queued.recorded_at = None if queued in failed else recorded_at
+                    return batch
+                # Another writer took some of the batch
+                transaction.set_rollback(True)
+
+    def record(self):
+        """
+        Cast the queued vote, returning whether it was recorded. A failure is
+        counted in `attempts` and `last_error` instead of being raised.
+        """
+        try:
+            with transaction.atomic():
+                self.poll.cast_ballot(
+                    self.approvals,
+                    [tuple(write_in) for write_in in self.write_ins],
+                    user=self.user,
+                    ballot=self.ballot,
+                    permit_email=self.permit_email,
+                )
+        except Exception as error:
+            self.attempts += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.attempts >= settings.VOTE_QUEUE_MAX_ATTEMPTS:
+                logger.exception(
+                    f"Giving up on queued vote {self.pk} after {self.attempts} "
+                    "attempts"
+                )
+            else:
+                logger.exception(
+                    f"Could not record queued vote {self.pk} "
+                    f"(attempt {self.attempts})"
+                )
+            return False
+        return True
+
+    @classmethod
+    def retry_failed(cls):
+        """Queue the votes given up on again, returning how many there were."""
+        return cls.objects.filter(
+            attempts__gte=settings.VOTE_QUEUE_MAX_ATTEMPTS
+        ).update(attempts=0)
+
+
+class VoteToken(models.Model):
+    """
+    A used idempotency token of an anonymous poll's vote form. A vote
+    submitted again with the same token, by a double click or a retry, is
+    recognised instead of creating a second ballot. Tokens older than
+    settings.VOTE_TOKEN_TTL are deleted by the purge_vote_tokens command.
+    """
+
+    key = models.UUIDField(primary_key=True)
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @classmethod
+    def use(cls, key, poll):
+        """
+        Record `key` as used for a vote in `poll`. Returns False if it had
+        already been used there.
+        """
+        try:
+            with transaction.atomic():
+                cls.objects.create(key=key, poll=poll)
+        except IntegrityError:
+            return not cls.objects.filter(key=key, poll=poll).exists()
+        return True
+
+    @classmethod
+    def purge(cls, batch_size=10000):
+        """Delete expired tokens in batches, returning how many were deleted."""
+        cutoff = timezone.now() - timedelta(seconds=settings.VOTE_TOKEN_TTL)
+        deleted = 0
+        while True:
+            keys = list(
+                cls.objects.filter(used_at__lt=cutoff).values_list("key", flat=True)[
+                    :batch_size
+                ]
+            )
+            if not keys:
+                return deleted
+            deleted += cls.objects.filter(key__in=keys).delete()[0]
+
+
+class BallotImport(models.Model):
+    """
+    An import of a file of cast vote records into a poll (see
+    approval_polls/cvr.py), identified by the file's SHA-256 digest so that
+    importing the same file again resumes after the last batch saved.
+    """
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    digest = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)
+    # Records read from the file so far, and how many of them were invalid
+    records = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    ballots = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["poll", "digest"], name="unique_ballot_import"
+            )
+        ]
+
+    def add_ballots(self, approvals, records, skipped=0):
+        """
+        Insert a ballot approving each set of choice IDs in `approvals` and
+        update the poll's stored tallies once for all of them, in the same
+        transaction as the import's progress: `records` read so far,
+        `skipped` more of which were invalid.
+
+        Returns False without saving anything if another process importing
+        the same file has saved progress since this one last did.
+        """
+        votes = Counter(choice_id for approved in approvals for choice_id in approved)
+        with write_transaction():
+            claimed = BallotImport.objects.filter(
+                pk=self.pk, records=self.records
+            ).update(
+                records=records,
+                skipped=F("skipped") + skipped,
+                ballots=F("ballots") + len(approvals),
+            )
+            if not claimed:
+                return False
+            # Bulk inserts skip the Ballot and Vote hooks, so the tallies are
+            # recorded below instead.
+            ballots = Ballot.objects.bulk_create(
+                [Ballot(poll_id=self.poll_id) for _ in approvals]
+            )
+            Vote.objects.bulk_create(
+                [
+                    Vote(ballot=ballot, choice_id=choice_id)
+                    for ballot, approved in zip(ballots, approvals)
+                    for choice_id in sorted(approved)
+                ]
+            )
+            self.poll.record_tally_change(votes, ballots=len(approvals))
+            CoApprovalCount.record_new_ballots(self.poll_id, approvals)
+            ApprovalSizeCount.record_new_ballots(self.poll_id, approvals)
+        self.records = records
+        self.skipped += skipped
+        self.ballots += len(approvals)
+        return True
+
+    def finish(self):
+        self.finished_at = timezone.now()
+        self.save(update_fields=["finished_at"])
+
+
 class VoteInvitation(models.Model):
     email = models.EmailField("voter email")
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
@@ -250,21 +1009,168 @@ class PollTag(models.Model):
 
     @classmethod
     def topTagsPercent(cls, count):
-        from django.db.models import Count, F, FloatField, Sum
-        from django.db.models.functions import Cast
+        """
+        The `count` tags on the most public polls, each with its share, as a
+        percentage, of the taggings among them.
+        """
+        top = list(
+            TagStats.objects.filter(public_polls__gt=0)
+            .order_by("-public_polls")
+            .values_list("tag__tag_text", "public_polls")[:count]
+        )
+        total = sum(polls for _, polls in top)
+        return {tag_text: polls * 100.0 / total for tag_text, polls in top}
+
+    @classmethod
+    def popular(cls, count):
+        """The `count` tags most used on public polls published lately."""
+        return list(
+            TagStats.objects.filter(public_polls__gt=0)
+            .select_related("tag")
+            .order_by("-activity")[:count]
+        )
+
+
+# Tag activity is weighed relative to this date.
+ACTIVITY_EPOCH = datetime(2020, 1, 1, tzinfo=UTC)
+
+
+def activity_exponent(pub_date):
+    """
+    The base 2 log of the weight of a poll published at `pub_date` in its
+    tags' activity. Weights double every TAG_ACTIVITY_HALF_LIFE days, so that
+    comparing their sums at any time is comparing the polls' weights halved
+    each half-life since. They grow without bound, so only their logs are
+    stored and summed.
+    """
+    return (pub_date - ACTIVITY_EPOCH) / timedelta(days=settings.TAG_ACTIVITY_HALF_LIFE)
 
-        # Calculate total polls in a subquery
-        total_polls = cls.objects.aggregate(total=Sum("polls"))["total"] or 0
 
-        if total_polls == 0:
-            return {}
+def add_activity(activity, exponent):
+    """
+    log2(2 ** activity + 2 ** exponent) without computing either power, None
+    being the activity of no polls.
+    """
+    if activity is None:
+        return exponent
+    high, low = max(activity, exponent), min(activity, exponent)
+    return high + math.log2(1 + 2 ** (low - high))
 
-        # Get top tags with percentages calculated at the database level
-        return dict(
-            cls.objects.annotate(
-                poll_count=Count("polls"),
-                percentage=Cast(F("poll_count") * 100.0 / total_polls, FloatField()),
+
+# Sent with the tag_ids once the transaction of a TagStats.record_change()
+# commits.
+tag_stats_changed = Signal()
+
+
+class TagStats(models.Model):
+    """
+    Statistics of a tag's public polls, kept in step with tagging, visibility
+    changes and deletes by record_change() and rebuilt by the
+    rebuild_tag_stats command.
+    """
+
+    tag = models.OneToOneField(
+        PollTag, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    public_polls = models.IntegerField(default=0)
+    # The log of the sum of the public polls' weights (see
+    # activity_exponent()), or None without any
+    activity = models.FloatField(null=True, blank=True)
+    # When the newest public poll was published
+    last_used = models.DateTimeField(null=True, blank=True)
+    # When the row was last written, for the tag index to catch up from
+    updated = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-public_polls"], name="tag_stats_public_polls"),
+            models.Index(fields=["-activity"], name="tag_stats_activity"),
+            models.Index(fields=["updated"], name="tag_stats_updated"),
+        ]
+
+    @classmethod
+    def record_change(cls, tag_ids, pub_date, delta, deleted=None):
+        """
+        Count a public poll published at `pub_date` into (`delta` 1) or out
+        of (-1) the stats of the tags `tag_ids`, once the change to its tags
+        or visibility is saved, in a single upsert statement. A poll being
+        deleted is counted out before it is, with `deleted` the polls going
+        with it, which are left out when the tags' activity and newest polls
+        are recounted.
+        """
+        if not tag_ids:
+            return
+        connection = connections[router.db_for_write(cls)]
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        tag, polls, activity, last_used, updated = (
+            quote(cls._meta.get_field(name).column)
+            for name in ["tag", "public_polls", "activity", "last_used", "updated"]
+        )
+        old, new = f"{table}.{activity}", f"excluded.{activity}"
+        sql = (
+            f"INSERT INTO {table} ({tag}, {polls}, {activity}, {last_used}, "
+            f"{updated}) VALUES (%s, %s, %s, %s, %s) ON CONFLICT ({tag}) "
+            f"DO UPDATE SET {updated} = excluded.{updated}, "
+            f"{polls} = {table}.{polls} + excluded.{polls}, "
+            f"{activity} = CASE WHEN {new} IS NULL OR {old} IS NULL THEN {new} "
+            # add_activity()
+            f"ELSE MAX({old}, {new}) + LOG(2, 1 + POWER(2, -ABS({old} - {new}))) "
+            f"END, "
+            f"{last_used} = CASE WHEN {table}.{last_used} IS NULL "
+            f"OR excluded.{last_used} > {table}.{last_used} "
+            f"THEN excluded.{last_used} ELSE {table}.{last_used} END"
+        )
+        # A poll counted out is recounted below rather than subtracted, which
+        # would leave nothing but rounding error of a sum it dominated.
+        exponent = activity_exponent(pub_date) if delta > 0 else None
+        added = (
+            connection.ops.adapt_datetimefield_value(pub_date) if delta > 0 else None
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                sql, [(tag_id, delta, exponent, added, now) for tag_id in tag_ids]
+            )
+        if delta < 0:
+            cls.recount(tag_ids, deleted)
+        transaction.on_commit(
+            lambda: tag_stats_changed.send(sender=cls, tag_ids=tag_ids),
+            using=connection.alias,
+        )
+
+    @classmethod
+    def recount(cls, tag_ids, deleted=None):
+        """
+        Recount the activity and newest poll of the tags `tag_ids` from their
+        public polls, but for the polls `deleted`.
+        """
+        public = Poll.objects.filter(polltag__in=tag_ids)
+        if deleted is not None:
+            public = public.exclude(pk__in=deleted.values("pk"))
+        counted = cls.counted(public)
+        for tag_id in tag_ids:
+            tag_stats = counted.get(tag_id, cls())
+            cls.objects.filter(tag_id=tag_id).update(
+                activity=tag_stats.activity, last_used=tag_stats.last_used
             )
-            .order_by("-poll_count")[:count]
-            .values_list("tag_text", "percentage")
+
+    @classmethod
+    def counted(cls, polls=None):
+        """
+        TagStats for every tag on a public poll, or on a public poll of
+        `polls`, counted from the polls.
+        """
+        stats = {}
+        public = (Poll.objects if polls is None else polls).filter(
+            is_private=False, polltag__isnull=False
         )
+        for tag_id, pub_date in public.values_list("polltag", "pub_date").iterator():
+            tag_stats = stats.setdefault(tag_id, cls(tag_id=tag_id))
+            tag_stats.public_polls += 1
+            tag_stats.activity = add_activity(
+                tag_stats.activity, activity_exponent(pub_date)
+            )
+            if tag_stats.last_used is None or pub_date > tag_stats.last_used:
+                tag_stats.last_used = pub_date
+        return stats
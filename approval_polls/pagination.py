@@ -0,0 +1,181 @@
+"""
+Keyset pagination of poll listings and voter lists, newest first.
+
+A page is fetched with ``WHERE (pub_date, id) < (last shown)`` rather than an
+OFFSET, so it costs the same however deep it is. Pages are linked by opaque,
+signed cursors holding the row to continue from, the page number and the
+listing's total for the "Page X of Y" label. That total is counted once, on
+the first page, up to COUNT_LIMIT rows; a page reached from a cursor runs
+just the one query for its rows.
+"""
+
+import datetime
+import math
+
+from django.core import signing
+from django.db.models import Q
+
+# Listings with more rows than this are labelled "Page X of Y+".
+COUNT_LIMIT = 1000
+
+SALT = "approval_polls.pagination"
+
+
+class CursorPaginator:
+    """
+    Paginate `queryset`, which must not be sliced, in pages of `per_page`
+    rows ordered by descending (`date_field`, id). With `max_items`, only
+    that many of the newest rows are listed. A `count` of the rows known
+    already, if only roughly, saves counting them for the first page.
+    """
+
+    def __init__(
+        self, queryset, per_page, max_items=None, date_field="pub_date", count=None
+    ):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.max_items = max_items
+        self.known_count = count
+        self.date_field = date_field
+        self.ordering = (f"-{date_field}", "-id")
+        self.count = 0
+        self.count_is_lower_bound = False
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def page(self, cursor=None):
+        """The page `cursor` links to, or the first page if it is missing or invalid."""
+        try:
+            state = signing.loads(cursor, salt=SALT) if cursor else None
+            if state is not None:
+                return self.page_from(state)
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            pass
+        return self.first_page()
+
+    def first_page(self):
+        if self.known_count is not None:
+            self.count = self.known_count
+        else:
+            limit = COUNT_LIMIT if self.max_items is None else self.max_items
+            self.count = self.queryset[: limit + 1].count()
+            if self.count > limit:
+                self.count = limit
+                self.count_is_lower_bound = self.max_items is None
+        return self.page_after(
+            self.queryset.order_by(*self.ordering), 1, has_previous=False
+        )
+
+    def keyset(self, state, lookup):
+        """Rows before (`lookup` "lt") or after ("gt") the cursor's row."""
+        date = datetime.datetime.fromisoformat(state["date"])
+        return Q(**{f"{self.date_field}__{lookup}": date}) | Q(
+            **{self.date_field: date, f"id__{lookup}": state["id"]}
+        )
+
+    def page_from(self, state):
+        self.count = state["count"]
+        self.count_is_lower_bound = state["lower_bound"]
+        if state["before"] and state["number"] <= 2:
+            return self.first_page()
+        if state["before"]:
+            # Going back: the rows just after the first one shown, nearest first
+            rows = list(
+                self.queryset.filter(self.keyset(state, "gt")).order_by(
+                    self.date_field, "id"
+                )[: self.per_page + 1]
+            )
+            if len(rows) <= self.per_page:
+                # Rows were deleted since the cursor was made
+                return self.first_page()
+            return self.make_page(
+                rows[: self.per_page][::-1],
+                state["number"] - 1,
+                has_previous=True,
+                has_next=True,
+            )
+
+        page = self.page_after(
+            self.queryset.filter(self.keyset(state, "lt")).order_by(*self.ordering),
+            state["number"] + 1,
+            has_previous=True,
+        )
+        # Rows were deleted since the cursor was made
+        return page if page.object_list else self.first_page()
+
+    def page_after(self, ordered, number, has_previous):
+        """Page `number`, the first `per_page` rows of `ordered`."""
+        size = self.per_page
+        if self.max_items is not None:
+            size = min(size, self.max_items - (number - 1) * self.per_page)
+        rows = list(ordered[: size + 1])
+        has_next = len(rows) > size
+        if self.max_items is not None and number * self.per_page >= self.max_items:
+            has_next = False
+        return self.make_page(rows[:size], number, has_previous, has_next)
+
+    def make_page(self, rows, number, has_previous, has_next):
+        # The total counted on the first page may since have gone stale
+        if has_next:
+            self.count = max(self.count, number * self.per_page + 1)
+        else:
+            self.count = (number - 1) * self.per_page + len(rows)
+            self.count_is_lower_bound = False
+        return CursorPage(rows, number, self, has_previous, has_next)
+
+    def cursor(self, row, number, before):
+        return signing.dumps(
+            {
+                "date": getattr(row, self.date_field).isoformat(),
+                "id": row.id,
+                "number": number,
+                "before": before,
+                "count": self.count,
+                "lower_bound": self.count_is_lower_bound,
+            },
+            salt=SALT,
+            compress=True,
+        )
+
+
+class CursorPage:
+    """
+    A page of rows, with the interface of Django's Page that the listing
+    templates use, plus the cursors of the pages around it.
+    """
+
+    def __init__(self, object_list, number, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+        # The rows the cursors point from, as `object_list` may be replaced
+        self.first = object_list[0] if object_list else None
+        self.last = object_list[-1] if object_list else None
+
+    def __repr__(self):
+        return f"<Page {self.number} of {self.paginator.num_pages}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        return self.paginator.cursor(self.last, self.number, before=False)
+
+    def previous_cursor(self):
+        return self.paginator.cursor(self.first, self.number, before=True)
@@ -0,0 +1,175 @@
+"""
+Multi-winner proportional methods over a BallotMatrix.
+
+Every method takes a BallotMatrix and a number of seats and returns the
+column of the choice winning each seat, shape ``(seats,)``. As in the SPAV
+allocation on the results page, a choice may win more than one seat, so
+choices can stand for parties as well as candidates. Ties go to the earliest
+column.
+
+The methods work on the matrix's unique approval patterns and their weights,
+so each round is a handful of ``(P, C)`` matrix operations however many
+ballots were cast. Register a new method with ``@register("name")``, and
+it is served by the proportional view as ``?method=name``.
+"""
+
+from itertools import combinations_with_replacement
+
+import numpy as np
+
+METHODS = {}
+
+# PAV scores every committee exactly while committees x patterns stays below
+# this many cells, and falls back to local search above it.
+PAV_EXACT_CELLS = 2_000_000
+
+
+def register(name):
+    def decorator(method):
+        METHODS[name] = method
+        return method
+
+    return decorator
+
+
+def allocate(method, matrix, seats):
+    """Run the registered ``method`` and return the winners' columns."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown proportional method {method!r}")
+    if not matrix.num_choices or seats < 1:
+        return np.zeros(0, dtype=np.int64)
+    return METHODS[method](matrix, seats)
+
+
+def seat_counts(winners, num_choices):
+    """Number of seats won by each choice, shape ``(C,)``."""
+    return np.bincount(winners, minlength=num_choices)
+
+
+def pav_score(matrix, counts):
+    """
+    PAV satisfaction of a committee given as seats per choice: each ballot
+    scores ``1 + 1/2 + ... + 1/n`` for the ``n`` seats won by choices it
+    approved.
+    """
+    represented = matrix.patterns.astype(np.int64) @ np.asarray(counts)
+    harmonic = np.concatenate(
+        [[0.0], np.cumsum(1 / np.arange(1, represented.max() + 2))]
+    )
+    return float(matrix.weights @ harmonic[represented])
+
+
+@register("spav")
+def spav(matrix, seats):
+    winners, _ = matrix.spav(seats)
+    return winners
+
+
+@register("pav")
+def pav(matrix, seats):
+    """
+    Proportional approval voting: the committee with the highest PAV score.
+
+    Small elections are solved exactly by scoring every committee at once;
+    larger ones start from the SPAV committee and swap seats between choices
+    while any swap raises the score.
+    """
+    num_choices = matrix.num_choices
+    patterns = matrix.patterns.astype(np.float64)
+    limit = PAV_EXACT_CELLS // max(len(matrix.weights), 1)
+    num_committees = _num_committees(num_choices, seats, limit)
+    if num_committees <= limit:
+        committees = np.array(
+            list(combinations_with_replacement(range(num_choices), seats))
+        )
+        counts = np.zeros((num_committees, num_choices), dtype=np.int64)
+        np.add.at(counts, (np.arange(num_committees)[:, None], committees), 1)
+        represented = matrix.patterns.astype(np.int64) @ counts.T
+        harmonic = np.concatenate([[0.0], np.cumsum(1 / np.arange(1, seats + 1))])
+        scores = matrix.weights @ harmonic[represented]
+        return committees[np.argmax(scores)]
+
+    counts = seat_counts(spav(matrix, seats), num_choices)
+    weights = matrix.weights.astype(np.float64)
+    while True:
+        represented = patterns @ counts
+        # Moving a seat from choice i to choice j changes the score by
+        # gain[j] - loss[i] - overlap[i, j]: ballots approving j gain their
+        # next harmonic term, ballots approving i lose their last one, and
+        # ballots approving both are unchanged.
+        gain_per_ballot = weights / (represented + 1)
+        loss_per_ballot = np.divide(
+            weights, represented, out=np.zeros_like(weights), where=represented > 0
+        )
+        gain = gain_per_ballot @ patterns
+        loss = loss_per_ballot @ patterns
+        change = gain_per_ballot - loss_per_ballot
+        overlap = (patterns * change[:, None]).T @ patterns
+        delta = gain[None, :] - loss[:, None] - overlap
+        delta[counts == 0, :] = -np.inf
+        np.fill_diagonal(delta, -np.inf)
+        i, j = np.unravel_index(np.argmax(delta), delta.shape)
+        if delta[i, j] <= 1e-9:
+            break
+        counts[i] -= 1
+        counts[j] += 1
+    return np.repeat(np.arange(num_choices), counts)
+
+
+@register("phragmen")
+def phragmen(matrix, seats):
+    """
+    Sequential Phragmén: each seat carries one unit of load, shared by the
+    ballots approving its winner, and each round goes to the choice whose
+    approvers would end up with the lowest maximum load.
+    """
+    patterns = matrix.patterns.astype(np.float64)
+    weights = matrix.weights.astype(np.float64)
+    support = weights @ patterns
+    loads = np.zeros(len(weights), dtype=np.float64)
+    winners = np.zeros(seats, dtype=np.int64)
+    for seat in range(seats):
+        new_loads = np.divide(
+            1 + (weights * loads) @ patterns,
+            support,
+            out=np.full(matrix.num_choices, np.inf),
+            where=support > 0,
+        )
+        winners[seat] = np.argmin(new_loads)
+        approvers = patterns[:, winners[seat]] > 0
+        if support[winners[seat]] > 0:
+            loads[approvers] = new_loads[winners[seat]]
+    return winners
+
+
+@register("allocated")
+def allocated_approval(matrix, seats):
+    """
+    Allocated approval: each round the choice with the most remaining
+    ballot weight wins, and a Hare quota of its approvers' weight is spent
+    on it, scaled evenly across them when they hold more than a quota.
+    """
+    patterns = matrix.patterns.astype(np.float64)
+    weights = matrix.weights.astype(np.float64)
+    quota = weights.sum() / seats
+    winners = np.zeros(seats, dtype=np.int64)
+    for seat in range(seats):
+        support = weights @ patterns
+        winners[seat] = np.argmax(support)
+        approvers = patterns[:, winners[seat]] > 0
+        if support[winners[seat]] > quota:
+            weights[approvers] *= 1 - quota / support[winners[seat]]
+        else:
+            weights[approvers] = 0
+    return winners
+
+
+def _num_committees(num_choices, seats, limit):
+    # Multisets of `seats` choices, counted incrementally so that huge values
+    # stop as soon as they pass `limit` instead of building a big integer.
+    total = 1
+    for k in range(1, seats + 1):
+        total = total * (num_choices + k - 1) // k
+        if total > limit:
+            break
+    return total
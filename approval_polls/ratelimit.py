@@ -0,0 +1,251 @@
+"""
+Token-bucket rate limiting of views.
+
+Decorate a view with ``@rate_limit(name, key=...)`` to give every client
+(by IP address, user and/or poll) a bucket of ``settings.RATE_LIMITS[name]``:
+up to ``burst`` requests at once, refilled at ``rate`` requests per second.
+A request finding its bucket empty gets a 429 response with Retry-After, or
+the response of the decorator's `limited` view, before the view touches the
+database.
+
+Buckets live in this process and are checked without locks or round trips.
+Every settings.RATE_LIMIT_SYNC_INTERVAL seconds a bucket adds the requests
+it let through to a counter in the SQLite file settings.RATE_LIMIT_DATABASE,
+and takes those let through by other processes since its last sync out of
+its own tokens, so a limit holds across gunicorn workers to within one sync
+interval. The counters are kept apart from the application's database so
+that counting a GET request never writes to it.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+
+# Fly's proxy sets this to the address the request came from.
+CLIENT_IP_HEADER = "Fly-Client-IP"
+
+# Idle (full) buckets are dropped once a process holds this many.
+MAX_BUCKETS = 10000
+
+_buckets = {}
+
+# A connection to settings.RATE_LIMIT_DATABASE per thread
+_local = threading.local()
+
+
+class Bucket:
+    __slots__ = ("burst", "rate", "tokens", "updated", "pending", "seen", "synced")
+
+    def __init__(self, burst, rate, now):
+        self.burst = burst
+        self.rate = rate
+        self.tokens = burst
+        self.updated = now
+        # Requests let through since the last sync, and the shared counter
+        # as of the last sync
+        self.pending = 0
+        self.seen = None
+        self.synced = -math.inf
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def sync_due(self, now):
+        return now - self.synced >= settings.RATE_LIMIT_SYNC_INTERVAL
+
+    def sync(self, bucket_key, now):
+        timeout = max(60, math.ceil(2 * self.burst / self.rate))
+        total = add(bucket_key, self.pending, timeout)
+        if self.seen is not None:
+            self.tokens -= max(0, total - self.seen - self.pending)
+        self.seen = total
+        self.pending = 0
+        self.synced = now
+
+    def take(self, now):
+        """
+        Take a token, returning 0, or the seconds until one is available if
+        the bucket is empty.
+        """
+        self.refill(now)
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.pending += 1
+        return 0
+
+
+def counters():
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = sqlite3.connect(
+            settings.RATE_LIMIT_DATABASE, timeout=5, isolation_level=None
+        )
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS counter "
+            "(key TEXT PRIMARY KEY, total INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+        _local.db = db
+    return db
+
+
+def add(key, n, timeout):
+    """
+    Add `n` to the shared counter `key` in one statement, so that no other
+    process's count is lost, and return its new total. A counter unchanged
+    for `timeout` seconds starts again from 0.
+    """
+    now = time.time()
+    (total,) = (
+        counters()
+        .execute(
+            "INSERT INTO counter VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "total = iif(expires < ?, 0, total) + excluded.total, "
+            "expires = excluded.expires RETURNING total",
+            (key, n, now + timeout, now),
+        )
+        .fetchone()
+    )
+    return total
+
+
+def purge():
+    """Delete expired counters, returning how many."""
+    return (
+        counters()
+        .execute("DELETE FROM counter WHERE expires < ?", (time.time(),))
+        .rowcount
+    )
+
+
+def client_ip(request):
+    return request.headers.get(CLIENT_IP_HEADER) or request.META.get("REMOTE_ADDR", "")
+
+
+def client_key(request, view_kwargs, key):
+    parts = []
+    for part in key:
+        if part == "ip":
+            parts.append(client_ip(request))
+        elif part == "user":
+            user = getattr(request, "user", None)
+            parts.append(
+                f"user{user.pk}"
+                if user is not None and user.is_authenticated
+                else client_ip(request)
+            )
+        elif part == "poll":
+            parts.append(str(view_kwargs.get("poll_id", view_kwargs.get("pk", ""))))
+        else:
+            raise ValueError(f"Unknown rate limit key {part!r}")
+    return ":".join(parts)
+
+
+def find_bucket(name, request, view_kwargs, key):
+    """The key and bucket of the client, or None if `name` isn't limited."""
+    limit = settings.RATE_LIMITS.get(name)
+    if limit is None:
+        return None
+    bucket_key = f"ratelimit:{name}:{client_key(request, view_kwargs, key)}"
+    bucket = _buckets.get(bucket_key)
+    if bucket is None:
+        now = time.monotonic()
+        if len(_buckets) >= MAX_BUCKETS:
+            prune(now)
+        bucket = _buckets.setdefault(
+            bucket_key, Bucket(limit["burst"], limit["rate"], now)
+        )
+    return bucket_key, bucket
+
+
+def check(name, request, view_kwargs, key):
+    """Seconds until the client may retry, or 0 if the request may go ahead."""
+    found = find_bucket(name, request, view_kwargs, key)
+    if found is None:
+        return 0
+    bucket_key, bucket = found
+    now = time.monotonic()
+    if bucket.sync_due(now):
+        bucket.sync(bucket_key, now)
+    return bucket.take(now)
+
+
+async def acheck(name, request, view_kwargs, key):
+    """check() without blocking the event loop on the database."""
+    if "user" in key:
+        # Looking the user up may query the database
+        found = await sync_to_async(find_bucket)(name, request, view_kwargs, key)
+    else:
+        found = find_bucket(name, request, view_kwargs, key)
+    if found is None:
+        return 0
+    bucket_key, bucket = found
+    now = time.monotonic()
+    if bucket.sync_due(now):
+        await sync_to_async(bucket.sync)(bucket_key, now)
+    return bucket.take(now)
+
+
+def prune(now):
+    for bucket_key, bucket in list(_buckets.items()):
+        bucket.refill(now)
+        if bucket.tokens >= bucket.burst and not bucket.pending:
+            _buckets.pop(bucket_key, None)
+
+
+def reset():
+    _buckets.clear()
+
+
+def too_many_requests(request, wait, *args, **kwargs):
+    response = HttpResponse(
+        "Too many requests, please retry later.",
+        status=429,
+        content_type="text/plain",
+    )
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(name, key=("ip",), limited=too_many_requests):
+    """
+    Limit a view with the bucket settings.RATE_LIMITS[name], keeping a bucket
+    per combination of the `key` parts: "ip", "user" (the IP address for
+    anonymous users) and "poll" (the view's poll_id or pk argument).
+
+    A request over the limit is answered by the synchronous view
+    ``limited(request, wait, *args, **kwargs)``, `wait` being the seconds
+    until the client may retry.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                wait = await acheck(name, request, kwargs, key)
+                if wait:
+                    return limited(request, wait, *args, **kwargs)
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = check(name, request, kwargs, key)
+            if wait:
+                return limited(request, wait, *args, **kwargs)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
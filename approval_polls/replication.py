@@ -0,0 +1,246 @@
+"""
+Serving reads from a LiteFS replica while writes go to the primary.
+
+With settings.REPLICA_DATABASE set, ReplicaMiddleware lets the reads of safe
+(GET, HEAD, OPTIONS) requests go to that database alias through
+ReplicaRouter. Writes always go to the default database, and so do all the
+queries of unsafe requests and of code running outside a request, such as
+management commands. Once a request has written, its later reads go to the
+default database too.
+
+On a LiteFS replica node, where only the primary can write, unsafe requests
+are replayed on the primary instead, and so are safe requests that try to
+write, such as a results page queueing a snapshot: their first write raises
+ReplayOnPrimary.
+
+Read-your-writes: after a request that wrote, the primary's replication
+position is set in a cookie, and a later safe request waits up to
+settings.REPLICA_MAX_WAIT seconds for the replica to reach it before falling
+back to the default database. On a LiteFS replica node the default database
+is the same lagging copy, so the request is replayed on the primary instead.
+
+A position is the transaction ID LiteFS keeps in the ``<database>-pos`` file,
+or without one the database file's last modification time. To try this
+locally, point DATABASE_REPLICA_PATH at a second file and run the
+simulate_replication command, which copies the database across with a lag.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import request_finished
+from django.http import HttpResponse
+
+POSITION_COOKIE = "replication_position"
+POSITION_COOKIE_MAX_AGE = 60
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# The alias the current request reads from and whether it has written, or
+# None outside requests.
+_request = ContextVar("replication_request", default=None)
+
+
+def end_request(**kwargs):
+    # After any streamed content has been read, so streaming views read from
+    # the replica too.
+    _request.set(None)
+
+
+request_finished.connect(end_request, dispatch_uid="approval_polls.replication")
+
+
+class ReplayOnPrimary(Exception):
+    """A safe request tried to write on a LiteFS replica node."""
+
+
+class RequestRouting:
+    def __init__(self, read_alias, primary=None):
+        self.read_alias = read_alias
+        # The primary's hostname, on a LiteFS replica node
+        self.primary = primary
+        self.wrote = False
+        self.replay = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _request.get()
+        if routing is None or routing.wrote:
+            return None
+        return routing.read_alias
+
+    def db_for_write(self, model, **hints):
+        routing = _request.get()
+        if routing is not None:
+            if routing.primary is not None:
+                routing.replay = True
+                raise ReplayOnPrimary(f"Writes go to {routing.primary}")
+            routing.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the default database
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Migrations reach the replica through replication
+        return db != settings.REPLICA_DATABASE
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        replica = settings.REPLICA_DATABASE
+        if replica is None:
+            return self.get_response(request)
+        primary = litefs_primary()
+        if primary is not None and request.method not in SAFE_METHODS:
+            return replay(primary)
+
+        target = request.COOKIES.get(POSITION_COOKIE, "")
+        caught_up = not target.isdigit() or wait_for(replica, int(target))
+        if primary is not None and not caught_up:
+            return replay(primary)
+        routing = route(request, replica, caught_up, primary)
+        response = self.get_response(request)
+        return finish(response, routing, target, caught_up)
+
+    async def __acall__(self, request):
+        replica = settings.REPLICA_DATABASE
+        if replica is None:
+            return await self.get_response(request)
+        primary = litefs_primary()
+        if primary is not None and request.method not in SAFE_METHODS:
+            return replay(primary)
+
+        target = request.COOKIES.get(POSITION_COOKIE, "")
+        caught_up = not target.isdigit() or await async_wait_for(replica, int(target))
+        if primary is not None and not caught_up:
+            return replay(primary)
+        routing = route(request, replica, caught_up, primary)
+        response = await self.get_response(request)
+        return finish(response, routing, target, caught_up)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, ReplayOnPrimary):
+            return replay(_request.get().primary)
+        return None
+
+
+def replay(primary):
+    """A response replaying the request on the LiteFS primary `primary`."""
+    response = HttpResponse(status=409)
+    response["fly-replay"] = f"instance={primary}"
+    return response
+
+
+def route(request, replica, caught_up, primary):
+    safe = request.method in SAFE_METHODS
+    routing = RequestRouting(replica if safe and caught_up else "default", primary)
+    _request.set(routing)
+    return routing
+
+
+def finish(response, routing, target, caught_up):
+    if routing.replay:
+        # A write outside the view, such as saving the session, failed
+        return replay(routing.primary)
+    if routing.wrote:
+        response.set_cookie(
+            POSITION_COOKIE,
+            str(position("default")),
+            max_age=POSITION_COOKIE_MAX_AGE,
+            httponly=True,
+            samesite="Lax",
+        )
+    elif target and caught_up:
+        response.delete_cookie(POSITION_COOKIE, samesite="Lax")
+    return response
+
+
+def database_path(alias):
+    return settings.DATABASES[alias]["NAME"]
+
+
+def position(alias):
+    """The replication position of a database alias, as an integer."""
+    path = database_path(alias)
+    try:
+        with open(f"{path}-pos") as pos:
+            return int(pos.read().split("/")[0], 16)
+    except (OSError, ValueError):
+        return modified_ns(path)
+
+
+def modified_ns(path):
+    """Last modification time of an SQLite database, including its WAL."""
+    times = [
+        os.stat(name).st_mtime_ns
+        for name in (path, f"{path}-wal")
+        if os.path.exists(name)
+    ]
+    return max(times, default=0)
+
+
+def replicate(primary, replica):
+    """
+    Copy the database at path `primary` to `replica` and record the position
+    copied in the replica's -pos file, as LiteFS would. Returns the position.
+    """
+    # Taken first, the copy holds at least the writes up to this position
+    copied = modified_ns(primary)
+    source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    with open(f"{replica}-pos", "w") as pos:
+        pos.write(f"{copied:016x}/{0:016x}\n")
+    return copied
+
+
+def wait_for(alias, target):
+    """Wait until `alias` reaches `target`; return whether it did."""
+    deadline = time.monotonic() + settings.REPLICA_MAX_WAIT
+    while position(alias) < target:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+async def async_wait_for(alias, target):
+    """wait_for() without blocking the event loop."""
+    deadline = time.monotonic() + settings.REPLICA_MAX_WAIT
+    while position(alias) < target:
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+def litefs_primary():
+    """
+    The primary's hostname if this node is a LiteFS replica, or None. LiteFS
+    only writes the .primary file on replicas.
+    """
+    try:
+        with open(settings.LITEFS_PRIMARY_FILE) as primary:
+            return primary.read().strip() or None
+    except OSError:
+        return None
@@ -101,9 +101,113 @@ DATABASES = {
         # Add 'postgresql_psycopg2', 'mysql', 'sqlite3' or 'oracle'.
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": db_path,  # Or path to database file if using sqlite3.
+        # Keep each worker's connection open between requests, checking that
+        # it still works before reusing it.
+        "CONN_MAX_AGE": env("CONN_MAX_AGE", int, default=600),
+        "CONN_HEALTH_CHECKS": True,
+        # Transactions that write take the write lock as they begin (see
+        # write_transaction in approval_polls/sqlite.py); the rest stay
+        # deferred, so that reads never wait for writers.
     }
 }
 
+# Reads of GET requests can be served from a replica of the database, such as
+# the local copy on a LiteFS replica node, while writes go to the primary (see
+# approval_polls/replication.py). REPLICA_MAX_WAIT is how long a request
+# waits for the replica to catch up with the user's last write before reading
+# from the primary instead.
+replica_path = env("DATABASE_REPLICA_PATH", str, default="")
+if replica_path:
+    DATABASES["replica"] = {**DATABASES["default"], "NAME": replica_path}
+REPLICA_DATABASE = "replica" if replica_path else None
+REPLICA_MAX_WAIT = env("REPLICA_MAX_WAIT", float, default=0.5)
+LITEFS_PRIMARY_FILE = os.path.join(os.path.dirname(db_path), ".primary")
+DATABASE_ROUTERS = ["approval_polls.replication.ReplicaRouter"]
+
+# Pragmas set on every new SQLite connection, in order (see
+# approval_polls/sqlite.py). WAL lets readers carry on while a vote is being
+# written, and synchronous=NORMAL only syncs the WAL at checkpoints, which
+# stays safe against corruption. cache_size is negative for KiB. Memory
+# mapping is off unless SQLITE_MMAP_SIZE is set, as the production database
+# sits on a FUSE mount.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": env("SQLITE_BUSY_TIMEOUT", int, default=5000),
+    "cache_size": -env("SQLITE_CACHE_KIB", int, default=20000),
+    "mmap_size": env("SQLITE_MMAP_SIZE", int, default=0),
+    "temp_store": "MEMORY",
+}
+
+# Results pages and SPAV sweeps are cached per poll revision (see
+# approval_polls/caching.py). The local-memory cache evicts the least recently
+# used entries once MAX_ENTRIES is reached; watch the hit rate at
+# /cache_stats/ when sizing it.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {
+            "MAX_ENTRIES": env("CACHE_MAX_ENTRIES", int, default=2000),
+            "CULL_FREQUENCY": 10,
+        },
+    },
+}
+
+# Polls with at least this many ballots have their results analytics and
+# SPAV sweep computed by the run_results_worker command instead of in the
+# request.
+RESULTS_JOB_MIN_BALLOTS = env("RESULTS_JOB_MIN_BALLOTS", int, default=20000)
+
+# Threads in which the async views compute analytics, such as a smaller
+# poll's SPAV sweep, off the event loop.
+ANALYTICS_THREADS = env("ANALYTICS_THREADS", int, default=4)
+
+# Token buckets of the rate-limited views (see approval_polls/ratelimit.py):
+# each client may make `burst` requests at once, refilled at `rate` requests
+# per second. Worker processes on a machine share their counts through the
+# SQLite file RATE_LIMIT_DATABASE every RATE_LIMIT_SYNC_INTERVAL seconds.
+# Anonymous votes are counted by IP address, which a whole school or office
+# may share behind NAT, so their bucket takes a classroom voting at once.
+RATE_LIMITS = {
+    "vote": {"burst": 200, "rate": 2.0},
+    "results": {"burst": 30, "rate": 2.0},
+    "raw": {"burst": 10, "rate": 0.2},
+}
+RATE_LIMIT_DATABASE = env(
+    "RATE_LIMIT_DATABASE", str, default="/tmp/approval_polls_ratelimit.sqlite3"
+)
+RATE_LIMIT_SYNC_INTERVAL = env("RATE_LIMIT_SYNC_INTERVAL", float, default=1.0)
+
+# With VOTE_QUEUE on, the vote view only appends each validated vote to a
+# queue, and the run_vote_writer command records up to VOTE_QUEUE_BATCH_SIZE
+# of them per transaction, so that a spike of votes doesn't leave every web
+# worker waiting on the SQLite write lock.
+VOTE_QUEUE = env("VOTE_QUEUE", bool, default=False)
+VOTE_QUEUE_BATCH_SIZE = env("VOTE_QUEUE_BATCH_SIZE", int, default=200)
+# Times a queued vote that fails to record is tried before it is set aside.
+VOTE_QUEUE_MAX_ATTEMPTS = env("VOTE_QUEUE_MAX_ATTEMPTS", int, default=5)
+
+# Seconds an anonymous poll's vote form token is remembered after use, so
+# that resubmitting the form in that time doesn't cast a second ballot.
+VOTE_TOKEN_TTL = env("VOTE_TOKEN_TTL", int, default=60 * 60 * 24)
+
+# The latest voters listed under each poll on the My Polls page, and how
+# many more each "Show more" click loads.
+VOTER_PREVIEW_SIZE = env("VOTER_PREVIEW_SIZE", int, default=10)
+VOTER_PAGE_SIZE = env("VOTER_PAGE_SIZE", int, default=100)
+
+# Days over which a poll's weight in its tags' activity, which orders the
+# popular tags sidebar, halves. Run the rebuild_tag_stats command after
+# changing it.
+TAG_ACTIVITY_HALF_LIFE = env("TAG_ACTIVITY_HALF_LIFE", float, default=30)
+
+# Seconds between each process's syncs of its tag autocomplete index with
+# the tags added and removed by other processes.
+TAG_INDEX_SYNC_INTERVAL = env("TAG_INDEX_SYNC_INTERVAL", float, default=10.0)
+
+# Ballots saved per transaction when importing cast vote records with the
+# import_cvr command or the poll admin page's upload.
+CVR_IMPORT_BATCH_SIZE = env("CVR_IMPORT_BATCH_SIZE", int, default=2000)
 
 # The following settings are required for the activation emails in the
 # registration module to work.
@@ -191,13 +295,14 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE = (
+    "approval_polls.replication.ReplicaMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django_ajax.middleware.AJAXMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "approval_polls.middleware.AsyncWhiteNoiseMiddleware",
     "allauth.account.middleware.AccountMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
 )
@@ -206,6 +311,8 @@ ROOT_URLCONF = "approval_polls.urls"
 
 # Python dotted path to the WSGI application used by Django's runserver.
 WSGI_APPLICATION = "approval_polls.wsgi.application"
+# And to the ASGI application served by uvicorn with SERVER_MODE=asgi.
+ASGI_APPLICATION = "approval_polls.asgi.application"
 
 TEMPLATES = [
     {
@@ -0,0 +1,73 @@
+"""
+SQLite connection tuning and maintenance.
+
+configure_connection applies settings.SQLITE_PRAGMAS to each new connection;
+it is connected to the connection_created signal in apps.py. optimize and
+checkpoint are run by the optimize_database command, which the results
+worker runs hourly.
+write_transaction is transaction.atomic() for blocks that write.
+"""
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    transaction.atomic() that takes SQLite's write lock as it begins, waiting
+    up to busy_timeout for it. A deferred transaction that has already read
+    fails at once with "database is locked" if another connection is writing
+    when it tries to write. Read-only transactions stay deferred, so that
+    they never wait for writers. Nested in another transaction, this is a
+    savepoint that takes no lock of its own.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    mode = connection.transaction_mode
+    connection.transaction_mode = "IMMEDIATE"
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA {name}")
+        return cursor.fetchone()[0]
+
+
+def optimize(connection, analyze=False):
+    """
+    Refresh the query planner's statistics: `PRAGMA optimize` analyzes the
+    tables whose statistics look stale, and `analyze` analyzes them all.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE" if analyze else "PRAGMA optimize")
+
+
+def checkpoint(connection, mode="PASSIVE"):
+    """
+    Copy the write-ahead log back into the database file, returning SQLite's
+    `(busy, log frames, checkpointed frames)`. PASSIVE never waits for
+    readers or writers; TRUNCATE waits for them and then empties the log.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA wal_checkpoint({mode})")
+        return tuple(cursor.fetchone())
@@ -112,9 +112,19 @@ $(function () {
 
     // Only initialize tag field if it exists
     if ($("#tokenTagField").length) {
+      const suggestionsUrl = $("#tokenTagField").data("suggestions-url");
       $("#tokenTagField")
         .on("tokenfield:createtoken", tokenize)
-        .tokenfield()
+        .tokenfield({
+          autocomplete: {
+            source: (request, response) => {
+              $.getJSON(suggestionsUrl, { q: request.term })
+                .done((data) => response(data.tags))
+                .fail(() => response([]));
+            },
+            delay: 100,
+          },
+        })
         .tokenfield("setTokens", allTags);
     }
   };
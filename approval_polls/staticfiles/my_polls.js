@@ -60,4 +60,41 @@ $(function () {
   function cancelAction(pollId) {
     $("#alert" + pollId).remove();
   }
+
+  // The page lists each poll's latest voters; fetch the rest a page at a
+  // time, replacing the list with the first page.
+  $("button.show-voters").click(function () {
+    var button = $(this);
+    var table = $("#voters-" + button.data("poll-id"));
+    var anonymous = table.data("anonymous");
+    var cursor = button.data("cursor");
+    button.prop("disabled", true);
+    $.getJSON(button.data("url"), cursor ? { cursor: cursor } : {})
+      .done(function (data) {
+        var tbody = table.find("tbody");
+        if (!cursor) {
+          tbody.empty();
+        }
+        data.voters.forEach(function (voter) {
+          var row = $("<tr>");
+          if (!anonymous) {
+            row.append($("<td>").text(voter.username || "—"));
+            row.append($("<td>").text(voter.email || "—"));
+          }
+          row.append($("<td>").text(new Date(voter.timestamp).toLocaleString()));
+          tbody.append(row);
+        });
+        if (data.next) {
+          button.data("cursor", data.next);
+          button.text("Show more voters");
+          button.prop("disabled", false);
+        } else {
+          button.remove();
+        }
+      })
+      .fail(function () {
+        button.prop("disabled", false);
+        alert("An error occurred while loading the voters.");
+      });
+  });
 });
@@ -30,24 +30,39 @@ document.addEventListener("DOMContentLoaded", async function () {
   const votesTableDiv = document.getElementById("votesTable");
   const allocationLogDiv = document.getElementById("allocationLog");
 
-  let rawBallots = [];
-  let choices = [];
+  // SPAV allocations are computed (and cached) on the server, so each
+  // slider position only fetches a small JSON payload.
+  const spavCache = new Map();
+
+  async function fetchAllocation(seats) {
+    while (!spavCache.has(seats)) {
+      const response = await fetch(`/polls/${pollId}/spav/?seats=${seats}`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      if (response.status === 202) {
+        // Large polls are computed in the background; try again shortly
+        const retryAfter = parseInt(response.headers.get("Retry-After"), 10);
+        await new Promise((resolve) =>
+          setTimeout(resolve, (retryAfter || 5) * 1000),
+        );
+        continue;
+      }
+      spavCache.set(seats, await response.json());
+    }
+    return spavCache.get(seats);
+  }
 
-  // 1. Fetch raw ballots + choices from /raw endpoint once
+  let allocation;
   try {
-    const response = await fetch(`/polls/${pollId}/raw`);
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
-    }
-    const data = await response.json();
-    rawBallots = data.ballots; // e.g. [[1,2], [2,3], ...]
-    choices = data.choices; // e.g. [{ id:1, choice_text:'Party A'}, ...]
+    allocation = await fetchAllocation(parseInt(seatsSlider.value));
   } catch (error) {
-    console.error("Error fetching raw data:", error);
+    console.error("Error fetching allocation:", error);
     allocationLogDiv.textContent =
       "Error loading ballot data. Please try refreshing the page.";
     return;
   }
+  const choices = allocation.choices; // e.g. [{ id:1, choice_text:'Party A'}, ...]
 
   // Helper function to escape HTML entities to prevent XSS
   function escapeHtml(text) {
@@ -61,9 +76,6 @@ document.addEventListener("DOMContentLoaded", async function () {
     return String(text).replace(/[&<>"']/g, (m) => map[m]);
   }
 
-  // Build a debug table of ballots (optional)
-  buildVotesTable(rawBallots, choices);
-
   // Helper function to detect dark mode
   function isDarkMode() {
     return (
@@ -160,120 +172,49 @@ document.addEventListener("DOMContentLoaded", async function () {
     });
   }
 
-  // 3. SPAV allowing multiple seats, now with a debug log
-  function spav(choices, ballots, seats) {
+  // 3. Rebuild the allocation steps log from the per-round scores
+  function allocationSteps(allocation) {
     const debugLines = [];
-
-    // Each choice gets a seatCount property
-    const results = choices.map((c) => ({
-      id: c.id,
-      text: c.choice_text,
-      seatCount: 0,
-    }));
-
-    // For each ballot, track how many seats they've contributed to so far
-    const ballotWinnerCounts = new Array(ballots.length).fill(0);
-
-    for (let seat = 0; seat < seats; seat++) {
+    allocation.rounds.forEach((round, seat) => {
       const seatNumber = seat + 1;
       debugLines.push(`\nSEAT #${seatNumber} Calculation:`);
-
-      // 3.1 Calculate total weight for each choice
-      const weights = new Map(); // choiceId -> sum of ballot weights
-      results.forEach((r) => weights.set(r.id, 0));
-
-      ballots.forEach((approvedChoices, bIndex) => {
-        // Weighted by 1 / (1 + ballotWinnerCounts[bIndex])
-        const ballotWeight = 1 / (1 + ballotWinnerCounts[bIndex]);
-
-        approvedChoices.forEach((choiceId) => {
-          // This is SPAV, so a choice can keep winning multiple seats
-          const prev = weights.get(choiceId) || 0;
-          weights.set(choiceId, prev + ballotWeight);
-        });
+      allocation.choices.forEach((c, index) => {
+        const w = round.scores[index].toFixed(3);
+        debugLines.push(`  "${c.choice_text}" => sum weighted votes: ${w}`);
       });
-
-      // Log each choice's weight
-      for (const r of results) {
-        const w = weights.get(r.id).toFixed(3);
-        debugLines.push(`  "${r.text}" => sum weighted votes: ${w}`);
-      }
-
-      // 3.2 Find the choice with the highest weight
-      let bestChoiceId = null;
-      let bestWeight = -1;
-      for (const [choiceId, totalWeight] of weights.entries()) {
-        if (totalWeight > bestWeight) {
-          bestWeight = totalWeight;
-          bestChoiceId = choiceId;
-        }
-      }
-
-      // 3.3 Allocate seat
-      if (bestChoiceId !== null) {
-        const winner = results.find((r) => r.id === bestChoiceId);
-        winner.seatCount += 1;
-        debugLines.push(
-          `  ==> Winner for seat #${seatNumber}: "${winner.text}" (ID=${winner.id}) with ${bestWeight.toFixed(3)} votes`,
-        );
-
-        // Increase 'winner count' for each ballot that approved the winner
-        ballots.forEach((approvedChoices, bIndex) => {
-          if (approvedChoices.includes(bestChoiceId)) {
-            ballotWinnerCounts[bIndex] += 1;
-          }
-        });
-      } else {
-        debugLines.push(
-          `  No candidates can win seat #${seatNumber} - stopping early.`,
-        );
-        break;
-      }
-    }
-
-    return { results, debugLines };
-  }
-
-  class SPAVCache {
-    constructor(maxSize = 100) {
-      this.cache = new Map();
-      this.maxSize = maxSize;
-    }
-
-    get(seats) {
-      return this.cache.get(seats);
-    }
-
-    set(seats, value) {
-      if (this.cache.size >= this.maxSize) {
-        // Remove oldest entry
-        const firstKey = this.cache.keys().next().value;
-        this.cache.delete(firstKey);
-      }
-      this.cache.set(seats, value);
-    }
+      const index = allocation.choices.findIndex((c) => c.id === round.winner);
+      const winner = allocation.choices[index];
+      debugLines.push(
+        `  ==> Winner for seat #${seatNumber}: "${winner.choice_text}" (ID=${winner.id}) with ${round.scores[index].toFixed(3)} votes`,
+      );
+    });
+    return debugLines;
   }
 
-  const spavCache = new SPAVCache(100);
-
   // 4. Update chart + winners + debug log
-  function updateAllocation() {
+  async function updateAllocation() {
     const seats = parseInt(seatsSlider.value);
     seatsValue.textContent = seats;
 
-    // 1) Check if we have a cached result
-    let cached = spavCache.get(seats); // or spavCache.get(seats) if using a Map
-
-    if (!cached) {
-      // 2) Not in cache; compute
-      const { results, debugLines } = spav(choices, rawBallots, seats);
-      // 3) Store it
-      cached = { results, debugLines };
-      spavCache.set(seats, cached); // or spavCache.set(seats, cached)
+    let allocation;
+    try {
+      allocation = await fetchAllocation(seats);
+    } catch (error) {
+      console.error("Error fetching allocation:", error);
+      allocationLogDiv.textContent =
+        "Error loading ballot data. Please try refreshing the page.";
+      return;
     }
-
-    // 4) Use the cached results
-    const { results, debugLines } = cached;
+    // A later slider position may have been requested while this one loaded
+    if (seats !== parseInt(seatsSlider.value)) {
+      return;
+    }
+    const results = allocation.choices.map((c) => ({
+      id: c.id,
+      text: c.choice_text,
+      seatCount: c.seats,
+    }));
+    const debugLines = allocationSteps(allocation);
 
     // Now update chart data
     spavChart.data.labels = results.map((a) => a.text);
@@ -306,6 +247,55 @@ document.addEventListener("DOMContentLoaded", async function () {
   // Initial run
   updateAllocation();
 
+  // The cast vote record needs every ballot, so only fetch it on request
+  const loadVotesButton = document.getElementById("loadVotesTable");
+  loadVotesButton.addEventListener("click", async () => {
+    loadVotesButton.disabled = true;
+    try {
+      const response = await fetch(`/polls/${pollId}/raw/?format=bitmask`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const data = decodeBallotBitmask(await response.arrayBuffer());
+      buildVotesTable(data.ballots, data.choices); // e.g. [[1,2], [2,3], ...]
+      loadVotesButton.remove();
+    } catch (error) {
+      console.error("Error fetching raw data:", error);
+      votesTableDiv.textContent =
+        "Error loading ballot data. Please try refreshing the page.";
+      loadVotesButton.disabled = false;
+    }
+  });
+
+  // Decode the compact raw ballot format (see approval_polls/bitmask.py): a
+  // JSON header listing the choices, then one little-endian bitmask per
+  // ballot with bit i set when choices[i] was approved.
+  function decodeBallotBitmask(buffer) {
+    const view = new DataView(buffer);
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== "APB1") {
+      throw new Error("Unexpected ballot format");
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(
+      new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)),
+    );
+    const choiceIds = header.choices.map((c) => c.id);
+    const width = Math.ceil(choiceIds.length / 8);
+    const masks = new Uint8Array(buffer, 8 + headerLength);
+    const ballots = [];
+    for (let offset = 0; width > 0 && offset < masks.length; offset += width) {
+      const approved = [];
+      for (let i = 0; i < choiceIds.length; i++) {
+        if (masks[offset + (i >> 3)] & (1 << (i & 7))) {
+          approved.push(choiceIds[i]);
+        }
+      }
+      ballots.push(approved);
+    }
+    return { choices: header.choices, ballots };
+  }
+
   // (Optional) Build a table for debugging the raw ballots using DOM manipulation to prevent XSS
   function buildVotesTable(ballots, allChoices) {
     votesTableDiv.innerHTML = "";
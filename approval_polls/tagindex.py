@@ -0,0 +1,149 @@
+"""
+Tag autocomplete from an in-memory prefix index.
+
+Each process keeps the tags on public polls in a sorted list of their
+normalized text, with their text and public poll counts in lists alongside.
+The tags starting with a prefix are then the run between two bisections,
+and a lookup returns the most used of them without a query.
+
+The index is built from TagStats on the first lookup. After that, a lookup
+at most every settings.TAG_INDEX_SYNC_INTERVAL seconds merges in just the
+TagStats rows written since the last sync, by this process or any other.
+Tags changed in this process are merged in on the next lookup.
+"""
+
+import datetime
+import heapq
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.utils import timezone
+
+from approval_polls.models import TagStats, tag_stats_changed
+
+# Rows written up to this long before a sync are fetched again by the next
+# one, for transactions that commit after the sync started and for clocks
+# that differ between machines. Merging a row twice is harmless.
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+# Sorts after any text that a prefix may be followed by.
+LAST_CHARACTER = "\U0010ffff"
+
+# Suggestions for prefixes up to this long, which match the most tags, are
+# kept until the index next changes.
+SHORT_PREFIX = 2
+
+
+def normalize(text):
+    return text.strip().lower()
+
+
+class TagIndex:
+    def __init__(self):
+        self.keys = []
+        self.tags = []
+        self.uses = array("q")
+        # Suggestions by (prefix, limit) for short prefixes
+        self.short = {}
+        # Held while reading or changing the lists above
+        self.lock = threading.Lock()
+        # Held while querying for changes, so that only one thread does
+        self.sync_lock = threading.Lock()
+        self.synced_at = None
+        self.next_sync = -math.inf
+
+    def __len__(self):
+        return len(self.keys)
+
+    def invalidate(self):
+        """Sync on the next lookup, rather than within the sync interval."""
+        self.next_sync = -math.inf
+
+    def sync(self):
+        if time.monotonic() < self.next_sync:
+            return
+        with self.sync_lock:
+            if time.monotonic() < self.next_sync:
+                # Another thread just synced
+                return
+            self.next_sync = time.monotonic() + settings.TAG_INDEX_SYNC_INTERVAL
+            started = timezone.now()
+            rows = TagStats.objects.all()
+            if self.synced_at is not None:
+                rows = rows.filter(updated__gte=self.synced_at - SYNC_OVERLAP)
+            rows = list(rows.values_list("tag__tag_text", "public_polls"))
+            with self.lock:
+                if self.synced_at is None:
+                    self.build(rows)
+                else:
+                    for tag, uses in rows:
+                        self.set(tag, uses)
+                if rows:
+                    self.short = {}
+            self.synced_at = started
+
+    def build(self, rows):
+        entries = sorted((normalize(tag), tag, uses) for tag, uses in rows if uses > 0)
+        self.keys = [key for key, _, _ in entries]
+        self.tags = [tag for _, tag, _ in entries]
+        self.uses = array("q", (uses for _, _, uses in entries))
+
+    def set(self, tag, uses):
+        """Set the public poll count of `tag`, removing it at 0."""
+        key = normalize(tag)
+        i = bisect_left(self.keys, key)
+        # Tags that normalize alike, from before tags were lowercased
+        while i < len(self.keys) and self.keys[i] == key and self.tags[i] != tag:
+            i += 1
+        found = i < len(self.keys) and self.tags[i] == tag
+        if found and uses > 0:
+            self.uses[i] = uses
+        elif found:
+            del self.keys[i], self.tags[i], self.uses[i]
+        elif uses > 0:
+            self.keys.insert(i, key)
+            self.tags.insert(i, tag)
+            self.uses.insert(i, uses)
+
+    def suggest(self, prefix, limit):
+        """
+        The `limit` tags starting with `prefix` on the most public polls,
+        alphabetically among those on as many.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.sync()
+        with self.lock:
+            suggestions = self.short.get((prefix, limit))
+            if suggestions is None:
+                start = bisect_left(self.keys, prefix)
+                end = bisect_left(self.keys, prefix + LAST_CHARACTER, start)
+                best = heapq.nsmallest(limit, range(start, end), key=self.uses_desc)
+                suggestions = [self.tags[i] for i in best]
+                if len(prefix) <= SHORT_PREFIX:
+                    self.short[prefix, limit] = suggestions
+            return list(suggestions)
+
+    def uses_desc(self, i):
+        return -self.uses[i]
+
+    def all(self):
+        """Every tag on a public poll, alphabetically."""
+        self.sync()
+        with self.lock:
+            return list(self.tags)
+
+
+index = TagIndex()
+
+
+def tags_changed(**kwargs):
+    index.invalidate()
+
+
+tag_stats_changed.connect(tags_changed, dispatch_uid="approval_polls.tagindex")
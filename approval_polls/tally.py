@@ -0,0 +1,394 @@
+"""
+Ballot-matrix tally engine for approval poll analytics.
+
+A poll's votes are loaded once into a ballot x choice 0/1 matrix. Ballots with
+identical approval sets are collapsed into a single row carrying a weight, so
+every statistic below is a weighted matrix operation over the unique patterns
+rather than a Python loop over ballots.
+
+StoredTally offers the same statistics read from the incrementally maintained
+co-approval and approval-size counts, without touching the votes at all.
+"""
+
+import asyncio
+from itertools import chain
+
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from approval_polls import proportional
+from approval_polls.caching import acached_for_revision, cached_for_revision
+from approval_polls.models import ApprovalSizeCount, CoApprovalCount, Vote
+
+# Highest seat count offered by the results page slider.
+SPAV_MAX_SEATS = 100
+
+
+class BallotMatrix:
+    """
+    Unique approval patterns of a poll and how many ballots cast each one.
+
+    ``patterns`` is a ``(P, C)`` uint8 matrix whose columns follow
+    ``choice_ids``; ``weights`` is a ``(P,)`` vector of ballot counts.
+    """
+
+    def __init__(self, choice_ids, patterns, weights):
+        self.choice_ids = list(choice_ids)
+        self.patterns = patterns
+        self.weights = weights
+        self.sizes = patterns.sum(axis=1, dtype=np.int64)
+
+    @classmethod
+    def from_rows(cls, choice_ids, ballot_ids, vote_choice_ids, empty_ballots=0):
+        """
+        Build the matrix from parallel arrays of ``(ballot_id, choice_id)``
+        vote rows.
+
+        ``empty_ballots`` counts ballots that approved nothing, since those
+        have no vote rows of their own.
+        """
+        choice_ids = np.asarray(list(choice_ids), dtype=np.int64)
+        num_choices = len(choice_ids)
+        ballot_ids = np.asarray(ballot_ids, dtype=np.int64)
+        vote_choice_ids = np.asarray(vote_choice_ids, dtype=np.int64)
+
+        order = np.argsort(choice_ids)
+        columns = order[np.searchsorted(choice_ids[order], vote_choice_ids)]
+        _, rows = np.unique(ballot_ids, return_inverse=True)
+        num_ballots = int(rows.max()) + 1 if len(rows) else 0
+
+        dense = np.zeros((num_ballots, num_choices), dtype=np.uint8)
+        dense[rows, columns] = 1
+
+        # Deduplicate on the bit-packed rows, which is much cheaper than
+        # comparing full-width rows when there are many choices.
+        packed = np.packbits(dense, axis=1)
+        unique, weights = np.unique(packed, axis=0, return_counts=True)
+        patterns = np.unpackbits(unique, axis=1, count=num_choices)
+        weights = weights.astype(np.int64)
+
+        if empty_ballots > 0:
+            patterns = np.vstack([patterns, np.zeros((1, num_choices), np.uint8)])
+            weights = np.append(weights, np.int64(empty_ballots))
+
+        return cls(choice_ids.tolist(), patterns, weights)
+
+    @classmethod
+    def from_ballots(cls, choice_ids, ballots):
+        """
+        Build the matrix from an iterable of approved choice ID collections,
+        one per ballot.
+        """
+        approved = [set(ballot) for ballot in ballots]
+        sizes = np.fromiter(map(len, approved), dtype=np.int64, count=len(approved))
+        ballot_ids = np.repeat(np.arange(len(approved)), sizes)
+        vote_choice_ids = np.fromiter(
+            chain.from_iterable(approved), dtype=np.int64, count=int(sizes.sum())
+        )
+        empty_ballots = int((sizes == 0).sum())
+        return cls.from_rows(choice_ids, ballot_ids, vote_choice_ids, empty_ballots)
+
+    @classmethod
+    def from_poll(cls, poll, choice_ids=None):
+        """
+        Load every vote of ``poll`` in a single query.
+
+        Pass ``choice_ids`` to fix the column order (and the set of choices
+        counted) to a choice list the caller has already loaded.
+        """
+        if choice_ids is None:
+            choice_ids = poll.choice_set.order_by("id").values_list("id", flat=True)
+        choice_ids = list(choice_ids)
+        rows = Vote.objects.filter(
+            choice__poll=poll, choice_id__in=choice_ids
+        ).values_list("ballot_id", "choice_id")
+        rows = np.array(list(rows.distinct()), dtype=np.int64).reshape(-1, 2)
+        voting_ballots = len(np.unique(rows[:, 0]))
+        empty_ballots = max(poll.total_ballots() - voting_ballots, 0)
+        return cls.from_rows(choice_ids, rows[:, 0], rows[:, 1], empty_ballots)
+
+    @classmethod
+    def from_data(cls, choice_ids, data):
+        """Rebuild a matrix saved by to_data() with the same ``choice_ids``."""
+        choice_ids = list(choice_ids)
+        packed = np.array(
+            [bytearray.fromhex(row) for row in data["patterns"]], dtype=np.uint8
+        ).reshape(len(data["patterns"]), (len(choice_ids) + 7) // 8)
+        patterns = np.unpackbits(packed, axis=1, count=len(choice_ids))
+        return cls(choice_ids, patterns, np.asarray(data["weights"], dtype=np.int64))
+
+    def to_data(self):
+        """
+        The patterns, bit-packed into hex strings, and weights as plain data
+        for a JSON field.
+        """
+        return {
+            "patterns": [
+                row.tobytes().hex() for row in np.packbits(self.patterns, axis=1)
+            ],
+            "weights": self.weights.tolist(),
+        }
+
+    @property
+    def num_choices(self):
+        return len(self.choice_ids)
+
+    @property
+    def total_ballots(self):
+        return int(self.weights.sum())
+
+    def approval_counts(self):
+        """Number of ballots approving each choice, shape ``(C,)``."""
+        return self.weights @ self.patterns.astype(np.int64)
+
+    def co_approval_counts(self):
+        """
+        Number of ballots approving both choice ``i`` and choice ``j``, shape
+        ``(C, C)``. The diagonal holds the plain approval counts.
+        """
+        patterns = self.patterns.astype(np.float64)
+        weighted = patterns * self.weights[:, None]
+        # float64 matmul goes through BLAS and is exact for any ballot count
+        # below 2**53.
+        return np.rint(weighted.T @ patterns).astype(np.int64)
+
+    def approval_distribution(self):
+        """Number of ballots by how many choices they approved, shape ``(C + 1,)``."""
+        return np.bincount(
+            self.sizes, weights=self.weights, minlength=self.num_choices + 1
+        ).astype(np.int64)
+
+    def candidate_approval_distributions(self):
+        """
+        For each choice, the number of its approving ballots by how many
+        choices those ballots approved, shape ``(C, C + 1)``.
+        """
+        by_size = np.zeros((len(self.weights), self.num_choices + 1), np.float64)
+        by_size[np.arange(len(self.weights)), self.sizes] = self.weights
+        distributions = self.patterns.T.astype(np.float64) @ by_size
+        return np.rint(distributions).astype(np.int64)
+
+    def anyone_but_counts(self):
+        """
+        Number of ballots that approved every choice except choice ``i``,
+        shape ``(C,)``.
+        """
+        mask = self.sizes == self.num_choices - 1
+        excluded = 1 - self.patterns[mask].astype(np.int64)
+        return self.weights[mask] @ excluded
+
+    def proportional_votes(self):
+        """
+        Each ballot split evenly between the choices it approved, shape
+        ``(C,)``.
+        """
+        mask = self.sizes > 0
+        shares = self.weights[mask] / self.sizes[mask]
+        return shares @ self.patterns[mask].astype(np.float64)
+
+    def spav(self, seats):
+        """
+        Sequential proportional approval voting, where a choice may win more
+        than one seat.
+
+        Each round every ballot is worth ``1 / (1 + w)``, ``w`` being the
+        number of seats already won by choices it approved, and the
+        highest-scoring choice takes the seat (ties go to the earliest
+        column). Since round ``n`` only depends on the rounds before it, one
+        pass of ``seats`` rounds answers every smaller seat count as well.
+
+        Returns the winning column of each round, shape ``(seats,)``, and the
+        scores every choice had in each round, shape ``(seats, C)``.
+        """
+        patterns = self.patterns.astype(np.float64)
+        won = np.zeros(len(self.weights), dtype=np.float64)
+        winners = np.zeros(seats, dtype=np.int64)
+        scores = np.zeros((seats, self.num_choices), dtype=np.float64)
+        if not self.num_choices:
+            return winners[:0], scores[:0]
+        for seat in range(seats):
+            scores[seat] = (self.weights / (1 + won)) @ patterns
+            winners[seat] = np.argmax(scores[seat])
+            won += patterns[:, winners[seat]]
+        return winners, scores
+
+
+class StoredTally:
+    """
+    Poll statistics read from the CoApprovalCount and ApprovalSizeCount rows,
+    in O(C^2) time however many ballots the poll has.
+
+    ``pairs`` is a symmetric ``(C, C)`` matrix of co-approval counts with a
+    zero diagonal; ``sizes[i, k]`` is the number of ballots approving choice
+    ``i`` that approved ``k`` choices in total.
+    """
+
+    def __init__(self, choice_ids, total_ballots, pairs, sizes):
+        self.choice_ids = list(choice_ids)
+        self.total_ballots = total_ballots
+        self.pairs = pairs
+        self.sizes = sizes
+
+    @classmethod
+    def from_poll(cls, poll, choice_ids=None):
+        if choice_ids is None:
+            choice_ids = poll.choice_set.order_by("id").values_list("id", flat=True)
+        choice_ids = list(choice_ids)
+        column = {choice_id: i for i, choice_id in enumerate(choice_ids)}
+        num_choices = len(choice_ids)
+
+        pairs = np.zeros((num_choices, num_choices), dtype=np.int64)
+        for a, b, count in CoApprovalCount.objects.filter(
+            poll=poll, ballots__gt=0
+        ).values_list("choice_a_id", "choice_b_id", "ballots"):
+            if a in column and b in column:
+                pairs[column[a], column[b]] = pairs[column[b], column[a]] = count
+
+        size_rows = list(
+            ApprovalSizeCount.objects.filter(poll=poll, ballots__gt=0).values_list(
+                "choice_id", "size", "ballots"
+            )
+        )
+        max_size = max([num_choices] + [size for _, size, _ in size_rows])
+        sizes = np.zeros((num_choices, max_size + 1), dtype=np.int64)
+        for choice_id, size, count in size_rows:
+            if choice_id in column:
+                sizes[column[choice_id], size] = count
+
+        return cls(choice_ids, poll.total_ballots(), pairs, sizes)
+
+    @property
+    def num_choices(self):
+        return len(self.choice_ids)
+
+    def approval_counts(self):
+        return self.sizes.sum(axis=1)
+
+    def co_approval_counts(self):
+        counts = self.pairs.copy()
+        np.fill_diagonal(counts, self.approval_counts())
+        return counts
+
+    def approval_distribution(self):
+        # A ballot approving k choices is counted once in each of those k
+        # choices' size-k buckets.
+        distribution = np.zeros(self.sizes.shape[1], dtype=np.int64)
+        distribution[1:] = self.sizes[:, 1:].sum(axis=0) // np.arange(
+            1, self.sizes.shape[1]
+        )
+        distribution[0] = max(self.total_ballots - distribution[1:].sum(), 0)
+        return distribution
+
+    def candidate_approval_distributions(self):
+        return self.sizes
+
+    def anyone_but_counts(self):
+        if not self.num_choices:
+            return np.zeros(0, dtype=np.int64)
+        size = self.num_choices - 1
+        return self.approval_distribution()[size] - self.sizes[:, size]
+
+    def proportional_votes(self):
+        return (self.sizes[:, 1:] / np.arange(1, self.sizes.shape[1])).sum(axis=1)
+
+
+def spav_sweep(poll):
+    """
+    SPAV allocations for every seat count up to SPAV_MAX_SEATS.
+
+    The sweep is cached under the poll's revision, so it is computed once
+    per change to the poll rather than once per visitor or slider position.
+    """
+    return cached_for_revision("spav", poll, lambda: compute_spav_sweep(poll))
+
+
+def compute_spav_sweep(poll):
+    choices = list(poll.choice_set.order_by("id").values("id", "choice_text"))
+    choice_ids = [choice["id"] for choice in choices]
+    winners, scores = BallotMatrix.from_poll(poll, choice_ids).spav(SPAV_MAX_SEATS)
+    return sweep_data(choices, winners, scores)
+
+
+async def aspav_sweep(poll, executor=None):
+    """
+    spav_sweep() for async views. The votes are read in the request's thread
+    and the sweep itself, which can take seconds on a large poll, is run in
+    ``executor``.
+    """
+
+    async def compute():
+        choices = [
+            choice
+            async for choice in poll.choice_set.order_by("id").values(
+                "id", "choice_text"
+            )
+        ]
+        choice_ids = [choice["id"] for choice in choices]
+        matrix = await sync_to_async(BallotMatrix.from_poll)(poll, choice_ids)
+        winners, scores = await asyncio.get_running_loop().run_in_executor(
+            executor, matrix.spav, SPAV_MAX_SEATS
+        )
+        return sweep_data(choices, winners, scores)
+
+    return await acached_for_revision("spav", poll, compute)
+
+
+def compute_snapshot_ballots(poll):
+    """
+    The poll's choices and BallotMatrix.to_data(), for a ResultsSnapshot to
+    serve proportional allocations from without reading the votes.
+    """
+    choices = list(poll.choice_set.order_by("id").values("id", "choice_text"))
+    choice_ids = [choice["id"] for choice in choices]
+    return {
+        "choices": choices,
+        **BallotMatrix.from_poll(poll, choice_ids).to_data(),
+    }
+
+
+async def aproportional_allocation(poll, method, seats, executor=None, snapshot=None):
+    """
+    The choice IDs winning each of `seats` seats under the registered
+    proportional `method`, with the poll's choices, as ``{"choices": [...],
+    "winners": [...]}``. Cached under the poll's revision like
+    aspav_sweep(), and computed in ``executor``.
+
+    Given a ResultsSnapshot, the ballots are read from its
+    compute_snapshot_ballots() data instead, and the allocation cached under
+    its revision.
+    """
+
+    async def compute():
+        if snapshot is None:
+            choices = [
+                choice
+                async for choice in poll.choice_set.order_by("id").values(
+                    "id", "choice_text"
+                )
+            ]
+            choice_ids = [choice["id"] for choice in choices]
+            matrix = await sync_to_async(BallotMatrix.from_poll)(poll, choice_ids)
+        else:
+            choices = snapshot.data["ballots"]["choices"]
+            choice_ids = [choice["id"] for choice in choices]
+            matrix = BallotMatrix.from_data(choice_ids, snapshot.data["ballots"])
+        winners = await asyncio.get_running_loop().run_in_executor(
+            executor, proportional.allocate, method, matrix, seats
+        )
+        return {"choices": choices, "winners": [choice_ids[i] for i in winners]}
+
+    return await acached_for_revision(
+        f"proportional-{method}-{seats}",
+        poll,
+        compute,
+        revision=None if snapshot is None else snapshot.revision,
+    )
+
+
+def sweep_data(choices, winners, scores):
+    choice_ids = [choice["id"] for choice in choices]
+    return {
+        "choices": choices,
+        "winners": [choice_ids[i] for i in winners],
+        "scores": np.round(scores, 6).tolist(),
+    }
@@ -1,13 +1,71 @@
+import csv
 import datetime
+import gzip
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import closing
+from io import StringIO
+from itertools import combinations_with_replacement, permutations
+from unittest import mock
 
 import structlog
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import (
+    IntegrityError,
+    OperationalError,
+    connection,
+    connections,
+    router,
+    transaction,
+)
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from approval_polls.models import Ballot, Choice, Poll, Vote
+from approval_polls import (
+    bitmask,
+    caching,
+    cvr,
+    proportional,
+    ratelimit,
+    replication,
+    sqlite,
+    tagindex,
+)
+from approval_polls.admin import PollAdmin, set_visibility
+from approval_polls.models import (
+    ApprovalSizeCount,
+    Ballot,
+    BallotImport,
+    Choice,
+    Poll,
+    PollTag,
+    QueuedVote,
+    ResultsJob,
+    ResultsSnapshot,
+    TagStats,
+    Vote,
+    VoteToken,
+    activity_exponent,
+)
+from approval_polls.pagination import CursorPaginator
+from approval_polls.tally import BallotMatrix, StoredTally
 
 logger = structlog.get_logger(__name__)
 
@@ -216,6 +274,73 @@ class PollResultsTests(TestCase):
         self.assertContains(response, "1 vote", status_code=200)
 
 
+class TallyEngineTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Tally poll.", vtype=1)
+        self.a = self.poll.choice_set.create(choice_text="A")
+        self.b = self.poll.choice_set.create(choice_text="B")
+        self.c = self.poll.choice_set.create(choice_text="C")
+        for approved in [
+            [self.a, self.b],
+            [self.a, self.b],
+            [self.b, self.c],
+            [self.a],
+            [],
+        ]:
+            ballot = create_ballot(self.poll)
+            for choice in approved:
+                ballot.vote_set.create(choice=choice)
+
+    def test_identical_ballots_are_collapsed(self):
+        matrix = BallotMatrix.from_poll(self.poll)
+        self.assertEqual(matrix.total_ballots, 5)
+        self.assertEqual(len(matrix.weights), 4)
+
+    def test_counts(self):
+        matrix = BallotMatrix.from_poll(self.poll)
+        self.assertEqual(matrix.approval_counts().tolist(), [3, 3, 1])
+        self.assertEqual(
+            matrix.co_approval_counts().tolist(), [[3, 2, 0], [2, 3, 1], [0, 1, 1]]
+        )
+        self.assertEqual(matrix.approval_distribution().tolist(), [1, 1, 3, 0])
+        self.assertEqual(
+            matrix.candidate_approval_distributions().tolist(),
+            [[0, 1, 2, 0], [0, 0, 3, 0], [0, 0, 1, 0]],
+        )
+        self.assertEqual(matrix.anyone_but_counts().tolist(), [1, 0, 2])
+        self.assertEqual(matrix.proportional_votes().tolist(), [2.0, 1.5, 0.5])
+
+    def test_from_ballots_matches_from_poll(self):
+        ids = [self.a.id, self.b.id, self.c.id]
+        ballots = [
+            [self.a.id, self.b.id],
+            [self.b.id, self.a.id],
+            [self.c.id, self.b.id],
+        ]
+        ballots += [[self.a.id], []]
+        matrix = BallotMatrix.from_ballots(ids, ballots)
+        self.assertEqual(
+            matrix.co_approval_counts().tolist(),
+            BallotMatrix.from_poll(self.poll).co_approval_counts().tolist(),
+        )
+
+    def test_results_view_analytics(self):
+        response = self.client.get(reverse("results", args=(self.poll.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [choice["vote_count"] for choice in response.context["choices"]], [3, 3, 1]
+        )
+        self.assertEqual(
+            response.context["voting_patterns"]["approvalDistribution"],
+            {0: 1, 1: 1, 2: 3},
+        )
+        self.assertEqual(
+            response.context["co_approval_matrix"]["A"]["B"]["coApprovalCount"], 2
+        )
+        self.assertEqual(response.context["anyone_but_sorted"], [("C", 2), ("A", 1)])
+        self.assertEqual(response.context["total_proportional_votes"], 4)
+
+
 class PollVoteTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -242,6 +367,1467 @@ class PollVoteTests(TestCase):
         self.assertContains(response, "112", status_code=200)
 
 
+class BallotWriteTests(TestCase):
+    def vote_queries(self, num_choices):
+        poll = create_poll(
+            question="Write poll.", username=f"user{num_choices}", vtype=2
+        )
+        for n in range(num_choices):
+            poll.choice_set.create(choice_text=f"Choice {n}.")
+        self.client.login(username=f"user{num_choices}", password="test")
+        url = reverse("vote", args=(poll.id,))
+        # Swap an existing ballot's odd choices for the even ones
+        self.client.post(url, {f"choice{n}": "" for n in range(1, num_choices + 1, 2)})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(
+                url, {f"choice{n}": "" for n in range(2, num_choices + 1, 2)}
+            )
+        return len(queries)
+
+    def test_query_count_independent_of_choices(self):
+        self.assertEqual(self.vote_queries(3), self.vote_queries(30))
+
+    def test_set_approvals(self):
+        poll = create_poll(question="Set poll.")
+        a, b, c = [poll.choice_set.create(choice_text=t) for t in "ABC"]
+        ballot = create_ballot(poll)
+        ballot.set_approvals([a.id, b.id])
+        ballot.set_approvals([b.id, c.id])
+        self.assertEqual(
+            set(ballot.vote_set.values_list("choice_id", flat=True)), {b.id, c.id}
+        )
+        self.assertEqual(
+            [choice.vote_count for choice in poll.choice_set.order_by("id")],
+            [0, 1, 1],
+        )
+        self.assertEqual(
+            StoredTally.from_poll(poll).co_approval_counts().tolist(),
+            BallotMatrix.from_poll(poll).co_approval_counts().tolist(),
+        )
+
+    def test_set_approvals_rejects_other_polls_choices(self):
+        poll = create_poll(question="Set poll.")
+        other = create_poll(question="Other poll.", username="user2")
+        choice = other.choice_set.create(choice_text="A")
+        with self.assertRaises(ValueError):
+            create_ballot(poll).set_approvals([choice.id])
+
+    def test_write_ins_match_ignoring_case_and_whitespace(self):
+        poll = create_poll(question="Write-in poll.", vtype=2)
+        banana = poll.choice_set.create(choice_text="Banana")
+        self.client.login(username="user1", password="test")
+        self.client.post(
+            reverse("vote", args=(poll.id,)),
+            {
+                "choice2": "",
+                "choice2txt": "  apple   PIE ",
+                "choice3": "",
+                "choice3txt": "Apple pie",
+                "choice4": "",
+                "choice4txt": "banana",
+            },
+        )
+        apple = poll.choice_set.get(write_in_key="apple pie")
+        self.assertEqual(apple.choice_text, "apple PIE")
+        self.assertEqual(poll.choice_set.count(), 2)
+        self.assertEqual(
+            set(poll.ballot_set.get().vote_set.values_list("choice_id", flat=True)),
+            {banana.id, apple.id},
+        )
+        self.assertEqual(poll.resolve_write_ins([("APPLE  pie", "")]), [apple.id])
+
+    def test_write_in_key_is_unique_per_poll(self):
+        poll = create_poll(question="Write-in poll.")
+        poll.choice_set.create(choice_text="A", write_in_key="a")
+        with self.assertRaises(IntegrityError):
+            poll.choice_set.create(choice_text="a", write_in_key="a")
+
+    def test_write_in_query_count_independent_of_write_ins(self):
+        def queries(num_write_ins):
+            poll = create_poll(
+                question="Write-in poll.", username=f"user{num_write_ins}", vtype=2
+            )
+            poll.choice_set.create(choice_text="A")
+            self.client.login(username=f"user{num_write_ins}", password="test")
+            data = {"choice1": ""}
+            for n in range(2, num_write_ins + 2):
+                data[f"choice{n}"] = ""
+                data[f"choice{n}txt"] = f"Write-in {n}"
+            with CaptureQueriesContext(connection) as captured:
+                self.client.post(reverse("vote", args=(poll.id,)), data)
+            return len(captured)
+
+        self.assertEqual(queries(1), queries(10))
+
+
+@override_settings(VOTE_QUEUE=True)
+class VoteQueueTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Queued poll.", vtype=2)
+        self.choice1 = self.poll.choice_set.create(choice_text="Choice 1.")
+        self.choice2 = self.poll.choice_set.create(choice_text="Choice 2.")
+        self.client.login(username="user1", password="test")
+        self.url = reverse("vote", args=(self.poll.id,))
+
+    def write(self):
+        call_command("run_vote_writer", "--once", stdout=StringIO())
+
+    def test_vote_is_recorded_by_writer(self):
+        response = self.client.post(
+            self.url, {"choice1": "", "choice3": "", "choice3txt": "Write-in"}
+        )
+        self.assertRedirects(response, reverse("results", args=(self.poll.id,)))
+        self.assertFalse(self.poll.ballot_set.exists())
+        self.assertEqual(QueuedVote.objects.count(), 1)
+
+        self.write()
+        self.assertFalse(QueuedVote.objects.exists())
+        ballot = self.poll.ballot_set.get()
+        self.assertEqual(ballot.user.username, "user1")
+        self.assertEqual(
+            sorted(ballot.vote_set.values_list("choice__choice_text", flat=True)),
+            ["Choice 1.", "Write-in"],
+        )
+        self.poll.refresh_from_db()
+        self.assertEqual((self.poll.ballot_count, self.poll.vote_count), (1, 2))
+
+    def test_queued_votes_update_ballot_in_order(self):
+        self.client.post(self.url, {"choice1": ""})
+        self.client.post(self.url, {"choice2": ""})
+        self.write()
+        ballot = self.poll.ballot_set.get()
+        self.assertEqual(
+            list(ballot.vote_set.values_list("choice_id", flat=True)),
+            [self.choice2.id],
+        )
+
+    def test_batches_are_one_transaction_each(self):
+        for n in range(5):
+            QueuedVote.objects.create(poll=self.poll, approvals=[self.choice1.id])
+        batch = QueuedVote.record_batch(3)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(QueuedVote.objects.count(), 2)
+        self.assertEqual(self.poll.ballot_set.count(), 3)
+
+    def test_deleted_choices_are_dropped(self):
+        self.client.post(self.url, {"choice1": "", "choice2": ""})
+        self.choice1.delete()
+        self.write()
+        self.assertEqual(
+            list(self.poll.ballot_set.get().vote_set.values_list("choice", flat=True)),
+            [self.choice2.id],
+        )
+
+    def test_failed_vote_does_not_undo_batch(self):
+        QueuedVote.objects.create(poll=self.poll, approvals=[self.choice1.id])
+        QueuedVote.objects.create(poll=self.poll, write_ins=[["No link"]])
+        QueuedVote.objects.create(poll=self.poll, approvals=[self.choice2.id])
+        batch = QueuedVote.record_batch(3)
+        self.assertEqual(
+            [queued.recorded_at is not None for queued in batch], [True, False, True]
+        )
+        self.assertEqual(self.poll.ballot_set.count(), 2)
+
+        # The failed vote stays queued, with its first queued time, until it
+        # is given up on
+        failed = QueuedVote.objects.get()
+        self.assertEqual(failed.pk, batch[1].pk)
+        self.assertEqual(failed.queued_at, batch[1].queued_at)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn("ValueError", failed.last_error)
+        self.write()
+        failed.refresh_from_db()
+        self.assertEqual(failed.attempts, settings.VOTE_QUEUE_MAX_ATTEMPTS)
+        self.assertEqual(QueuedVote.record_batch(3), [])
+
+        out = StringIO()
+        with mock.patch.object(QueuedVote, "record", return_value=True):
+            call_command("run_vote_writer", "--once", "--retry-failed", stdout=out)
+        self.assertIn("Queued 1 failed votes again", out.getvalue())
+        self.assertFalse(QueuedVote.objects.exists())
+
+    def test_failed_batch_stays_queued(self):
+        QueuedVote.objects.create(poll=self.poll, approvals=[self.choice1.id])
+        with mock.patch.object(
+            QueuedVote, "record", side_effect=OperationalError("database is locked")
+        ):
+            with self.assertRaises(OperationalError):
+                QueuedVote.record_batch(3)
+        self.assertEqual(QueuedVote.objects.get().attempts, 0)
+
+    def test_writer_survives_database_errors(self):
+        class Stop(BaseException):
+            pass
+
+        record_batch = mock.patch.object(
+            QueuedVote,
+            "record_batch",
+            side_effect=[OperationalError("database is locked"), [], Stop],
+        )
+        with record_batch as recorded, mock.patch("time.sleep") as sleep:
+            with self.assertRaises(Stop):
+                call_command("run_vote_writer", stdout=StringIO())
+        self.assertEqual(recorded.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+
+class VoteTokenTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Anonymous poll.", vtype=1)
+        self.poll.choice_set.create(choice_text="Choice 1.")
+        self.url = reverse("vote", args=(self.poll.id,))
+
+    def vote(self, token):
+        return self.client.post(self.url, {"choice1": "", "vote_token": token})
+
+    def test_detail_renders_token(self):
+        response = self.client.get(reverse("detail", args=(self.poll.id,)))
+        self.assertEqual(len(response.context["vote_token"]), 32)
+        self.assertContains(response, response.context["vote_token"])
+
+    def test_resubmitted_vote_is_recorded_once(self):
+        token = uuid.uuid4().hex
+        self.vote(token)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.vote(token)
+        self.assertRedirects(response, reverse("results", args=(self.poll.id,)))
+        self.assertEqual(self.poll.ballot_set.count(), 1)
+        self.assertFalse(any("approval_polls_ballot" in q["sql"] for q in queries))
+        self.vote(uuid.uuid4().hex)
+        self.assertEqual(self.poll.ballot_set.count(), 2)
+
+    def test_votes_without_token_are_recorded(self):
+        self.vote("")
+        self.vote("not-a-token")
+        self.assertEqual(self.poll.ballot_set.count(), 2)
+
+    @override_settings(VOTE_QUEUE=True)
+    def test_resubmitted_vote_is_queued_once(self):
+        token = uuid.uuid4().hex
+        self.vote(token)
+        self.vote(token)
+        self.assertEqual(QueuedVote.objects.count(), 1)
+
+    def test_purge_vote_tokens(self):
+        VoteToken.use(uuid.uuid4(), self.poll)
+        VoteToken.use(uuid.uuid4(), self.poll)
+        VoteToken.objects.filter(
+            key__in=VoteToken.objects.values_list("key", flat=True)[:1]
+        ).update(used_at=timezone.now() - datetime.timedelta(days=2))
+        out = StringIO()
+        call_command("purge_vote_tokens", "--batch-size", "1", stdout=out)
+        self.assertIn("Deleted 1 expired", out.getvalue())
+        self.assertEqual(VoteToken.objects.count(), 1)
+
+
+class TallyCounterTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Counter poll.", vtype=2)
+        self.choice1 = self.poll.choice_set.create(choice_text="Choice 1.")
+        self.choice2 = self.poll.choice_set.create(choice_text="Choice 2.")
+        self.client.login(username="user1", password="test")
+
+    def assertCounters(self, ballots, votes, choice_votes):
+        self.poll.refresh_from_db()
+        self.assertEqual(self.poll.total_ballots(), ballots)
+        self.assertEqual(self.poll.total_votes, votes)
+        self.assertEqual(
+            [c.vote_count for c in self.poll.choice_set.order_by("id")], choice_votes
+        )
+
+    def test_vote_updates_counters(self):
+        self.client.post(
+            reverse("vote", args=(self.poll.id,)), {"choice1": "", "choice2": ""}
+        )
+        self.assertCounters(1, 2, [1, 1])
+
+    def test_updated_vote_updates_counters(self):
+        url = reverse("vote", args=(self.poll.id,))
+        self.client.post(url, {"choice1": "", "choice2": ""})
+        self.client.post(url, {"choice2": ""})
+        self.assertCounters(1, 1, [0, 1])
+
+    def test_write_in_updates_counters(self):
+        self.client.post(
+            reverse("vote", args=(self.poll.id,)),
+            {"choice1": "", "choice3": "on", "choice3txt": "Write-in"},
+        )
+        self.assertCounters(1, 2, [1, 0, 1])
+
+    def test_ballot_delete_updates_counters(self):
+        ballot = create_ballot(self.poll)
+        ballot.vote_set.create(choice=self.choice1)
+        ballot.delete()
+        self.assertCounters(0, 0, [0, 0])
+
+    def test_cascaded_deletes_update_counters(self):
+        voter = User.objects.create_user("voter", "voter@example.com", "test")
+        both = [self.choice1.id, self.choice2.id]
+        self.poll.ballot_set.create(user=voter).set_approvals(both)
+        create_ballot(self.poll).set_approvals(both)
+        create_ballot(self.poll).set_approvals([self.choice2.id])
+        self.assertCounters(3, 5, [2, 3])
+
+        voter.delete()
+        self.assertCounters(2, 3, [1, 2])
+        self.poll.ballot_set.filter(vote__choice=self.choice1).delete()
+        self.assertCounters(1, 1, [0, 1])
+        call_command("rebuild_tallies", "--verify", stdout=StringIO())
+
+        # Deleting the poll's owner deletes the poll, counters and all
+        self.poll.user.delete()
+        self.assertFalse(Poll.objects.exists())
+
+    def test_rebuild_tallies(self):
+        create_ballot(self.poll).vote_set.create(choice=self.choice2)
+        Poll.objects.filter(pk=self.poll.pk).update(ballot_count=5)
+        Choice.objects.filter(pk=self.choice2.pk).update(vote_count=0)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_tallies", "--verify", stdout=StringIO())
+        revision = Poll.objects.get(pk=self.poll.pk).revision
+        call_command("rebuild_tallies", stdout=StringIO())
+        self.assertCounters(1, 1, [0, 1])
+        call_command("rebuild_tallies", "--verify", stdout=StringIO())
+        # Cached results of the poll are recomputed, but only once
+        self.assertEqual(Poll.objects.get(pk=self.poll.pk).revision, revision + 1)
+        call_command("rebuild_tallies", stdout=StringIO())
+        self.assertEqual(Poll.objects.get(pk=self.poll.pk).revision, revision + 1)
+
+
+class StoredTallyTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Stored poll.", vtype=2)
+        self.choices = [
+            self.poll.choice_set.create(choice_text=f"Choice {n}.") for n in range(4)
+        ]
+        self.client.login(username="user1", password="test")
+
+    def vote(self, *choice_numbers):
+        self.client.post(
+            reverse("vote", args=(self.poll.id,)),
+            {f"choice{n}": "" for n in choice_numbers},
+        )
+
+    def assertMatchesVotes(self):
+        stored = StoredTally.from_poll(self.poll)
+        counted = BallotMatrix.from_poll(self.poll)
+        self.assertEqual(
+            stored.co_approval_counts().tolist(),
+            counted.co_approval_counts().tolist(),
+        )
+        self.assertEqual(
+            stored.approval_distribution().tolist(),
+            counted.approval_distribution().tolist(),
+        )
+        self.assertEqual(
+            stored.candidate_approval_distributions().tolist(),
+            counted.candidate_approval_distributions().tolist(),
+        )
+        self.assertEqual(
+            stored.anyone_but_counts().tolist(), counted.anyone_but_counts().tolist()
+        )
+        self.assertEqual(
+            stored.proportional_votes().tolist(),
+            counted.proportional_votes().tolist(),
+        )
+
+    def test_counts_follow_changed_ballots(self):
+        self.vote(1, 2, 3)
+        self.assertMatchesVotes()
+        self.vote(2, 4)
+        self.assertMatchesVotes()
+        self.vote()
+        self.assertMatchesVotes()
+
+    def test_counts_follow_direct_writes(self):
+        other = create_ballot(self.poll)
+        for choice in self.choices[:3]:
+            other.vote_set.create(choice=choice)
+        create_ballot(self.poll)
+        self.assertMatchesVotes()
+        other.vote_set.get(choice=self.choices[0]).delete()
+        self.assertMatchesVotes()
+        other.delete()
+        self.assertMatchesVotes()
+
+    def test_counts_follow_deleted_choices(self):
+        self.poll.choice_set.create(choice_text="Choice 4.")
+        for approved in [(1, 2, 3), (1, 3), (2, 3, 4, 5), (3,), (1, 5)]:
+            ballot = create_ballot(self.poll)
+            ballot.set_approvals(
+                [self.choices[n - 1].id for n in approved if n <= 4]
+                + ([self.poll.choice_set.last().id] if 5 in approved else [])
+            )
+
+        self.poll.delete_choices([self.choices[2].id])
+        self.assertMatchesVotes()
+        self.assertEqual(self.poll.total_votes, 8)
+        # Several choices in one delete, as well as one at a time
+        Choice.objects.filter(id__in=[self.choices[0].id, self.choices[3].id]).delete()
+        self.assertMatchesVotes()
+        self.choices[1].delete()
+        self.assertMatchesVotes()
+        call_command("rebuild_tallies", "--verify", stdout=StringIO())
+
+        # Later votes find the buckets where they left them
+        ballot = self.poll.ballot_set.first()
+        ballot.set_approvals([])
+        self.assertMatchesVotes()
+        self.assertFalse(ApprovalSizeCount.objects.filter(ballots__lt=0).exists())
+
+    def test_rebuild_tallies_restores_counts(self):
+        self.vote(1, 2)
+        ApprovalSizeCount.objects.filter(poll=self.poll).delete()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_tallies", "--verify", stdout=StringIO())
+        call_command("rebuild_tallies", stdout=StringIO())
+        self.assertMatchesVotes()
+
+
+class SpavTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="SPAV poll.")
+        self.a, self.b, self.c = [
+            self.poll.choice_set.create(choice_text=text) for text in "ABC"
+        ]
+        for approved in [[self.a], [self.a], [self.a, self.b], [self.c], [self.c], []]:
+            ballot = create_ballot(self.poll)
+            for choice in approved:
+                ballot.vote_set.create(choice=choice)
+
+    def spav(self, seats):
+        response = self.client.get(
+            reverse("spav", args=(self.poll.id,)), {"seats": seats}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def naive_spav(self, ballots, seats):
+        won = [0] * len(ballots)
+        winners = []
+        for _ in range(seats):
+            scores = Counter()
+            for approved, count in zip(ballots, won):
+                for choice_id in approved:
+                    scores[choice_id] += 1 / (1 + count)
+            winner = max(sorted(scores), key=lambda choice_id: scores[choice_id])
+            winners.append(winner)
+            won = [
+                count + (winner in approved) for approved, count in zip(ballots, won)
+            ]
+        return winners
+
+    def test_engine_matches_reference(self):
+        rng = random.Random(4)
+        choice_ids = list(range(1, 7))
+        ballots = [
+            {choice_id for choice_id in choice_ids if rng.random() < 0.4}
+            for _ in range(300)
+        ]
+        matrix = BallotMatrix.from_ballots(choice_ids, ballots)
+        winners, _ = matrix.spav(12)
+        self.assertEqual([choice_ids[i] for i in winners], self.naive_spav(ballots, 12))
+
+    def test_allocation(self):
+        data = self.spav(3)
+        self.assertEqual(
+            [(choice["choice_text"], choice["seats"]) for choice in data["choices"]],
+            [("A", 2), ("B", 0), ("C", 1)],
+        )
+        self.assertEqual(
+            [round["winner"] for round in data["rounds"]],
+            [self.a.id, self.c.id, self.a.id],
+        )
+        self.assertEqual(data["rounds"][1]["scores"], [1.5, 0.5, 2.0])
+
+    def test_sweep_cached_until_poll_changes(self):
+        self.spav(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.spav(5)["seats"], 5)
+        create_ballot(self.poll).vote_set.create(choice=self.c)
+        self.assertEqual(self.spav(1)["rounds"][0]["scores"], [3.0, 1.0, 3.0])
+
+    def test_invalid_seats(self):
+        url = reverse("spav", args=(self.poll.id,))
+        for seats in ["", "0", "abc", "101"]:
+            response = self.client.get(url, {"seats": seats})
+            self.assertEqual(response.status_code, 400)
+
+    def test_private_poll(self):
+        self.poll.is_private = True
+        self.poll.save()
+        response = self.client.get(reverse("spav", args=(self.poll.id,)), {"seats": 1})
+        self.assertEqual(response.status_code, 401)
+
+
+class ProportionalMethodTests(TestCase):
+    """
+    Check each vectorized method against a per-ballot reference on random
+    elections.
+    """
+
+    def elections(self, count=20):
+        rng = random.Random(7)
+        for _ in range(count):
+            choice_ids = list(range(1, rng.randint(2, 6) + 1))
+            ballots = [
+                {choice_id for choice_id in choice_ids if rng.random() < 0.4}
+                for _ in range(rng.randint(1, 60))
+            ]
+            yield choice_ids, ballots, rng.randint(1, 5)
+
+    def naive_phragmen(self, choice_ids, ballots, seats):
+        loads = [0.0] * len(ballots)
+        winners = []
+        for _ in range(seats):
+            best, best_load = choice_ids[0], float("inf")
+            for choice_id in choice_ids:
+                approvers = [i for i, b in enumerate(ballots) if choice_id in b]
+                if approvers:
+                    load = (1 + sum(loads[i] for i in approvers)) / len(approvers)
+                    if load < best_load:
+                        best, best_load = choice_id, load
+            for i, ballot in enumerate(ballots):
+                if best in ballot and best_load < float("inf"):
+                    loads[i] = best_load
+            winners.append(best)
+        return winners
+
+    def naive_allocated(self, choice_ids, ballots, seats):
+        weights = [1.0] * len(ballots)
+        quota = len(ballots) / seats
+        winners = []
+        for _ in range(seats):
+            support = {
+                choice_id: sum(w for w, b in zip(weights, ballots) if choice_id in b)
+                for choice_id in choice_ids
+            }
+            best = max(choice_ids, key=lambda choice_id: support[choice_id])
+            for i, ballot in enumerate(ballots):
+                if best in ballot:
+                    if support[best] > quota:
+                        weights[i] *= 1 - quota / support[best]
+                    else:
+                        weights[i] = 0
+            winners.append(best)
+        return winners
+
+    def naive_pav_score(self, ballots, committee):
+        return sum(
+            sum(1 / n for n in range(1, sum(c in b for c in committee) + 1))
+            for b in ballots
+        )
+
+    def allocate(self, method, choice_ids, ballots, seats):
+        matrix = BallotMatrix.from_ballots(choice_ids, ballots)
+        winners = proportional.allocate(method, matrix, seats)
+        return [choice_ids[i] for i in winners]
+
+    def test_phragmen(self):
+        for choice_ids, ballots, seats in self.elections():
+            self.assertEqual(
+                self.allocate("phragmen", choice_ids, ballots, seats),
+                self.naive_phragmen(choice_ids, ballots, seats),
+            )
+
+    def test_allocated(self):
+        for choice_ids, ballots, seats in self.elections():
+            self.assertEqual(
+                self.allocate("allocated", choice_ids, ballots, seats),
+                self.naive_allocated(choice_ids, ballots, seats),
+            )
+
+    def test_pav_is_optimal(self):
+        for choice_ids, ballots, seats in self.elections():
+            best = max(
+                self.naive_pav_score(ballots, committee)
+                for committee in combinations_with_replacement(choice_ids, seats)
+            )
+            committee = self.allocate("pav", choice_ids, ballots, seats)
+            self.assertEqual(len(committee), seats)
+            self.assertAlmostEqual(self.naive_pav_score(ballots, committee), best)
+
+    def test_pav_local_search(self):
+        for choice_ids, ballots, seats in self.elections():
+            matrix = BallotMatrix.from_ballots(choice_ids, ballots)
+            spav_counts = proportional.seat_counts(
+                proportional.allocate("spav", matrix, seats), len(choice_ids)
+            )
+            with mock.patch.object(proportional, "PAV_EXACT_CELLS", 0):
+                winners = proportional.allocate("pav", matrix, seats)
+            counts = proportional.seat_counts(winners, len(choice_ids))
+            self.assertEqual(counts.sum(), seats)
+            self.assertGreaterEqual(
+                proportional.pav_score(matrix, counts) + 1e-9,
+                proportional.pav_score(matrix, spav_counts),
+            )
+            # No single seat moved to another choice improves the score.
+            for i, j in permutations(range(len(choice_ids)), 2):
+                if counts[i]:
+                    moved = counts.copy()
+                    moved[i] -= 1
+                    moved[j] += 1
+                    self.assertLessEqual(
+                        proportional.pav_score(matrix, moved),
+                        proportional.pav_score(matrix, counts) + 1e-9,
+                    )
+
+    def test_unknown_method(self):
+        matrix = BallotMatrix.from_ballots([1, 2], [{1}])
+        with self.assertRaises(ValueError):
+            proportional.allocate("borda", matrix, 1)
+
+
+class ResultsCacheTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Cached poll.")
+        self.choice = self.poll.choice_set.create(choice_text="A")
+        create_ballot(self.poll).vote_set.create(choice=self.choice)
+        self.url = reverse("results", args=(self.poll.id,))
+
+    def test_results_cached_until_next_vote(self):
+        caching.stats.clear()
+        self.client.get(self.url)
+        # The conditional GET check, then the poll itself
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["choices"][0]["vote_count"], 1)
+        self.assertEqual(caching.cache_stats()["results"], {"hits": 1, "misses": 1})
+
+        create_ballot(self.poll).vote_set.create(choice=self.choice)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["choices"][0]["vote_count"], 2)
+        self.assertEqual(caching.cache_stats()["results"], {"hits": 1, "misses": 2})
+
+    def test_revision_bumped_by_writes(self):
+        revision = Poll.objects.get(id=self.poll.id).revision
+        ballot = create_ballot(self.poll)
+        ballot.vote_set.create(choice=self.choice)
+        self.poll.add_choices([0], {0: "B"}, {0: ""})
+        self.assertEqual(Poll.objects.get(id=self.poll.id).revision, revision + 3)
+
+    def test_cache_stats_requires_staff(self):
+        response = self.client.get(reverse("cache_stats"))
+        self.assertEqual(response.status_code, 302)
+        User.objects.create_user("staff", "staff@example.com", "test", is_staff=True)
+        self.client.login(username="staff", password="test")
+        response = self.client.get(reverse("cache_stats"))
+        self.assertIn("caches", response.json())
+
+
+class RawBallotsTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Raw poll.")
+        self.a, self.b = [self.poll.choice_set.create(choice_text=t) for t in "AB"]
+        self.expected = [[self.a.id, self.b.id], [], [self.b.id]]
+        for approved in self.expected:
+            ballot = create_ballot(self.poll)
+            for choice_id in approved:
+                ballot.vote_set.create(choice_id=choice_id)
+        self.url = reverse("raw", args=(self.poll.id,))
+
+    def test_json(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["ballots"], self.expected)
+        self.assertEqual(
+            data["choices"],
+            [
+                {"id": self.a.id, "choice_text": "A"},
+                {"id": self.b.id, "choice_text": "B"},
+            ],
+        )
+
+    def test_ndjson(self):
+        response = self.client.get(self.url, {"format": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(json.loads(lines[0])["choices"]), 2)
+        self.assertEqual([json.loads(line) for line in lines[1:]], self.expected)
+
+    def test_bitmask(self):
+        response = self.client.get(self.url, {"format": "bitmask"})
+        self.assertEqual(response["Content-Type"], bitmask.CONTENT_TYPE)
+        choices, ballots = bitmask.decode(b"".join(response.streaming_content))
+        self.assertEqual([choice["choice_text"] for choice in choices], ["A", "B"])
+        self.assertEqual(ballots, self.expected)
+
+    def test_bitmask_choice_added_while_streaming(self):
+        response = self.client.get(self.url, {"format": "bitmask"})
+        # The choices are read before the ballots are streamed
+        c = self.poll.choice_set.create(choice_text="C")
+        create_ballot(self.poll).vote_set.create(choice=c)
+        choices, ballots = bitmask.decode(b"".join(response.streaming_content))
+        self.assertEqual(len(choices), 2)
+        self.assertEqual(ballots, self.expected + [[]])
+
+    def test_format_from_accept_header(self):
+        response = self.client.get(self.url, HTTP_ACCEPT=bitmask.CONTENT_TYPE)
+        self.assertEqual(response["Content-Type"], bitmask.CONTENT_TYPE)
+        self.assertIn("Accept", response["Vary"])
+        response = self.client.get(self.url, HTTP_ACCEPT="*/*")
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        data = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(data["ballots"], self.expected)
+
+    def test_single_ballot_query(self):
+        for _ in range(20):
+            create_ballot(self.poll).vote_set.create(choice=self.a)
+        response = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(data["ballots"]), 23)
+
+
+@override_settings(
+    RATE_LIMITS={"raw": {"burst": 2, "rate": 0.5}, "vote": {"burst": 1, "rate": 0.1}}
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Limited poll.", vtype=1)
+        self.poll.choice_set.create(choice_text="A")
+        self.url = reverse("raw", args=(self.poll.id,))
+
+    def test_empty_bucket_gets_429(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(response["Retry-After"], ("1", "2"))
+        # Other clients have their own buckets
+        response = self.client.get(self.url, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_buckets_refill(self):
+        with mock.patch("approval_polls.ratelimit.time.monotonic") as monotonic:
+            monotonic.return_value = 1000.0
+            for _ in range(2):
+                self.client.get(self.url)
+            self.assertEqual(self.client.get(self.url).status_code, 429)
+            monotonic.return_value = 1002.0
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_votes_limited_per_poll(self):
+        other = create_poll(question="Other poll.", username="user2", vtype=1)
+        other.choice_set.create(choice_text="A")
+        self.client.post(reverse("vote", args=(self.poll.id,)), {"choice1": ""})
+        response = self.client.post(
+            reverse("vote", args=(self.poll.id,)), {"choice1": ""}, follow=True
+        )
+        # Back to the form, with a message rather than a bare error
+        self.assertRedirects(response, reverse("detail", args=(self.poll.id,)))
+        self.assertContains(response, "Please try again in 10 seconds.")
+        self.assertEqual(self.poll.ballot_set.count(), 1)
+        response = self.client.post(reverse("vote", args=(other.id,)), {"choice1": ""})
+        self.assertRedirects(
+            response,
+            reverse("results", args=(other.id,)),
+            fetch_redirect_response=False,
+        )
+
+    def test_logged_in_votes_limited_per_user(self):
+        self.client.post(reverse("vote", args=(self.poll.id,)), {"choice1": ""})
+        # Another voter behind the same address
+        self.client.login(username="user1", password="test")
+        response = self.client.post(
+            reverse("vote", args=(self.poll.id,)), {"choice1": ""}
+        )
+        self.assertRedirects(
+            response,
+            reverse("results", args=(self.poll.id,)),
+            fetch_redirect_response=False,
+        )
+
+    @override_settings(RATE_LIMITS={"results": {"burst": 1, "rate": 0.1}})
+    def test_analytics_share_results_bucket(self):
+        spav = reverse("spav", args=(self.poll.id,))
+        response = self.client.get(spav, {"seats": 1})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse("proportional", args=(self.poll.id,)),
+            {"method": "pav", "seats": 1},
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.get(spav, {"seats": 1}).status_code, 429)
+
+    @override_settings(RATE_LIMIT_SYNC_INTERVAL=0)
+    def test_requests_of_other_processes_count(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Another worker lets one request through for the same client
+        ratelimit.add("ratelimit:raw:127.0.0.1", 1, 60)
+        self.assertEqual(self.client.get(self.url).status_code, 429)
+
+    def test_shared_counters_are_atomic(self):
+        def count():
+            for _ in range(200):
+                ratelimit.add("ratelimit:test:atomic", 1, 60)
+
+        start = ratelimit.add("ratelimit:test:atomic", 0, 60)
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(ratelimit.add("ratelimit:test:atomic", 0, 60), start + 800)
+
+    def test_expired_counters_start_again(self):
+        ratelimit.add("ratelimit:test:expired", 5, -1)
+        self.assertEqual(ratelimit.add("ratelimit:test:expired", 1, 60), 1)
+        ratelimit.add("ratelimit:test:expiring", 1, -1)
+        self.assertGreaterEqual(ratelimit.purge(), 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Conditional poll.")
+        self.choice = self.poll.choice_set.create(choice_text="A")
+
+    def assertRevalidates(self, url, **headers):
+        # The first response may set the CSRF cookie, which the ETag covers
+        self.client.get(url, **headers)
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+
+        create_ballot(self.poll).vote_set.create(choice=self.choice)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_results(self):
+        self.assertRevalidates(reverse("results", args=(self.poll.id,)))
+
+    def test_detail(self):
+        self.assertRevalidates(reverse("detail", args=(self.poll.id,)))
+
+    def test_raw(self):
+        url = reverse("raw", args=(self.poll.id,))
+        self.assertRevalidates(url)
+        json_etag = self.client.get(url)["ETag"]
+        self.assertNotEqual(
+            self.client.get(url, {"format": "ndjson"})["ETag"], json_etag
+        )
+
+    def test_denied_users_do_not_revalidate(self):
+        poll = create_poll("Private poll.", username="owner", is_private=True)
+        url = reverse("raw", args=(poll.id,))
+        self.client.login(username="owner", password="test")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.logout()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 401)
+        self.client.login(username="user1", password="test")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 403)
+
+    def test_etag_depends_on_user(self):
+        url = reverse("results", args=(self.poll.id,))
+        etag = self.client.get(url)["ETag"]
+        self.client.login(username="user1", password="test")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_settings_change_revalidates(self):
+        url = reverse("detail", args=(self.poll.id,))
+        etag = self.client.get(url)["ETag"]
+        self.poll.is_suspended = True
+        self.poll.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_control(self):
+        url = reverse("results", args=(self.poll.id,))
+        self.assertIn("no-cache", self.client.get(url)["Cache-Control"])
+        self.poll.close_date = timezone.now() - datetime.timedelta(days=1)
+        self.poll.save()
+        self.assertIn("max-age=86400", self.client.get(url)["Cache-Control"])
+
+    def test_save_keeps_counters(self):
+        stale = Poll.objects.get(id=self.poll.id)
+        create_ballot(self.poll).vote_set.create(choice=self.choice)
+        stale.is_suspended = True
+        stale.save()
+        poll = Poll.objects.get(id=self.poll.id)
+        self.assertEqual((poll.ballot_count, poll.vote_count), (1, 1))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Async poll.")
+        self.a, self.b = [self.poll.choice_set.create(choice_text=t) for t in "AB"]
+        self.expected = [[self.a.id, self.b.id], [self.b.id], [self.b.id]]
+        for approved in self.expected:
+            ballot = create_ballot(self.poll)
+            for choice_id in approved:
+                ballot.vote_set.create(choice_id=choice_id)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_runs_on_event_loop(self):
+        # Django logs every sync-only middleware it has to run in a thread
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+    async def test_raw_ballots_stream_asynchronously(self):
+        response = await self.async_client.get(
+            reverse("raw", args=(self.poll.id,)), {"format": "ndjson"}
+        )
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        lines = content.decode().splitlines()
+        self.assertEqual(len(json.loads(lines[0])["choices"]), 2)
+        self.assertEqual([json.loads(line) for line in lines[1:]], self.expected)
+
+    async def test_raw_ballots_revalidate(self):
+        url = reverse("raw", args=(self.poll.id,))
+        etag = (await self.async_client.get(url))["ETag"]
+        response = await self.async_client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_spav_runs_sweep_in_analytics_thread(self):
+        threads = []
+        spav = BallotMatrix.spav
+
+        def recording_spav(matrix, seats):
+            threads.append(threading.current_thread().name)
+            return spav(matrix, seats)
+
+        with mock.patch.object(BallotMatrix, "spav", recording_spav):
+            response = await self.async_client.get(
+                reverse("spav", args=(self.poll.id,)), {"seats": 2}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [round["winner"] for round in response.json()["rounds"]],
+            [self.b.id, self.b.id],
+        )
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("analytics"))
+
+    async def test_proportional_methods(self):
+        url = reverse("proportional", args=(self.poll.id,))
+        for method in proportional.METHODS:
+            with self.subTest(method):
+                response = await self.async_client.get(
+                    url, {"method": method, "seats": 2}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["winners"], [self.b.id, self.b.id])
+                self.assertEqual(
+                    [choice["seats"] for choice in response.json()["choices"]],
+                    [0, 2],
+                )
+        response = await self.async_client.get(url, {"method": "dhondt", "seats": 2})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(url, {"method": "pav", "seats": 0})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_embed_instructions(self):
+        response = await self.async_client.get(
+            reverse("embed_instructions", args=(self.poll.id,))
+        )
+        self.assertContains(response, f"http://testserver/{self.poll.id}")
+
+
+@override_settings(REPLICA_DATABASE="replica", REPLICA_MAX_WAIT=0)
+class ReplicationTests(SimpleTestCase):
+    def serve(self, method="get", cookie=None, write=False):
+        """Run a request through the middleware, returning the alias it read."""
+        seen = {}
+
+        def view(request):
+            seen["read"] = router.db_for_read(Poll)
+            if write:
+                router.db_for_write(Poll)
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)("/")
+        if cookie is not None:
+            request.COOKIES[replication.POSITION_COOKIE] = str(cookie)
+        response = replication.ReplicaMiddleware(view)(request)
+        replication.end_request()
+        return seen.get("read"), response
+
+    def positions(self, default, replica):
+        return mock.patch.object(
+            replication,
+            "position",
+            lambda alias: {"default": default, "replica": replica}[alias],
+        )
+
+    def test_reads_go_to_replica(self):
+        with self.positions(5, 5):
+            self.assertEqual(self.serve()[0], "replica")
+
+    def test_unsafe_requests_use_primary_and_set_position(self):
+        with self.positions(7, 5):
+            read, response = self.serve("post", write=True)
+        self.assertEqual(read, "default")
+        self.assertEqual(response.cookies[replication.POSITION_COOKIE].value, "7")
+        self.assertEqual(router.db_for_write(Poll), "default")
+
+    def test_lagging_replica_reads_own_writes_from_primary(self):
+        with self.positions(7, 5):
+            read, response = self.serve(cookie=7)
+        self.assertEqual(read, "default")
+        self.assertNotIn(replication.POSITION_COOKIE, response.cookies)
+
+        with self.positions(7, 7):
+            read, response = self.serve(cookie=7)
+        self.assertEqual(read, "replica")
+        self.assertEqual(response.cookies[replication.POSITION_COOKIE].value, "")
+
+    async def test_async_requests(self):
+        async def view(request):
+            read = router.db_for_read(Poll)
+            router.db_for_write(Poll)
+            return HttpResponse(read)
+
+        middleware = replication.ReplicaMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get("/")
+        request.COOKIES[replication.POSITION_COOKIE] = "7"
+        with self.positions(8, 7):
+            response = await middleware(request)
+        replication.end_request()
+        self.assertEqual(response.content, b"replica")
+        self.assertEqual(response.cookies[replication.POSITION_COOKIE].value, "8")
+
+    def test_outside_requests_use_default(self):
+        self.assertEqual(router.db_for_read(Poll), "default")
+
+    def test_litefs_replica_replays_writes_on_primary(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".primary") as primary:
+            primary.write("machine-1\n")
+            primary.flush()
+            with override_settings(LITEFS_PRIMARY_FILE=primary.name):
+                read, response = self.serve("post")
+        self.assertIsNone(read)
+        self.assertEqual(response["fly-replay"], "instance=machine-1")
+
+    def test_reads_after_a_write_go_to_primary(self):
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Poll))
+            router.db_for_write(Poll)
+            reads.append(router.db_for_read(Poll))
+            return HttpResponse()
+
+        with self.positions(5, 5):
+            replication.ReplicaMiddleware(view)(RequestFactory().get("/"))
+        replication.end_request()
+        self.assertEqual(reads, ["replica", "default"])
+
+    def test_litefs_replica_replays_lagging_reads_on_primary(self):
+        primary = mock.patch.object(
+            replication, "litefs_primary", return_value="machine-1"
+        )
+        with primary, self.positions(7, 5):
+            read, response = self.serve(cookie=7)
+        self.assertIsNone(read)
+        self.assertEqual(response["fly-replay"], "instance=machine-1")
+
+    def test_litefs_replica_replays_reads_that_write_on_primary(self):
+        def writes_in_view(request):
+            try:
+                router.db_for_write(Poll)
+            except replication.ReplayOnPrimary as error:
+                return middleware.process_exception(request, error)
+            return HttpResponse()
+
+        def writes_after_view(request):
+            # Like saving the session, where the error becomes a server error
+            with self.assertRaises(replication.ReplayOnPrimary):
+                router.db_for_write(Poll)
+            return HttpResponse(status=500)
+
+        primary = mock.patch.object(
+            replication, "litefs_primary", return_value="machine-1"
+        )
+        for view in (writes_in_view, writes_after_view):
+            middleware = replication.ReplicaMiddleware(view)
+            with self.subTest(view.__name__), primary, self.positions(5, 5):
+                response = middleware(RequestFactory().get("/"))
+                replication.end_request()
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response["fly-replay"], "instance=machine-1")
+
+    def test_simulated_replication(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = f"{directory}/primary.db", f"{directory}/replica.db"
+            with closing(sqlite3.connect(primary)) as db, db:
+                db.execute("CREATE TABLE t (x)")
+                db.execute("INSERT INTO t VALUES (1)")
+            paths = {"default": primary, "replica": replica}
+            with mock.patch.object(replication, "database_path", paths.get):
+                self.assertLess(
+                    replication.position("replica"), replication.position("default")
+                )
+                replication.replicate(primary, replica)
+                self.assertEqual(
+                    replication.position("replica"), replication.position("default")
+                )
+            with closing(sqlite3.connect(replica)) as db:
+                self.assertEqual(db.execute("SELECT x FROM t").fetchall(), [(1,)])
+
+
+class SqliteTuningTests(TestCase):
+    def test_pragmas_set_on_new_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, "NAME": f"{directory}/tuned.sqlite3"},
+                alias="tuned",
+            )
+            try:
+                wrapper.ensure_connection()
+                self.assertEqual(sqlite.pragma(wrapper, "journal_mode"), "wal")
+                self.assertEqual(sqlite.pragma(wrapper, "synchronous"), 1)
+                self.assertEqual(
+                    sqlite.pragma(wrapper, "busy_timeout"),
+                    settings.SQLITE_PRAGMAS["busy_timeout"],
+                )
+                self.assertEqual(
+                    sqlite.pragma(wrapper, "cache_size"),
+                    settings.SQLITE_PRAGMAS["cache_size"],
+                )
+                self.assertEqual(sqlite.pragma(wrapper, "temp_store"), 2)
+            finally:
+                wrapper.close()
+
+    def test_only_write_transactions_take_the_write_lock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, "NAME": f"{directory}/tuned.sqlite3"},
+                alias="tuned",
+            )
+            connections["tuned"] = wrapper
+            try:
+                with CaptureQueriesContext(wrapper) as context:
+                    with transaction.atomic(using="tuned"):
+                        sqlite.pragma(wrapper, "user_version")
+                    with sqlite.write_transaction(using="tuned"):
+                        with sqlite.write_transaction(using="tuned"):
+                            sqlite.pragma(wrapper, "user_version")
+                    with transaction.atomic(using="tuned"):
+                        sqlite.pragma(wrapper, "user_version")
+                begins = [
+                    query["sql"]
+                    for query in context.captured_queries
+                    if query["sql"].startswith("BEGIN")
+                ]
+                self.assertEqual(begins, ["BEGIN", "BEGIN IMMEDIATE", "BEGIN"])
+            finally:
+                wrapper.close()
+                del connections["tuned"]
+
+    def test_optimize_database(self):
+        out = StringIO()
+        call_command("optimize_database", "--analyze", stdout=out)
+        self.assertIn("Analyzed in", out.getvalue())
+
+
+@override_settings(RESULTS_JOB_MIN_BALLOTS=2)
+class ResultsJobTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Large poll.")
+        self.a, self.b = [self.poll.choice_set.create(choice_text=t) for t in "AB"]
+        for approved in [[self.a], [self.a, self.b]]:
+            ballot = create_ballot(self.poll)
+            for choice in approved:
+                ballot.vote_set.create(choice=choice)
+        self.url = reverse("results", args=(self.poll.id,))
+
+    def run_worker(self):
+        call_command("run_results_worker", "--once", stdout=StringIO())
+
+    def test_results_page_queues_job(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["choices"][0]["vote_count"], 2)
+        self.assertNotIn("results_computed_at", response.context)
+        self.assertEqual(ResultsJob.objects.count(), 1)
+        # Later views find the job queued without writing
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        self.assertEqual(ResultsJob.objects.count(), 1)
+        self.assertFalse(
+            [
+                q
+                for q in context.captured_queries
+                if "resultsjob" in q["sql"].lower()
+                and not q["sql"].startswith("SELECT")
+            ]
+        )
+
+    def test_worker_computes_snapshot(self):
+        self.client.get(self.url)
+        self.run_worker()
+        self.assertFalse(ResultsJob.objects.exists())
+        snapshot = ResultsSnapshot.objects.get(poll=self.poll)
+        self.assertEqual(snapshot.revision, Poll.objects.get(id=self.poll.id).revision)
+
+        response = self.client.get(self.url)
+        self.assertContains(response, "Results computed")
+        self.assertEqual(response.context["total_proportional_votes"], 2)
+        self.assertFalse(ResultsJob.objects.exists())
+
+        create_ballot(self.poll).vote_set.create(choice=self.b)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["choices"][0]["vote_count"], 2)
+        self.assertTrue(ResultsJob.objects.filter(poll=self.poll).exists())
+
+    def test_spav_waits_for_snapshot(self):
+        url = reverse("spav", args=(self.poll.id,))
+        response = self.client.get(url, {"seats": 2})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Retry-After"], "5")
+        self.run_worker()
+        response = self.client.get(url, {"seats": 2})
+        self.assertEqual(
+            [choice["seats"] for choice in response.json()["choices"]], [2, 0]
+        )
+
+    def test_proportional_waits_for_snapshot(self):
+        url = reverse("proportional", args=(self.poll.id,))
+        params = {"method": "phragmen", "seats": 2}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Retry-After"], "5")
+        self.run_worker()
+        with mock.patch.object(BallotMatrix, "from_poll") as from_poll:
+            response = self.client.get(url, params)
+        from_poll.assert_not_called()
+        self.assertEqual(response.json()["winners"], [self.a.id, self.a.id])
+
+    def test_poll_furthest_behind_first(self):
+        other = create_poll(question="Other poll.", username="user2")
+        ResultsJob.request(self.poll)
+        ResultsJob.request(other)
+        self.run_worker()
+        create_ballot(other)
+        for _ in range(3):
+            create_ballot(self.poll)
+        ResultsJob.request(other)
+        ResultsJob.request(self.poll)
+        self.assertEqual(ResultsJob.claim().poll_id, self.poll.id)
+        self.assertEqual(ResultsJob.claim().poll_id, other.id)
+        self.assertIsNone(ResultsJob.claim())
+
+    def test_worker_survives_errors(self):
+        class Stop(BaseException):
+            pass
+
+        job = ResultsJob(poll=self.poll)
+        claim = mock.patch.object(
+            ResultsJob,
+            "claim",
+            side_effect=[OperationalError("database is locked"), job, None, Stop],
+        )
+        compute = mock.patch(
+            "approval_polls.management.commands.run_results_worker.Command.compute",
+            side_effect=ValueError,
+        )
+        with claim as claimed, compute, mock.patch("time.sleep") as sleep:
+            with self.assertRaises(Stop):
+                call_command("run_results_worker", stdout=StringIO())
+        self.assertEqual(claimed.call_count, 4)
+        self.assertEqual(sleep.call_count, 3)
+
+    def test_worker_maintains_database(self):
+        class Stop(BaseException):
+            pass
+
+        claim = mock.patch.object(ResultsJob, "claim", side_effect=[None, None, Stop])
+        clock = mock.patch("time.monotonic", side_effect=[0, 10, 11, 12, 15])
+        out = StringIO()
+        with claim, clock, mock.patch("time.sleep"), self.assertRaises(Stop):
+            call_command("run_results_worker", "--maintain-every", "10", stdout=out)
+        # Maintained at 10, and not again until 21
+        self.assertEqual(out.getvalue().count("expired vote tokens"), 1)
+        self.assertEqual(out.getvalue().count("Optimized"), 1)
+
+    def test_new_snapshot_changes_etag(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        self.run_worker()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class CvrImportTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll(question="Imported poll.")
+        self.a, self.b, self.c = [
+            self.poll.choice_set.create(choice_text=text)
+            for text in ["Alpha", "Beta", "Gamma"]
+        ]
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = f"{self.directory.name}/{name}"
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def import_cvr(self, path, *args):
+        call_command("import_cvr", self.poll.id, path, *args, stdout=StringIO())
+
+    def approvals(self):
+        return sorted(
+            sorted(ballot.vote_set.values_list("choice_id", flat=True))
+            for ballot in self.poll.ballot_set.all()
+        )
+
+    def test_csv(self):
+        path = self.write("ballots.csv", "Alpha,beta, GAMMA\n1,,x\n0,YES,0\n,,\n")
+        self.import_cvr(path)
+        self.assertEqual(self.approvals(), [[], [self.a.id, self.c.id], [self.b.id]])
+        poll = Poll.objects.get(id=self.poll.id)
+        self.assertEqual((poll.ballot_count, poll.vote_count), (3, 3))
+        # The co-approval and approval-size counts are up to date too
+        call_command("rebuild_tallies", "--verify", stdout=StringIO())
+
+    def test_ndjson_by_id_and_text(self):
+        path = self.write(
+            "ballots.ndjson",
+            f'[{self.a.id}, "Beta"]\n\n{{"approvals": ["{self.c.id}"]}}\n[]\n',
+        )
+        self.import_cvr(path)
+        self.assertEqual(self.approvals(), [[], [self.a.id, self.b.id], [self.c.id]])
+
+    def test_raw_ballots_export_of_another_poll(self):
+        source = create_poll(question="Source poll.", username="user2")
+        alpha, gamma = [
+            source.choice_set.create(choice_text=text) for text in ["Gamma", "Alpha"]
+        ][::-1]
+        for approved in [[alpha], [alpha, gamma]]:
+            ballot = create_ballot(source)
+            for choice in approved:
+                ballot.vote_set.create(choice=choice)
+        response = self.client.get(
+            reverse("raw", args=(source.id,)), {"format": "ndjson"}
+        )
+        path = self.write(
+            "export.ndjson", b"".join(response.streaming_content).decode()
+        )
+        self.import_cvr(path)
+        self.assertEqual(self.approvals(), [[self.a.id], [self.a.id, self.c.id]])
+
+    def test_invalid_records_import_nothing(self):
+        path = self.write("ballots.csv", "Alpha,Beta\n1,0\nmaybe,1\n1,1,1\n")
+        with self.assertRaisesMessage(CommandError, "2 invalid records: record 2"):
+            self.import_cvr(path)
+        self.assertEqual(self.poll.ballot_set.count(), 0)
+
+        self.import_cvr(path, "--skip-invalid")
+        self.assertEqual(self.approvals(), [[self.a.id]])
+        self.assertEqual(BallotImport.objects.get().skipped, 2)
+
+    def test_unknown_column(self):
+        path = self.write("ballots.csv", "Alpha,Delta\n1,0\n")
+        with self.assertRaisesMessage(CommandError, "Delta"):
+            self.import_cvr(path)
+
+    def test_unreadable_files(self):
+        files = {
+            "latin1.csv": ("Alpha,Beta\n1,0\nÉ,1\n".encode("latin-1"), "UTF-8"),
+            "huge.csv": (b"Alpha,Beta\n1," + b"0" * 200000 + b"\n", "not valid CSV"),
+            "header.ndjson": (
+                b'{"choices": [{"id": [1], "choice_text": "Alpha"}]}\n[[1]]\n',
+                "not a number or text",
+            ),
+        }
+        self.client.login(username="user1", password="test")
+        for name, (content, message) in files.items():
+            with self.subTest(name):
+                path = f"{self.directory.name}/{name}"
+                with open(path, "wb") as file:
+                    file.write(content)
+                with self.assertRaisesMessage(CommandError, message):
+                    self.import_cvr(path)
+                response = self.client.post(
+                    reverse("poll_admin", args=(self.poll.id,)),
+                    {
+                        "import_ballots": "",
+                        "cvr_file": SimpleUploadedFile(name, content),
+                    },
+                    follow=True,
+                )
+                self.assertContains(response, message)
+        self.assertEqual(self.poll.ballot_set.count(), 0)
+
+    def test_interrupted_import_resumes(self):
+        lines = ['["Alpha"]\n', '["Beta"]\n', '["Gamma"]\n'] * 3
+        path = self.write("ballots.ndjson", "".join(lines))
+        batches = []
+
+        def interrupt(ballot_import, total):
+            batches.append(ballot_import.records)
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            with open(path, "rb") as file:
+                cvr.import_ballots(
+                    self.poll,
+                    file,
+                    "ballots.ndjson",
+                    "ndjson",
+                    batch_size=4,
+                    progress=interrupt,
+                )
+        self.assertEqual(batches, [4])
+        self.assertEqual(self.poll.ballot_set.count(), 4)
+
+        self.import_cvr(path, "--batch-size", "4")
+        self.assertEqual(self.poll.ballot_set.count(), 9)
+        self.assertEqual(Poll.objects.get(id=self.poll.id).ballot_count, 9)
+        with self.assertRaisesMessage(CommandError, "already imported"):
+            self.import_cvr(path)
+
+    def test_queries_per_batch_constant(self):
+        def queries(count):
+            ballot_import = BallotImport.objects.create(
+                poll=self.poll, digest=str(count), name="ballots.csv"
+            )
+            approvals = [{self.a.id, self.b.id}, {self.c.id}, set()] * count
+            with CaptureQueriesContext(connection) as context:
+                ballot_import.add_ballots(approvals, len(approvals))
+            return len(context.captured_queries)
+
+        self.assertEqual(queries(10), queries(50))
+
+    def test_owner_upload(self):
+        url = reverse("poll_admin", args=(self.poll.id,))
+        upload = SimpleUploadedFile("ballots.csv", b"Alpha,Beta,Gamma\n1,1,0\n")
+        self.client.login(username="user1", password="test")
+        response = self.client.post(
+            url, {"import_ballots": "", "cvr_file": upload}, follow=True
+        )
+        self.assertContains(response, "Imported 1 ballots from ballots.csv.")
+        self.assertEqual(self.approvals(), [[self.a.id, self.b.id]])
+
+    def test_upload_requires_owner(self):
+        User.objects.create_user("user2", "user2@example.com", "test")
+        self.client.login(username="user2", password="test")
+        upload = SimpleUploadedFile("ballots.csv", b"Alpha\n1\n")
+        self.client.post(
+            reverse("poll_admin", args=(self.poll.id,)),
+            {"import_ballots": "", "cvr_file": upload},
+        )
+        self.assertEqual(self.poll.ballot_set.count(), 0)
+
+
 class MyPollTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -285,6 +1871,281 @@ class MyPollTests(TestCase):
         )
 
 
+class ListingQueryTests(TestCase):
+    """Poll listings render a page in the same number of queries however many
+    polls, choices, tags and ballots it shows."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("owner", "owner@example.com", "test")
+        self.client.login(username="owner", password="test")
+
+    def add_polls(self, count):
+        for n in range(count):
+            poll = Poll.objects.create(
+                question=f"Poll {n}",
+                pub_date=timezone.now() - datetime.timedelta(days=1),
+                user=self.user,
+                vtype=1 + n % 2,
+            )
+            poll.add_tags(["listed", f"tag{n}"])
+            a = poll.choice_set.create(choice_text="Alpha")
+            b = poll.choice_set.create(choice_text="Beta")
+            BallotImport.objects.create(
+                poll=poll, digest="x", name="ballots.csv"
+            ).add_ballots([{a.id}, {a.id, b.id}, set()], 3)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_constant_queries(self):
+        urls = [
+            reverse("index"),
+            reverse("tagged_polls", args=("listed",)),
+            reverse("my_polls"),
+            reverse("my_info"),
+        ]
+        self.add_polls(1)
+        one = [self.queries(url) for url in urls]
+        self.add_polls(4)
+        self.assertEqual([self.queries(url) for url in urls], one)
+
+    def test_stored_counts(self):
+        self.add_polls(1)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "3 ballots, 3 votes")
+        response = self.client.get(reverse("my_info"))
+        self.assertEqual(response.context["latest_poll_list"][0]["total_voters"], 3)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("owner", "owner@example.com", "test")
+        published = timezone.now() - datetime.timedelta(days=1)
+        # Pairs of polls published at the same time, ordered by ID between them
+        self.polls = [
+            Poll.objects.create(
+                question=f"Poll {n}",
+                pub_date=published + datetime.timedelta(minutes=n // 2),
+                user=self.user,
+            )
+            for n in range(12)
+        ][::-1]
+
+    def walk(self, url):
+        """Follow the next links from the first page, returning every page."""
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(url, {"cursor": cursor} if cursor else {})
+            page = response.context["latest_poll_list"]
+            pages.append(list(page))
+            if not page.has_next():
+                return pages, page
+            cursor = page.next_cursor()
+
+    def test_pages_in_order(self):
+        pages, last = self.walk(reverse("index"))
+        self.assertEqual(pages, [self.polls[:5], self.polls[5:10], self.polls[10:]])
+        self.assertEqual(last.number, 3)
+        self.assertFalse(last.has_next())
+        self.assertEqual(last.paginator.num_pages, 3)
+
+    def test_previous(self):
+        response = self.client.get(reverse("index"))
+        cursor = response.context["latest_poll_list"].next_cursor()
+        response = self.client.get(reverse("index"), {"cursor": cursor})
+        cursor = response.context["latest_poll_list"].next_cursor()
+        response = self.client.get(reverse("index"), {"cursor": cursor})
+        self.assertContains(response, "Page 3 of 3")
+
+        for number, polls in [(2, self.polls[5:10]), (1, self.polls[:5])]:
+            cursor = response.context["latest_poll_list"].previous_cursor()
+            response = self.client.get(reverse("index"), {"cursor": cursor})
+            page = response.context["latest_poll_list"]
+            self.assertEqual((page.number, list(page)), (number, polls))
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("index"), {"cursor": "tampered"})
+        self.assertEqual(list(response.context["latest_poll_list"]), self.polls[:5])
+        response = self.client.get(reverse("index"), {"page": "2"})
+        self.assertContains(response, "Page 1 of 3")
+
+    def test_deep_pages_skip_count(self):
+        response = self.client.get(reverse("index"))
+        cursor = response.context["latest_poll_list"].next_cursor()
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(reverse("index"), {"cursor": cursor})
+        self.assertEqual(len(deep.captured_queries), len(first.captured_queries) - 1)
+        self.assertNotIn("COUNT", " ".join(q["sql"] for q in deep.captured_queries))
+
+    def test_max_items(self):
+        paginator = CursorPaginator(Poll.objects.all(), 5, max_items=8)
+        page = paginator.page()
+        self.assertEqual((paginator.num_pages, page.has_next()), (2, True))
+        cursor = page.next_cursor()
+        page = paginator.page(cursor)
+        self.assertEqual(list(page), self.polls[5:8])
+        self.assertFalse(page.has_next())
+        page = CursorPaginator(Poll.objects.all(), 5, max_items=10).page(cursor)
+        self.assertEqual(list(page), self.polls[5:10])
+        self.assertFalse(page.has_next())
+
+    def test_count_limit(self):
+        self.client.login(username="owner", password="test")
+        with mock.patch("approval_polls.pagination.COUNT_LIMIT", 6):
+            response = self.client.get(reverse("my_info"))
+        self.assertContains(response, "Page 1 of 2+")
+
+    def test_my_polls(self):
+        self.client.login(username="owner", password="test")
+        for url in [reverse("my_polls"), reverse("my_info")]:
+            pages, _ = self.walk(url)
+            self.assertEqual(
+                [[data["poll"] for data in page] for page in pages],
+                [self.polls[:5], self.polls[5:10], self.polls[10:]],
+            )
+
+
+@override_settings(VOTER_PREVIEW_SIZE=2, VOTER_PAGE_SIZE=3)
+class VoterListTests(TestCase):
+    def setUp(self):
+        self.poll = create_poll("Question", vtype=2, days=-1)
+        self.anonymous = Poll.objects.create(
+            question="Anonymous",
+            pub_date=timezone.now() - datetime.timedelta(days=2),
+            user=self.poll.user,
+            vtype=1,
+        )
+        started = timezone.now() - datetime.timedelta(hours=1)
+        for n in range(7):
+            voter = User.objects.create_user(f"voter{n}", f"voter{n}@example.com")
+            for poll in [self.poll, self.anonymous]:
+                poll.ballot_set.create(
+                    user=voter, timestamp=started + datetime.timedelta(minutes=n)
+                )
+        self.client.login(username="user1", password="test")
+
+    def test_preview(self):
+        response = self.client.get(reverse("my_polls"))
+        polls = response.context["latest_poll_list"]
+        self.assertEqual(
+            [voter["username"] for voter in polls[0]["voters"]], ["voter6", "voter5"]
+        )
+        self.assertEqual(
+            [voter["username"] for voter in polls[1]["voters"]], [None, None]
+        )
+        self.assertContains(response, "Show all 7 voters", count=2)
+
+    def test_voter_pages(self):
+        url = reverse("poll_voters", args=(self.poll.id,))
+        names, cursor = [], None
+        while True:
+            data = self.client.get(url, {"cursor": cursor} if cursor else {}).json()
+            self.assertEqual(data["total"], 7)
+            names.append([voter["username"] for voter in data["voters"]])
+            cursor = data["next"]
+            if cursor is None:
+                break
+        self.assertEqual(
+            names,
+            [
+                ["voter6", "voter5", "voter4"],
+                ["voter3", "voter2", "voter1"],
+                ["voter0"],
+            ],
+        )
+        self.assertEqual(data["voters"][0]["email"], "voter0@example.com")
+
+    def test_anonymous_voters(self):
+        url = reverse("poll_voters", args=(self.anonymous.id,))
+        voters = self.client.get(url).json()["voters"]
+        self.assertEqual(len(voters), 3)
+        self.assertEqual(
+            {(voter["username"], voter["email"]) for voter in voters}, {(None, None)}
+        )
+
+    def test_owner_only(self):
+        User.objects.create_user("user2", "user2@example.com", "test")
+        self.client.login(username="user2", password="test")
+        for name in ["poll_voters", "voter_roll", "export_voters"]:
+            response = self.client.get(reverse(name, args=(self.poll.id,)))
+            self.assertEqual(response.status_code, 404)
+
+    def test_voter_roll(self):
+        response = self.client.get(reverse("poll_admin", args=(self.poll.id,)))
+        voters = response.context["voters"]
+        self.assertEqual(
+            [voter["username"] for voter in voters], ["voter6", "voter5", "voter4"]
+        )
+        self.assertContains(response, "Total Voters:</strong> 7")
+        self.assertContains(response, "Page 1 of 3")
+
+        url = reverse("voter_roll", args=(self.poll.id,))
+        response = self.client.get(url, {"cursor": voters.next_cursor()})
+        self.assertNotContains(response, "<html")
+        self.assertContains(response, "voter3@example.com")
+        self.assertNotContains(response, "voter4")
+        response = self.client.get(
+            url, {"cursor": response.context["voters"].previous_cursor()}
+        )
+        self.assertEqual(response.context["voters"].number, 1)
+        self.assertContains(response, "voter4@example.com")
+
+    def export(self, poll, export_format):
+        url = reverse("export_voters", args=(poll.id,))
+        with mock.patch("approval_polls.views.VOTER_EXPORT_CHUNK_SIZE", 3):
+            response = self.client.get(url, {"format": export_format})
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertIn(f"voters.{export_format}", response["Content-Disposition"])
+        return chunks
+
+    def test_export_csv(self):
+        chunks = self.export(self.poll, "csv")
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader("".join(chunks).splitlines()))
+        self.assertEqual(rows[0], ["username", "email", "timestamp"])
+        self.assertEqual(
+            [row[:2] for row in rows[1:3]],
+            [["voter6", "voter6@example.com"], ["voter5", "voter5@example.com"]],
+        )
+        self.assertEqual(len(rows), 8)
+
+    def test_export_anonymous(self):
+        rows = list(csv.reader("".join(self.export(self.anonymous, "csv")).split()))
+        self.assertEqual(rows[0], ["timestamp"])
+        self.assertEqual({len(row) for row in rows}, {1})
+        self.assertEqual(len(rows), 8)
+
+        lines = "".join(self.export(self.anonymous, "ndjson")).splitlines()
+        voters = [json.loads(line) for line in lines]
+        self.assertEqual(len(voters), 7)
+        self.assertEqual({voter["username"] for voter in voters}, {None})
+
+    def test_export_single_query(self):
+        for poll in [self.poll, self.anonymous]:
+            with CaptureQueriesContext(connection) as context:
+                self.export(poll, "csv")
+            ballot_queries = [
+                query
+                for query in context.captured_queries
+                if 'FROM "approval_polls_ballot"' in query["sql"]
+            ]
+            self.assertEqual(len(ballot_queries), 1)
+
+    def test_export_ndjson(self):
+        lines = "".join(self.export(self.poll, "ndjson")).splitlines()
+        voters = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [voter["username"] for voter in voters],
+            [f"voter{n}" for n in range(6, -1, -1)],
+        )
+
+
 class PollCreateTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -644,3 +2505,242 @@ class TagCloudTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertNotContains(response, "<a href='/tag/new%20york/'")
         self.assertNotContains(response, "new york")
+
+
+class TagStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user1", "user1@example.com", "test")
+        self.client.login(username="user1", password="test")
+
+    def create_poll(self, days=0, is_private=False, tags=("news",)):
+        poll = Poll.objects.create(
+            question="Question",
+            pub_date=timezone.now() - datetime.timedelta(days=days),
+            user=self.user,
+            is_private=is_private,
+        )
+        poll.add_tags(tags)
+        return poll
+
+    def stats(self, tag_text="news"):
+        stats = TagStats.objects.filter(tag__tag_text=tag_text).first()
+        return (stats.public_polls, stats.last_used) if stats else (0, None)
+
+    def assertRebuilt(self):
+        """The maintained statistics match those counted from the polls."""
+        call_command("rebuild_tag_stats", "--verify", stdout=StringIO())
+
+    def test_add_and_delete_tags(self):
+        old = self.create_poll(days=10)
+        new = self.create_poll(days=1)
+        new.add_tags(["News", "sport"])
+        self.assertEqual(self.stats(), (2, new.pub_date))
+        self.assertEqual(self.stats("sport"), (1, new.pub_date))
+
+        new.delete_tags(["news"])
+        self.assertEqual(self.stats(), (1, old.pub_date))
+        old.clear_tags()
+        self.assertEqual(self.stats(), (0, None))
+        self.assertRebuilt()
+
+    def test_private_polls(self):
+        poll = self.create_poll(is_private=True)
+        self.assertEqual(self.stats(), (0, None))
+
+        self.client.post(
+            reverse("my_polls"), {"poll_id": poll.id, "toggle_visibility": ""}
+        )
+        self.assertEqual(self.stats(), (1, poll.pub_date))
+        self.assertRebuilt()
+        self.client.post(
+            reverse("poll_admin", args=(poll.id,)), {"toggle_visibility": ""}
+        )
+        self.assertEqual(self.stats(), (0, None))
+        self.assertRebuilt()
+
+    def test_admin_actions(self):
+        polls = [self.create_poll(), self.create_poll(is_private=True)]
+        queryset = Poll.objects.filter(id__in=[poll.id for poll in polls])
+        self.assertEqual(set_visibility(queryset, is_private=False), 1)
+        self.assertEqual(self.stats()[0], 2)
+        PollAdmin(Poll, admin.site).delete_queryset(None, queryset)
+        self.assertEqual(self.stats(), (0, None))
+        self.assertRebuilt()
+
+    def test_delete_poll(self):
+        poll = self.create_poll()
+        self.client.post(reverse("delete_poll", args=(poll.id,)))
+        self.assertFalse(Poll.objects.exists())
+        self.assertEqual(self.stats(), (0, None))
+        self.assertRebuilt()
+
+    def test_deleting_owner(self):
+        self.create_poll(tags=["foo"])
+        index = tagindex.TagIndex()
+        with mock.patch("approval_polls.tagindex.index", index):
+            self.assertEqual(index.suggest("fo", 10), ["foo"])
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.delete()
+            self.assertEqual(self.stats("foo"), (0, None))
+            self.assertEqual(index.suggest("fo", 10), [])
+        self.assertRebuilt()
+
+    def test_pub_date_change(self):
+        poll = self.create_poll(days=100)
+        poll.pub_date = timezone.now()
+        poll.save()
+        self.assertEqual(self.stats(), (1, poll.pub_date))
+        self.assertRebuilt()
+
+    def test_popular_and_cloud(self):
+        for _ in range(3):
+            self.create_poll(days=365, tags=["archive"])
+        self.create_poll(tags=["trending"])
+        self.create_poll(is_private=True, tags=["secret"])
+
+        self.assertEqual(
+            [stats.tag.tag_text for stats in PollTag.popular(10)],
+            ["trending", "archive"],
+        )
+        self.assertEqual(
+            PollTag.topTagsPercent(10), {"archive": 75.0, "trending": 25.0}
+        )
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "Popular Tags")
+        self.assertNotContains(response, "secret")
+
+    @override_settings(TAG_ACTIVITY_HALF_LIFE=0.001)
+    def test_activity_far_from_epoch(self):
+        # Millions of half-lives since the epoch, far past a float's range
+        polls = [self.create_poll(days=1) for _ in range(2)]
+        self.create_poll(tags=["sport"])
+        self.assertEqual(
+            [stats.tag.tag_text for stats in PollTag.popular(10)], ["sport", "news"]
+        )
+        exponent = activity_exponent(polls[1].pub_date)
+        self.assertAlmostEqual(
+            TagStats.objects.get(tag__tag_text="news").activity, exponent + 1, 3
+        )
+        self.assertRebuilt()
+
+        polls[0].delete()
+        self.assertEqual(TagStats.objects.get(tag__tag_text="news").activity, exponent)
+        self.assertRebuilt()
+
+    def test_tag_page_count(self):
+        for _ in range(6):
+            self.create_poll()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("tagged_polls", args=("news",)))
+        self.assertContains(response, "Page 1 of 2")
+        self.assertNotIn("COUNT", " ".join(q["sql"] for q in context.captured_queries))
+
+    def test_rebuild(self):
+        self.create_poll()
+        self.create_poll(tags=["sport"])
+        TagStats.objects.filter(tag__tag_text="news").update(public_polls=5)
+        TagStats.objects.filter(tag__tag_text="sport").delete()
+        with self.assertRaisesMessage(CommandError, "2 tags are out of date"):
+            self.assertRebuilt()
+        call_command("rebuild_tag_stats", stdout=StringIO())
+        self.assertEqual(self.stats()[0], 1)
+        self.assertEqual(self.stats("sport")[0], 1)
+        self.assertRebuilt()
+
+
+@override_settings(TAG_INDEX_SYNC_INTERVAL=60)
+class TagIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user1", "user1@example.com", "test")
+        self.index = tagindex.TagIndex()
+        patcher = mock.patch("approval_polls.tagindex.index", self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_poll(self, tags, is_private=False):
+        poll = Poll.objects.create(
+            question="Question",
+            pub_date=timezone.now(),
+            user=self.user,
+            is_private=is_private,
+        )
+        poll.add_tags(tags)
+        return poll
+
+    def create_polls(self):
+        for tags in [["news"], ["news", "nature"], ["news", "nature"]]:
+            self.create_poll(tags)
+        self.create_poll(["newsletter"])
+        self.create_poll(["nectar"], is_private=True)
+
+    def test_suggest(self):
+        self.create_polls()
+        self.assertEqual(self.index.suggest("ne", 10), ["news", "newsletter"])
+        self.assertEqual(
+            self.index.suggest(" N ", 10), ["news", "nature", "newsletter"]
+        )
+        self.assertEqual(self.index.suggest("n", 2), ["news", "nature"])
+        self.assertEqual(self.index.suggest("newt", 10), [])
+        self.assertEqual(self.index.suggest("", 10), [])
+        self.assertEqual(self.index.all(), ["nature", "news", "newsletter"])
+
+    def test_lookups_skip_database(self):
+        self.create_polls()
+        self.index.suggest("n", 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.suggest("nat", 10), ["nature"])
+
+    def test_view(self):
+        self.create_polls()
+        response = self.client.get(reverse("tag_suggestions"), {"q": "New"})
+        self.assertEqual(response.json(), {"tags": ["news", "newsletter"]})
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+
+        response = self.client.get(reverse("all_tags"))
+        self.assertEqual(response.json(), {"allTags": ["nature", "news", "newsletter"]})
+        self.client.force_login(self.user)
+        self.assertContains(
+            self.client.get(reverse("create")), reverse("tag_suggestions")
+        )
+
+    def test_changes_in_this_process(self):
+        self.create_polls()
+        self.index.suggest("n", 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = self.create_poll(["nebula", "nature"])
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(
+                self.index.suggest("n", 10),
+                ["nature", "news", "nebula", "newsletter"],
+            )
+        # Only the rows written lately are fetched
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn("updated", context.captured_queries[0]["sql"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            poll.is_private = True
+            poll.save()
+        self.assertEqual(self.index.suggest("ne", 10), ["news", "newsletter"])
+
+    def test_changes_in_other_processes(self):
+        self.create_polls()
+        self.index.suggest("n", 10)
+        # Committed by another process, so not signalled to this one
+        self.create_poll(["nebula"])
+        self.assertEqual(self.index.suggest("neb", 10), [])
+        self.index.next_sync = time.monotonic()
+        self.assertEqual(self.index.suggest("neb", 10), ["nebula"])
+
+    def test_rebuild_tag_stats(self):
+        self.create_polls()
+        self.index.suggest("n", 10)
+        TagStats.objects.create(
+            tag=PollTag.objects.get(tag_text="nectar"), public_polls=1
+        )
+        self.index.invalidate()
+        self.assertEqual(self.index.suggest("nec", 10), ["nectar"])
+
+        call_command("rebuild_tag_stats", stdout=StringIO())
+        self.index.invalidate()
+        self.assertEqual(self.index.suggest("nec", 10), [])
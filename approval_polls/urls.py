@@ -11,6 +11,13 @@ urlpatterns = [
     path("<int:pk>/", views.DetailView.as_view(), name="detail"),
     path("<int:poll_id>/delete/", views.delete_poll, name="delete_poll"),
     path("<int:poll_id>/admin/", views.poll_admin, name="poll_admin"),
+    path("<int:poll_id>/admin/voters/", views.voter_roll, name="voter_roll"),
+    path(
+        "<int:poll_id>/admin/voters/export/",
+        views.export_voters,
+        name="export_voters",
+    ),
+    path("<int:poll_id>/voters/", views.poll_voters, name="poll_voters"),
     path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
     path(
         "<int:poll_id>/embed_instructions/",
@@ -19,6 +26,12 @@ urlpatterns = [
     ),
     path("<int:poll_id>/vote/", views.vote, name="vote"),
     path("polls/<int:poll_id>/raw/", views.raw_ballots, name="raw"),
+    path("polls/<int:poll_id>/spav/", views.spav, name="spav"),
+    path(
+        "polls/<int:poll_id>/proportional/",
+        views.proportional_allocation,
+        name="proportional",
+    ),
     # path("<int:poll_id>/edit/", views.EditView.as_view(), name="edit"),
     path(
         "<int:poll_id>/change_suspension/",
@@ -31,6 +44,8 @@ urlpatterns = [
     path("invitation/<int:pk>/", views.DetailView.as_view(), name="invitation"),
     path("tag/<path:tag>/", views.tagged_polls, name="tagged_polls"),
     path("all_tags/", views.all_tags, name="all_tags"),
+    path("tag_suggestions/", views.tag_suggestions, name="tag_suggestions"),
     path("tag_cloud/", views.tag_cloud, name="tag_cloud"),
+    path("cache_stats/", views.cache_stats_view, name="cache_stats"),
     path("accounts/", include("allauth.urls")),
 ]
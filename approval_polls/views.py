@@ -1,26 +1,107 @@
+import csv
 import datetime
+import hashlib
+import io
 import json
+import math
+import os
 import re
+import uuid
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from itertools import batched, chain, groupby
+from operator import itemgetter
 
 import structlog
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
-from django.db.models import Count, Prefetch
-from django.http import HttpResponseRedirect, HttpResponseServerError, JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import (
+    HttpResponseRedirect,
+    HttpResponseServerError,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
 from django.views import generic
-from django.views.decorators.http import require_http_methods
-
-from approval_polls.models import Ballot, Poll, PollTag, Vote, VoteInvitation
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_http_methods
+
+from approval_polls import bitmask, cvr, proportional, tagindex
+from approval_polls.caching import cache_stats, cached_for_revision
+from approval_polls.models import (
+    Ballot,
+    Poll,
+    PollTag,
+    QueuedVote,
+    ResultsJob,
+    ResultsSnapshot,
+    Vote,
+    VoteInvitation,
+    VoteToken,
+)
+from approval_polls.pagination import CursorPaginator
+from approval_polls.ratelimit import rate_limit
+from approval_polls.sqlite import write_transaction
+from approval_polls.tally import (
+    SPAV_MAX_SEATS,
+    StoredTally,
+    aproportional_allocation,
+    aspav_sweep,
+)
 
 logger = structlog.get_logger(__name__)
 
+# Rows fetched per database round trip, and ballots encoded per chunk, when
+# streaming raw ballots.
+RAW_BALLOTS_CHUNK_SIZE = 2000
+
+# Ballots fetched per database round trip, and voters written per chunk, when
+# exporting a poll's voters.
+VOTER_EXPORT_CHUNK_SIZE = 2000
+
+VOTER_EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# Tags listed in the popular tags sidebar of the poll listings.
+POPULAR_TAGS = 10
+
+# Tags suggested per autocomplete request, and how long browsers and proxies
+# may reuse the suggestions and the list of all tags.
+TAG_SUGGESTIONS = 10
+TAG_SUGGESTIONS_MAX_AGE = 60
+
+# Seconds a client should wait before asking again for a background result
+# that isn't ready yet.
+SNAPSHOT_RETRY_AFTER = 5
+
+# Async views run blocking analytics here rather than on the event loop, so
+# a large poll's tally doesn't hold up other requests.
+analytics_executor = ThreadPoolExecutor(
+    max_workers=settings.ANALYTICS_THREADS, thread_name_prefix="analytics"
+)
+
+# How long browsers may reuse pages of a closed poll without revalidating.
+CLOSED_POLL_MAX_AGE = 60 * 60 * 24
+
+# Encodings of the raw ballots endpoint, chosen by ?format= or Accept.
+RAW_BALLOT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "bitmask": bitmask.CONTENT_TYPE,
+}
+
 
 def index(request):
     poll_list = (
@@ -30,9 +111,8 @@ def index(request):
         )
         .select_related("user")
         .prefetch_related("choice_set", "polltag_set")
-        .order_by("-pub_date")[:100]
     )
-    return get_polls(request, poll_list, "index.html")
+    return get_polls(request, poll_list, "index.html", max_items=100)
 
 
 def tag_cloud(request):
@@ -65,71 +145,97 @@ def my_polls(request):
     poll_list = (
         Poll.objects.filter(pub_date__lte=timezone.now(), user_id=request.user)
         .select_related("user")
-        .prefetch_related("choice_set", "polltag_set", "ballot_set__user")
-        .order_by("-pub_date")
+        .prefetch_related("choice_set", "polltag_set")
     )
+    polls = CursorPaginator(poll_list, 5).page(request.GET.get("cursor"))
 
-    # Prepare voter information for each poll
-    polls_with_voters = []
-    for poll in poll_list:
-        ballots = poll.ballot_set.select_related("user").order_by("-timestamp")
-        voters = []
-        if poll.vtype == 1:
-            # Anonymous polls: show only timestamp
-            for ballot in ballots:
-                voters.append(
-                    {
-                        "timestamp": ballot.timestamp,
-                        "username": None,
-                        "email": None,
-                    }
-                )
-        else:
-            # Authenticated polls: show username, email (if available), and timestamp
-            for ballot in ballots:
-                username = ballot.user.username if ballot.user else None
-                email = (
-                    ballot.email
-                    if ballot.email
-                    else (ballot.user.email if ballot.user else None)
-                )
-                voters.append(
-                    {
-                        "timestamp": ballot.timestamp,
-                        "username": username,
-                        "email": email,
-                    }
-                )
+    # The latest voters of each poll on the page; the rest are fetched from
+    # poll_voters on demand
+    previews = voter_previews(polls)
+    polls.object_list = [
+        {
+            "poll": poll,
+            "voters": previews[poll.id],
+            "total_voters": poll.total_ballots(),
+        }
+        for poll in polls
+    ]
 
-        polls_with_voters.append(
-            {
-                "poll": poll,
-                "voters": voters,
-                "total_voters": len(voters),
-            }
+    return render(request, "my_polls.html", {"latest_poll_list": polls})
+
+
+def voter_info(ballot, anonymous):
+    """
+    What a poll's owner is shown of a ballot: only when it was cast for
+    anonymous (vtype 1) polls, and otherwise also who cast it.
+    """
+    if anonymous:
+        return {"timestamp": ballot.timestamp, "username": None, "email": None}
+    return {
+        "timestamp": ballot.timestamp,
+        "username": ballot.user.username if ballot.user else None,
+        "email": ballot.email or (ballot.user.email if ballot.user else None),
+    }
+
+
+def voter_previews(polls):
+    """
+    Map each of `polls` to voter_info() for its VOTER_PREVIEW_SIZE latest
+    ballots, all fetched in one query.
+    """
+    anonymous = {poll.id: poll.vtype == 1 for poll in polls}
+    ballots = (
+        Ballot.objects.filter(poll__in=list(anonymous))
+        .select_related("user")
+        .annotate(
+            rank=Window(
+                RowNumber(), partition_by=F("poll"), order_by=("-timestamp", "-id")
+            )
         )
+        .filter(rank__lte=settings.VOTER_PREVIEW_SIZE)
+        .order_by("poll", "rank")
+    )
+    previews = {poll_id: [] for poll_id in anonymous}
+    for ballot in ballots:
+        previews[ballot.poll_id].append(voter_info(ballot, anonymous[ballot.poll_id]))
+    return previews
 
-    paginator = Paginator(polls_with_voters, 5)
-    page = request.GET.get("page")
-    try:
-        polls = paginator.page(page)
-    except PageNotAnInteger:
-        polls = paginator.page(1)
-    except EmptyPage:
-        polls = paginator.page(paginator.num_pages)
 
-    return render(request, "my_polls.html", {"latest_poll_list": polls})
+@login_required
+def poll_voters(request, poll_id):
+    """A page of the voters of one of the user's polls, newest first, as JSON."""
+    poll = get_object_or_404(Poll, id=poll_id, user=request.user)
+    page = CursorPaginator(
+        poll.ballot_set.select_related("user"),
+        settings.VOTER_PAGE_SIZE,
+        date_field="timestamp",
+    ).page(request.GET.get("cursor"))
+    return JsonResponse(
+        {
+            "total": poll.total_ballots(),
+            "voters": [voter_info(ballot, poll.vtype == 1) for ballot in page],
+            "next": page.next_cursor() if page.has_next() else None,
+        }
+    )
 
 
 def tagged_polls(request, tag):
-    t = get_object_or_404(PollTag, tag_text=tag.lower())
+    t = get_object_or_404(PollTag.objects.select_related("stats"), tag_text=tag.lower())
     poll_list = (
         t.polls.filter(pub_date__lte=timezone.now(), is_private=False)
         .select_related("user")
         .prefetch_related("choice_set", "polltag_set")
-        .order_by("-pub_date")
     )
-    return get_polls(request, poll_list, "index.html", tag=t.tag_text)
+    # The stored count stands in for counting the tag's polls; it includes
+    # polls yet to be published, and the last page corrects it.
+    stats = getattr(t, "stats", None)
+    return get_polls(
+        request,
+        poll_list,
+        "index.html",
+        tag=t.tag_text,
+        count=stats.public_polls if stats else 0,
+    )
 
 
 @login_required
@@ -151,59 +257,15 @@ def my_info(request):
                 messages.success(request, f"Poll visibility set to {visibility}.")
             return redirect("my_info")
 
-    poll_list = (
-        Poll.objects.filter(pub_date__lte=timezone.now(), user_id=request.user)
-        .select_related("user")
-        .prefetch_related("ballot_set__user")
-        .order_by("-pub_date")
-    )
+    poll_list = Poll.objects.filter(
+        pub_date__lte=timezone.now(), user_id=request.user
+    ).select_related("user")
+    polls = CursorPaginator(poll_list, 5).page(request.GET.get("cursor"))
 
-    # Prepare voter information for each poll
-    polls_with_voters = []
-    for poll in poll_list:
-        ballots = poll.ballot_set.select_related("user").order_by("-timestamp")
-        voters = []
-        if poll.vtype == 1:
-            # Anonymous polls: show only timestamp
-            for ballot in ballots:
-                voters.append(
-                    {
-                        "timestamp": ballot.timestamp,
-                        "username": None,
-                        "email": None,
-                    }
-                )
-        else:
-            # Authenticated polls: show username, email (if available), and timestamp
-            for ballot in ballots:
-                username = ballot.user.username if ballot.user else None
-                email = (
-                    ballot.email
-                    if ballot.email
-                    else (ballot.user.email if ballot.user else None)
-                )
-                voters.append(
-                    {
-                        "timestamp": ballot.timestamp,
-                        "username": username,
-                        "email": email,
-                    }
-                )
-
-        polls_with_voters.append(
-            {
-                "poll": poll,
-                "voters": voters,
-                "total_voters": len(voters),
-            }
-        )
-
-    paginator = Paginator(polls_with_voters, 5)
-    page = request.GET.get("page", 1)
-    try:
-        polls = paginator.page(page)
-    except EmptyPage:
-        polls = paginator.page(paginator.num_pages)
+    # The page only shows how many voted, from the stored counter
+    polls.object_list = [
+        {"poll": poll, "total_voters": poll.total_ballots()} for poll in polls
+    ]
     return render(
         request,
         "my_info.html",
@@ -211,16 +273,21 @@ def my_info(request):
     )
 
 
-def get_polls(request, poll_list, render_page, tag: str = ""):
-    paginator = Paginator(poll_list, 5)
-    page = request.GET.get("page")
-    try:
-        polls = paginator.page(page)
-    except PageNotAnInteger:
-        polls = paginator.page(1)
-    except EmptyPage:
-        polls = paginator.page(paginator.num_pages)
-    return render(request, render_page, {"latest_poll_list": polls, "tag": tag})
+def get_polls(
+    request, poll_list, render_page, tag: str = "", max_items=None, count=None
+):
+    polls = CursorPaginator(poll_list, 5, max_items, count=count).page(
+        request.GET.get("cursor")
+    )
+    return render(
+        request,
+        render_page,
+        {
+            "latest_poll_list": polls,
+            "tag": tag,
+            "popular_tags": PollTag.popular(POPULAR_TAGS),
+        },
+    )
 
 
 def change_suspension(request, poll_id):
@@ -250,53 +317,255 @@ def poll_admin(request, poll_id):
             poll.save()
             visibility = "private" if poll.is_private else "public"
             messages.success(request, f"Poll visibility set to {visibility}.")
+        elif "import_ballots" in request.POST:
+            import_uploaded_ballots(request, poll)
         return redirect("poll_admin", poll_id=poll_id)
 
-    # Get ballots with related user data
-    ballots = poll.ballot_set.select_related("user").order_by("-timestamp")
-
-    # Prepare voter information based on poll type
-    voters = []
-    if poll.vtype == 1:
-        # Anonymous polls: show only timestamp
-        for ballot in ballots:
-            voters.append(
-                {
-                    "timestamp": ballot.timestamp,
-                    "username": None,
-                    "email": None,
-                }
-            )
-    else:
-        # Authenticated polls: show username, email (if available), and timestamp
-        for ballot in ballots:
-            username = ballot.user.username if ballot.user else None
-            email = (
-                ballot.email
-                if ballot.email
-                else (ballot.user.email if ballot.user else None)
-            )
-            voters.append(
-                {
-                    "timestamp": ballot.timestamp,
-                    "username": username,
-                    "email": email,
-                }
-            )
-
     context = {
         "poll": poll,
-        "voters": voters,
-        "total_voters": len(voters),
+        "voters": voter_roll_page(request, poll),
+        "total_voters": poll.total_ballots(),
     }
 
     return render(request, "poll_admin.html", context)
 
 
+def voter_roll_page(request, poll):
+    """The page of the poll's voters, newest first, that ?cursor= asks for."""
+    voters = CursorPaginator(
+        poll.ballot_set.select_related("user"),
+        settings.VOTER_PAGE_SIZE,
+        date_field="timestamp",
+    ).page(request.GET.get("cursor"))
+    voters.object_list = [voter_info(ballot, poll.vtype == 1) for ballot in voters]
+    return voters
+
+
+@login_required
+def voter_roll(request, poll_id):
+    """A page of poll_admin's voter roll, as an HTML fragment."""
+    poll = get_object_or_404(Poll, id=poll_id, user=request.user)
+    return render(
+        request,
+        "voter_roll.html",
+        {"poll": poll, "voters": voter_roll_page(request, poll)},
+    )
+
+
+@login_required
+def export_voters(request, poll_id):
+    """
+    Stream the poll's voters, newest first, as CSV or, with ?format=ndjson,
+    one JSON object per line. Ballots are read a chunk at a time, so memory
+    use doesn't grow with the size of the electorate.
+    """
+    poll = get_object_or_404(Poll, id=poll_id, user=request.user)
+    export_format = request.GET.get("format")
+    if export_format not in VOTER_EXPORT_FORMATS:
+        export_format = "csv"
+
+    anonymous = poll.vtype == 1
+    # Each ballot is given its poll through ballot_set, which reads poll_id
+    ballots = poll.ballot_set.order_by("-timestamp", "-id")
+    if anonymous:
+        ballots = ballots.only("poll", "timestamp")
+    else:
+        ballots = ballots.select_related("user").only(
+            "poll", "timestamp", "email", "user__username", "user__email"
+        )
+    voters = (
+        voter_info(ballot, anonymous)
+        for ballot in ballots.iterator(chunk_size=VOTER_EXPORT_CHUNK_SIZE)
+    )
+    if export_format == "ndjson":
+        chunks = (
+            "".join(json.dumps(voter, cls=DjangoJSONEncoder) + "\n" for voter in batch)
+            for batch in batched(voters, VOTER_EXPORT_CHUNK_SIZE)
+        )
+    else:
+        chunks = voters_csv_chunks(voters, anonymous)
+    if isinstance(request, ASGIRequest):
+        chunks = stream_from_thread(chunks)
+    response = StreamingHttpResponse(
+        chunks, content_type=VOTER_EXPORT_FORMATS[export_format]
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="poll-{poll.id}-voters.{export_format}"'
+    )
+    return response
+
+
+def voters_csv_chunks(voters, anonymous):
+    """Write voter_info() dicts as CSV, a chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["timestamp"] if anonymous else ["username", "email", "timestamp"])
+    for batch in batched(voters, VOTER_EXPORT_CHUNK_SIZE):
+        for voter in batch:
+            timestamp = voter["timestamp"].isoformat()
+            if anonymous:
+                writer.writerow([timestamp])
+            else:
+                writer.writerow([voter["username"], voter["email"], timestamp])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def import_uploaded_ballots(request, poll):
+    upload = request.FILES.get("cvr_file")
+    if upload is None:
+        messages.error(request, "Choose a CSV or NDJSON file of ballots to import.")
+        return
+    try:
+        ballot_import = cvr.import_ballots(
+            poll,
+            upload.file,
+            upload.name,
+            cvr.file_format(upload.name),
+            skip_invalid="skip_invalid" in request.POST,
+        )
+    except cvr.InvalidFile as error:
+        messages.error(request, f"The ballots could not be imported. {error}")
+        return
+    logger.info(f"Imported {ballot_import.ballots} ballots into poll {poll.id}")
+    skipped = (
+        f", skipping {ballot_import.skipped} invalid records"
+        if ballot_import.skipped
+        else ""
+    )
+    messages.success(
+        request,
+        f"Imported {ballot_import.ballots} ballots from {upload.name}{skipped}.",
+    )
+
+
 def all_tags(request):
-    return {"allTags": [t.tag_text for t in PollTag.objects.all()]}
+    response = JsonResponse({"allTags": tagindex.index.all()})
+    patch_cache_control(response, public=True, max_age=TAG_SUGGESTIONS_MAX_AGE)
+    return response
 
 
+def tag_suggestions(request):
+    """The most used tags on public polls starting with ``?q=``."""
+    response = JsonResponse(
+        {"tags": tagindex.index.suggest(request.GET.get("q", ""), TAG_SUGGESTIONS)}
+    )
+    patch_cache_control(response, public=True, max_age=TAG_SUGGESTIONS_MAX_AGE)
+    return response
+
+
+def poll_conditional(variant=None):
+    """
+    Answer conditional GETs for a page of the poll in the ``pk`` or
+    ``poll_id`` URL argument with 304 Not Modified while the poll's revision
+    is unchanged, without running the view.
+
+    The ETag also covers who is asking, since the pages show the user's own
+    ballot and carry their CSRF token. ``variant(request, poll)`` returns
+    anything else the page depends on, or None when it can't be cached at
+    all. Pages with pending messages are always rendered, and so are pages
+    of polls whose ballots the user may not see, so that the view's own
+    checks answer them rather than a 304.
+    """
+
+    def validators(request, kwargs):
+        """The poll and the page's ETag, or None if it can't be cached."""
+        poll = (
+            Poll.objects.filter(
+                pk=kwargs.get("poll_id", kwargs.get("pk")),
+                pub_date__lte=timezone.now(),
+            )
+            .only(
+                "revision",
+                "revised_at",
+                "pub_date",
+                "close_date",
+                "show_countdown",
+                "ballot_count",
+                "is_private",
+                "vtype",
+                "user",
+            )
+            .first()
+        )
+        if poll is None or ballot_access_error(request, poll) is not None:
+            return None
+        extra = variant(request, poll) if variant else ()
+        if extra is None or len(messages.get_messages(request)):
+            return None
+
+        parts = (
+            poll.is_closed(),
+            request.user.pk,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+            *extra,
+        )
+        digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+        return poll, f"{poll.id}-{poll.revision}-{digest}"
+
+    def conditional(view, poll, etag):
+        return condition(
+            etag_func=lambda *args, **kwargs: etag,
+            last_modified_func=lambda *args, **kwargs: poll.last_modified(),
+        )(view)
+
+    def patch_response(response, poll):
+        if response.status_code in (200, 304):
+            if poll.is_closed():
+                patch_cache_control(response, private=True, max_age=CLOSED_POLL_MAX_AGE)
+            else:
+                patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # The session and the variant may query the database
+                found = await sync_to_async(validators)(request, kwargs)
+                if found is None:
+                    return await view(request, *args, **kwargs)
+                poll, etag = found
+                response = await conditional(view, poll, etag)(request, *args, **kwargs)
+                return patch_response(response, poll)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            found = validators(request, kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+            poll, etag = found
+            response = conditional(view, poll, etag)(request, *args, **kwargs)
+            return patch_response(response, poll)
+
+        return wrapper
+
+    return decorator
+
+
+def detail_variant(request, poll):
+    # The countdown is rendered relative to the time of the request.
+    if poll.show_countdown and poll.close_date and not poll.is_closed():
+        return None
+    return (request.GET.urlencode(), request.COOKIES.get("polls_voted"))
+
+
+def results_variant(request, poll):
+    # A finished background snapshot changes the page without a new revision.
+    if poll.ballot_count < settings.RESULTS_JOB_MIN_BALLOTS:
+        return ()
+    return tuple(
+        ResultsSnapshot.objects.filter(poll=poll).values_list("computed_at", flat=True)
+    )
+
+
+@method_decorator(poll_conditional(detail_variant), name="dispatch")
 class DetailView(generic.DetailView):
     model = Poll
     template_name = "detail.html"
@@ -323,6 +592,7 @@ class DetailView(generic.DetailView):
         permit_email = True if poll.show_email_opt_in else False
 
         if poll.vtype == 1:
+            context["vote_token"] = uuid.uuid4().hex
             context["already_voted"] = False
             # Check if cookie is already set.
             value = self.request.COOKIES.get("polls_voted")
@@ -388,16 +658,11 @@ class DetailView(generic.DetailView):
 def delete_poll(request, poll_id):
     logger.debug(f"Attempting to delete poll {poll_id}")
     try:
-        with transaction.atomic():
+        with write_transaction():
             poll = get_object_or_404(Poll, id=poll_id, user=request.user)
             logger.debug(f"Found poll: {poll}")
 
-            # Delete related objects first to avoid potential cascade issues
-            poll.choice_set.all().delete()
-            poll.ballot_set.all().delete()
-            poll.voteinvitation_set.all().delete()
-            poll.polltag_set.clear()  # Remove tag associations without deleting tags
-
+            # Its choices, ballots and invitations go with it; its tags stay
             poll.delete()
             messages.success(request, "Poll deleted successfully.")
 
@@ -414,6 +679,8 @@ def delete_poll(request, poll_id):
         return HttpResponseServerError(f"An error occurred: {str(e)}")
 
 
+@method_decorator(rate_limit("results"), name="dispatch")
+@method_decorator(poll_conditional(results_variant), name="dispatch")
 class ResultsView(generic.DetailView):
     model = Poll
     template_name = "results.html"
@@ -424,242 +691,262 @@ class ResultsView(generic.DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         poll = self.object
-
-        # Approval voting logic
-        choices = poll.choice_set.annotate(vote_count=Count("vote")).order_by(
-            "-vote_count"
-        )
-        max_votes = choices.first().vote_count if choices.exists() else 0
-        leading_choices = [
-            choice for choice in choices if choice.vote_count == max_votes
-        ]
-
-        # Proportional voting logic
-        ballots = poll.ballot_set.prefetch_related(
-            Prefetch("vote_set", queryset=Vote.objects.select_related("choice"))
-        )
-        proportional_votes = {choice.id: 0 for choice in poll.choice_set.all()}
-        total_proportional_votes = 0
-
-        for ballot in ballots:
-            approved_choices = ballot.vote_set.all().values_list("choice_id", flat=True)
-            num_approved = len(approved_choices)
-            if num_approved > 0:
-                weight = 1 / num_approved
-                for choice_id in approved_choices:
-                    proportional_votes[choice_id] += weight
-                    total_proportional_votes += weight
-
-        proportional_results = sorted(
-            [
-                {
-                    "choice_text": choice.choice_text,
-                    "proportional_votes": proportional_votes[choice.id],
-                    "proportional_percentage": (
-                        proportional_votes[choice.id] / total_proportional_votes * 100
-                        if total_proportional_votes > 0
-                        else 0
-                    ),
-                }
-                for choice in poll.choice_set.all()
-            ],
-            key=lambda x: x[
-                "proportional_percentage"
-            ],  # Sort by proportional_percentage
-            reverse=True,  # Highest percentage first
+        snapshot = background_snapshot(poll)
+        if snapshot is not None:
+            context.update(snapshot.data["results"])
+            context["results_computed_at"] = snapshot.computed_at
+            context["results_age"] = int(
+                (timezone.now() - snapshot.computed_at).total_seconds()
+            )
+            return context
+        # Everything else depends only on the poll's ballots and choices, so
+        # it is computed once per revision and shared by every visitor.
+        context.update(
+            cached_for_revision("results", poll, lambda: results_context(poll))
         )
+        return context
 
-        # Cast vote record analysis
-        total_ballots = poll.total_ballots()
-        num_choices = poll.choice_set.count()
-        co_approvals = []
-        approval_distribution = Counter()
-        candidate_approval_distributions = defaultdict(Counter)
-        anyone_but_analysis = Counter()
-
-        # Only calculate if we have enough data
-        if total_ballots >= 2 and num_choices >= 2:
-            # Build ballot approvals mapping
-            ballot_approvals = {}
-            for ballot in ballots:
-                approved_choice_ids = set(
-                    ballot.vote_set.all().values_list("choice_id", flat=True)
-                )
-                ballot_approvals[ballot.id] = approved_choice_ids
-                num_approved = len(approved_choice_ids)
-                approval_distribution[num_approved] += 1
-
-                # Per-candidate approval distributions
-                for choice_id in approved_choice_ids:
-                    candidate_approval_distributions[choice_id][num_approved] += 1
-
-            # Calculate co-approval matrix
-            choice_list = list(poll.choice_set.all())
-            for i, choice_a in enumerate(choice_list):
-                # Get ballots that approved choice_a
-                choice_a_ballots = [
-                    ballot_id
-                    for ballot_id, approved in ballot_approvals.items()
-                    if choice_a.id in approved
-                ]
-                choice_a_count = len(choice_a_ballots)
-
-                if choice_a_count == 0:
-                    continue
 
-                for j, choice_b in enumerate(choice_list):
-                    if i == j:
-                        continue
+def background_snapshot(poll):
+    """
+    Return the latest ResultsSnapshot of a poll large enough to be computed
+    in the background, queueing a new one if it is out of date. Returns None
+    for smaller polls, or before the first snapshot is ready.
+    """
+    if poll.ballot_count < settings.RESULTS_JOB_MIN_BALLOTS:
+        return None
+    snapshot = ResultsSnapshot.objects.filter(poll=poll).first()
+    if snapshot is None or snapshot.revision != poll.revision:
+        ResultsJob.request(poll)
+    return snapshot
+
+
+def results_context(poll):
+    """The results page context for ``poll``, as cacheable plain data."""
+    # The analytics below read the stored co-approval and approval-size
+    # counts, so they cost the same however many ballots the poll has.
+    choice_list = list(poll.choice_set.order_by("id"))
+    # Plain dicts rather than Choice instances, so the context can be cached
+    choice_rows = [
+        {
+            "id": choice.id,
+            "choice_text": choice.choice_text,
+            "vote_count": choice.vote_count,
+            "percentage": (
+                choice.vote_count / poll.ballot_count if poll.ballot_count > 0 else 0
+            ),
+        }
+        for choice in choice_list
+    ]
+    matrix = StoredTally.from_poll(poll, [choice.id for choice in choice_list])
+
+    # Approval voting logic, read from the stored per-choice counters
+    choices = sorted(choice_rows, key=lambda c: c["vote_count"], reverse=True)
+    max_votes = choices[0]["vote_count"] if choices else 0
+    leading_choices = [
+        choice for choice in choices if choice["vote_count"] == max_votes
+    ]
+
+    # Proportional voting logic
+    proportional_votes = dict(
+        zip(
+            (choice.id for choice in choice_list),
+            matrix.proportional_votes().tolist(),
+        )
+    )
+    total_proportional_votes = sum(proportional_votes.values())
+
+    proportional_results = sorted(
+        [
+            {
+                "choice_text": choice.choice_text,
+                "proportional_votes": proportional_votes[choice.id],
+                "proportional_percentage": (
+                    proportional_votes[choice.id] / total_proportional_votes * 100
+                    if total_proportional_votes > 0
+                    else 0
+                ),
+            }
+            for choice in choice_list
+        ],
+        key=lambda x: x["proportional_percentage"],  # Sort by proportional_percentage
+        reverse=True,  # Highest percentage first
+    )
 
-                    # Count how many of choice_a's ballots also approved choice_b
-                    both_count = sum(
-                        1
-                        for ballot_id in choice_a_ballots
-                        if choice_b.id in ballot_approvals[ballot_id]
+    # Cast vote record analysis
+    total_ballots = matrix.total_ballots
+    num_choices = len(choice_list)
+    co_approvals = []
+    approval_distribution = Counter()
+    candidate_approval_distributions = defaultdict(Counter)
+    anyone_but_analysis = Counter()
+
+    # Only calculate if we have enough data
+    if total_ballots >= 2 and num_choices >= 2:
+        for num_approved, count in enumerate(matrix.approval_distribution()):
+            if count:
+                approval_distribution[num_approved] = int(count)
+
+        # Per-candidate approval distributions
+        for choice, distribution in zip(
+            choice_list, matrix.candidate_approval_distributions()
+        ):
+            for num_approved, count in enumerate(distribution):
+                if count:
+                    candidate_approval_distributions[choice.id][num_approved] = int(
+                        count
                     )
 
-                    co_approval_rate = (both_count / choice_a_count) * 100
+        # Calculate co-approval matrix
+        co_approval_counts = matrix.co_approval_counts()
+        for i, choice_a in enumerate(choice_list):
+            choice_a_count = int(co_approval_counts[i, i])
+            if choice_a_count == 0:
+                continue
 
-                    co_approvals.append(
-                        {
-                            "candidateA": choice_a.choice_text,
-                            "candidateB": choice_b.choice_text,
-                            "coApprovalCount": both_count,
-                            "coApprovalRate": co_approval_rate,
-                        }
-                    )
+            for j, choice_b in enumerate(choice_list):
+                if i == j:
+                    continue
 
-            # Calculate "Anyone But" analysis - ballots with exactly N-1 approvals
-            all_choice_ids = set(choice.id for choice in choice_list)
-            for ballot_id, approved_choice_ids in ballot_approvals.items():
-                if len(approved_choice_ids) == num_choices - 1:
-                    # Find the excluded choice
-                    excluded_choice_ids = all_choice_ids - approved_choice_ids
-                    if len(excluded_choice_ids) == 1:
-                        excluded_choice_id = list(excluded_choice_ids)[0]
-                        excluded_choice = next(
-                            c for c in choice_list if c.id == excluded_choice_id
-                        )
-                        anyone_but_analysis[excluded_choice.choice_text] += 1
-
-        # Convert Counter objects to regular dicts for template
-        approval_distribution_dict = dict(approval_distribution)
-        candidate_approval_distributions_dict = {
-            choice.choice_text: dict(candidate_approval_distributions[choice.id])
-            for choice in poll.choice_set.all()
-            if choice.id in candidate_approval_distributions
-        }
-        anyone_but_analysis_dict = dict(anyone_but_analysis)
+                both_count = int(co_approval_counts[i, j])
+                co_approval_rate = (both_count / choice_a_count) * 100
 
-        # Sort choices by vote count for consistent ordering
-        # Use the annotated choices queryset which already has vote_count
-        sorted_choices = list(choices)
-        choices_list = [choice.choice_text for choice in sorted_choices]
+                co_approvals.append(
+                    {
+                        "candidateA": choice_a.choice_text,
+                        "candidateB": choice_b.choice_text,
+                        "coApprovalCount": both_count,
+                        "coApprovalRate": co_approval_rate,
+                    }
+                )
 
-        # Pre-process approval distribution matrix data
-        max_approvals = (
-            max(approval_distribution_dict.keys()) if approval_distribution_dict else 0
-        )
-        approval_distribution_matrix = []
-
-        # Overall row
-        if approval_distribution_dict:
-            overall_row = {
-                "name": "All Candidates",
-                "is_overall": True,
-                "total_voters": total_ballots,
+        # Calculate "Anyone But" analysis - ballots with exactly N-1 approvals
+        for choice, count in zip(choice_list, matrix.anyone_but_counts()):
+            if count:
+                anyone_but_analysis[choice.choice_text] += int(count)
+
+    # Convert Counter objects to regular dicts for template
+    approval_distribution_dict = dict(approval_distribution)
+    candidate_approval_distributions_dict = {
+        choice.choice_text: dict(candidate_approval_distributions[choice.id])
+        for choice in choice_list
+        if choice.id in candidate_approval_distributions
+    }
+    anyone_but_analysis_dict = dict(anyone_but_analysis)
+
+    # Sort choices by vote count for consistent ordering
+    sorted_choices = choices
+    choices_list = [choice["choice_text"] for choice in sorted_choices]
+
+    # Pre-process approval distribution matrix data
+    max_approvals = (
+        max(approval_distribution_dict.keys()) if approval_distribution_dict else 0
+    )
+    approval_distribution_matrix = []
+
+    # Overall row
+    if approval_distribution_dict:
+        overall_row = {
+            "name": "All Candidates",
+            "is_overall": True,
+            "total_voters": total_ballots,
+            "distributions": [],
+        }
+        for num_approvals in range(1, max_approvals + 1):
+            count = approval_distribution_dict.get(num_approvals, 0)
+            percentage = (count / total_ballots * 100) if total_ballots > 0 else 0
+            overall_row["distributions"].append(
+                {
+                    "num_approvals": num_approvals,
+                    "count": count,
+                    "percentage": percentage,
+                }
+            )
+        approval_distribution_matrix.append(overall_row)
+
+    # Per-candidate rows
+    for choice in sorted_choices:
+        choice_name = choice["choice_text"]
+        if choice_name in candidate_approval_distributions_dict:
+            candidate_dist = candidate_approval_distributions_dict[choice_name]
+            total_voters = sum(candidate_dist.values())
+            candidate_row = {
+                "name": choice_name,
+                "is_overall": False,
+                "total_voters": total_voters,
                 "distributions": [],
             }
             for num_approvals in range(1, max_approvals + 1):
-                count = approval_distribution_dict.get(num_approvals, 0)
-                percentage = (count / total_ballots * 100) if total_ballots > 0 else 0
-                overall_row["distributions"].append(
+                count = candidate_dist.get(num_approvals, 0)
+                percentage = (count / total_voters * 100) if total_voters > 0 else 0
+                candidate_row["distributions"].append(
                     {
                         "num_approvals": num_approvals,
                         "count": count,
                         "percentage": percentage,
                     }
                 )
-            approval_distribution_matrix.append(overall_row)
-
-        # Per-candidate rows
-        for choice in sorted_choices:
-            choice_name = choice.choice_text
-            if choice_name in candidate_approval_distributions_dict:
-                candidate_dist = candidate_approval_distributions_dict[choice_name]
-                total_voters = sum(candidate_dist.values())
-                candidate_row = {
-                    "name": choice_name,
-                    "is_overall": False,
-                    "total_voters": total_voters,
-                    "distributions": [],
-                }
-                for num_approvals in range(1, max_approvals + 1):
-                    count = candidate_dist.get(num_approvals, 0)
-                    percentage = (count / total_voters * 100) if total_voters > 0 else 0
-                    candidate_row["distributions"].append(
-                        {
-                            "num_approvals": num_approvals,
-                            "count": count,
-                            "percentage": percentage,
-                        }
-                    )
-                approval_distribution_matrix.append(candidate_row)
-
-        # Pre-process co-approval matrix data (nested dict for easier template access)
-        co_approval_matrix = {}
-        max_co_approval_rate = 0
-        for co_approval in co_approvals:
-            candidate_a = co_approval["candidateA"]
-            candidate_b = co_approval["candidateB"]
-            if candidate_a not in co_approval_matrix:
-                co_approval_matrix[candidate_a] = {}
-            co_approval_matrix[candidate_a][candidate_b] = co_approval
-            if co_approval["coApprovalRate"] > max_co_approval_rate:
-                max_co_approval_rate = co_approval["coApprovalRate"]
-        # Ensure max is at least 1 to avoid division by zero in CSS
-        if max_co_approval_rate == 0:
-            max_co_approval_rate = 1
-
-        # Pre-process anyone but analysis (sorted by count descending)
-        anyone_but_sorted = sorted(
-            anyone_but_analysis_dict.items(), key=lambda x: x[1], reverse=True
-        )
-        total_exclusions = sum(anyone_but_analysis_dict.values())
+            approval_distribution_matrix.append(candidate_row)
+
+    # Pre-process co-approval matrix data (nested dict for easier template access)
+    co_approval_matrix = {}
+    max_co_approval_rate = 0
+    for co_approval in co_approvals:
+        candidate_a = co_approval["candidateA"]
+        candidate_b = co_approval["candidateB"]
+        if candidate_a not in co_approval_matrix:
+            co_approval_matrix[candidate_a] = {}
+        co_approval_matrix[candidate_a][candidate_b] = co_approval
+        if co_approval["coApprovalRate"] > max_co_approval_rate:
+            max_co_approval_rate = co_approval["coApprovalRate"]
+    # Ensure max is at least 1 to avoid division by zero in CSS
+    if max_co_approval_rate == 0:
+        max_co_approval_rate = 1
+
+    # Pre-process anyone but analysis (sorted by count descending)
+    anyone_but_sorted = sorted(
+        anyone_but_analysis_dict.items(), key=lambda x: x[1], reverse=True
+    )
+    total_exclusions = sum(anyone_but_analysis_dict.values())
 
-        voting_patterns = {
-            "totalBallots": total_ballots,
-            "approvalDistribution": approval_distribution_dict,
-            "candidateApprovalDistributions": candidate_approval_distributions_dict,
-            "anyoneButAnalysis": anyone_but_analysis_dict,
-        }
+    voting_patterns = {
+        "totalBallots": total_ballots,
+        "approvalDistribution": approval_distribution_dict,
+        "candidateApprovalDistributions": candidate_approval_distributions_dict,
+        "anyoneButAnalysis": anyone_but_analysis_dict,
+    }
 
-        # Add data to context
-        context.update(
-            {
-                "choices": choices,  # Approval results
-                "leading_choices": leading_choices,
-                "max_votes": max_votes,
-                "proportional_results": proportional_results,  # Proportional results
-                "total_proportional_votes": total_proportional_votes,
-                "co_approvals": co_approvals,  # Cast vote record analysis
-                "voting_patterns": voting_patterns,
-                "choices_list": choices_list,
-                "approval_distribution_matrix": approval_distribution_matrix,
-                "max_approvals": max_approvals,
-                "co_approval_matrix": co_approval_matrix,
-                "max_co_approval_rate": (
-                    max_co_approval_rate if max_co_approval_rate > 0 else 1
-                ),
-                "anyone_but_sorted": anyone_but_sorted,
-                "total_exclusions": total_exclusions,
-            }
-        )
-        return context
+    return {
+        "choices": choices,  # Approval results
+        "leading_choices": leading_choices,
+        "max_votes": max_votes,
+        "proportional_results": proportional_results,  # Proportional results
+        "total_proportional_votes": total_proportional_votes,
+        "co_approvals": co_approvals,  # Cast vote record analysis
+        "voting_patterns": voting_patterns,
+        "choices_list": choices_list,
+        "approval_distribution_matrix": approval_distribution_matrix,
+        "max_approvals": max_approvals,
+        "co_approval_matrix": co_approval_matrix,
+        "max_co_approval_rate": (
+            max_co_approval_rate if max_co_approval_rate > 0 else 1
+        ),
+        "anyone_but_sorted": anyone_but_sorted,
+        "total_exclusions": total_exclusions,
+    }
 
 
-def raw_ballots(request, poll_id):
-    poll = get_object_or_404(Poll, pk=poll_id, pub_date__lte=timezone.now())
+@staff_member_required
+def cache_stats_view(request):
+    # Counters are per process, so report which process answered.
+    return JsonResponse({"pid": os.getpid(), "caches": cache_stats()})
+
+
+def ballot_access_error(request, poll):
+    """
+    Return an error response if the user may not see the poll's ballots, or
+    None if they may.
+    """
     # Check if the poll is private
     if poll.is_private:
         if not request.user.is_authenticated:
@@ -677,52 +964,251 @@ def raw_ballots(request, poll_id):
 
             if not invitations:
                 return JsonResponse({"error": "Access denied"}, status=403)
+    return None
 
-    ballots = poll.ballot_set.prefetch_related(
-        Prefetch("vote_set", queryset=Vote.objects.select_related("choice"))
-    )
-    raw_ballots_data = []
-    for ballot in ballots:
-        approved_choice_ids = list(ballot.vote_set.values_list("choice_id", flat=True))
-        raw_ballots_data.append(approved_choice_ids)
+
+def raw_ballot_format(request):
+    raw_format = request.GET.get("format")
+    if raw_format is None:
+        # Let clients pick by content type too; anything else gets JSON.
+        accepted = {
+            f"{media_type.main_type}/{media_type.sub_type}"
+            for media_type in request.accepted_types
+        }
+        raw_format = next(
+            (
+                name
+                for name, content_type in RAW_BALLOT_FORMATS.items()
+                if content_type in accepted
+            ),
+            "json",
+        )
+    return raw_format
+
+
+@rate_limit("raw")
+@gzip_page
+@poll_conditional(lambda request, poll: (raw_ballot_format(request),))
+async def raw_ballots(request, poll_id):
+    poll = await aget_object_or_404(Poll, pk=poll_id, pub_date__lte=timezone.now())
+    error = await sync_to_async(ballot_access_error)(request, poll)
+    if error:
+        return error
 
     # We must also return choices if we're trying to consume them in JS
     # 'choice_text' is used for the Chart.js labels, so send them along:
-    choices_data = list(poll.choice_set.values("id", "choice_text"))
+    choices_data = [
+        choice
+        async for choice in poll.choice_set.order_by("id").values("id", "choice_text")
+    ]
+
+    # Ballots are streamed as they are read, so memory use doesn't grow with
+    # the size of the poll.
+    raw_format = raw_ballot_format(request)
+    if raw_format == "ndjson":
+        # One JSON document per line: the choices, then each ballot's
+        # approved choice IDs.
+        lines = chain([{"choices": choices_data}], poll_ballots(poll))
+        chunks = (
+            "".join(json.dumps(line) + "\n" for line in batch)
+            for batch in batched(lines, RAW_BALLOTS_CHUNK_SIZE)
+        )
+    elif raw_format == "bitmask":
+        chunks = bitmask.encode_chunks(
+            choices_data, poll_ballots(poll), RAW_BALLOTS_CHUNK_SIZE
+        )
+    else:
+        raw_format = "json"
+        chunks = ballots_json_chunks(choices_data, poll_ballots(poll))
+    # Under WSGI, Django would read an async iterator to the end before
+    # sending any of it.
+    if isinstance(request, ASGIRequest):
+        chunks = stream_from_thread(chunks)
+    response = StreamingHttpResponse(
+        chunks, content_type=RAW_BALLOT_FORMATS[raw_format]
+    )
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+def poll_ballots(poll):
+    """
+    Yield the approved choice IDs of each of the poll's ballots, in ballot
+    order, from a single query.
+    """
+    # Left join from Ballot so that ballots approving nothing still appear,
+    # with a single None choice.
+    rows = (
+        poll.ballot_set.order_by("id", "vote__id")
+        .values_list("id", "vote__choice_id")
+        .iterator(chunk_size=RAW_BALLOTS_CHUNK_SIZE)
+    )
+    for _, votes in groupby(rows, key=itemgetter(0)):
+        yield [choice_id for _, choice_id in votes if choice_id is not None]
+
+
+async def stream_from_thread(chunks):
+    """
+    Iterate over ``chunks`` a chunk at a time in the request's thread, the
+    way QuerySet.aiterator() fetches rows, so an ASGI server streams a
+    response read from the database without tying up a thread in between.
+    """
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def ballots_json_chunks(choices_data, ballots):
+    """
+    Encode ``{"choices": [...], "ballots": [...]}`` piece by piece, a chunk
+    of ballots at a time.
+    """
+    yield '{"choices": %s, "ballots": [' % json.dumps(choices_data)
+    separator = ""
+    for batch in batched(ballots, RAW_BALLOTS_CHUNK_SIZE):
+        yield separator + ", ".join(map(json.dumps, batch))
+        separator = ", "
+    yield "]}"
+
+
+def requested_seats(request):
+    """The ``?seats=`` of the request, or None if it is out of range."""
+    try:
+        seats = int(request.GET.get("seats", ""))
+    except ValueError:
+        return None
+    return seats if 1 <= seats <= SPAV_MAX_SEATS else None
+
+
+def seats_error():
+    return JsonResponse(
+        {"error": f"seats must be between 1 and {SPAV_MAX_SEATS}"}, status=400
+    )
+
+
+def snapshot_pending():
+    response = JsonResponse({"pending": True}, status=202)
+    response["Retry-After"] = SNAPSHOT_RETRY_AFTER
+    return response
 
+
+@rate_limit("results")
+async def spav(request, poll_id):
+    poll = await aget_object_or_404(Poll, pk=poll_id, pub_date__lte=timezone.now())
+    error = await sync_to_async(ballot_access_error)(request, poll)
+    if error:
+        return error
+
+    seats = requested_seats(request)
+    if seats is None:
+        return seats_error()
+
+    if poll.ballot_count >= settings.RESULTS_JOB_MIN_BALLOTS:
+        snapshot = await sync_to_async(background_snapshot)(poll)
+        if snapshot is None:
+            return snapshot_pending()
+        sweep = snapshot.data["spav"]
+    else:
+        sweep = await aspav_sweep(poll, analytics_executor)
+
+    # The seat for round n never depends on later rounds, so any seat count
+    # is a prefix of the full sweep.
+    winners = sweep["winners"][:seats]
+    seat_counts = Counter(winners)
     return JsonResponse(
         {
-            "ballots": raw_ballots_data,
-            "choices": choices_data,  # <--- Make sure we're returning this!
+            "seats": seats,
+            "revision": poll.revision,
+            "choices": [
+                dict(choice, seats=seat_counts[choice["id"]])
+                for choice in sweep["choices"]
+            ],
+            "rounds": [
+                {"winner": winner, "scores": scores}
+                for winner, scores in zip(winners, sweep["scores"])
+            ],
         }
     )
 
 
-def create_ballot(poll, user=None, permit_email=False):
-    return poll.ballot_set.create(
-        timestamp=timezone.now(), user=user, permit_email=permit_email
+@rate_limit("results")
+async def proportional_allocation(request, poll_id):
+    """
+    The seats each choice wins under ``?method=``, one of the methods in
+    approval_polls.proportional, for ``?seats=`` seats. Large polls are
+    allocated from their background snapshot's ballots, like spav().
+    """
+    poll = await aget_object_or_404(Poll, pk=poll_id, pub_date__lte=timezone.now())
+    error = await sync_to_async(ballot_access_error)(request, poll)
+    if error:
+        return error
+
+    method = request.GET.get("method", "")
+    if method not in proportional.METHODS:
+        return JsonResponse(
+            {"error": f"method must be one of {', '.join(proportional.METHODS)}"},
+            status=400,
+        )
+    seats = requested_seats(request)
+    if seats is None:
+        return seats_error()
+
+    snapshot = None
+    if poll.ballot_count >= settings.RESULTS_JOB_MIN_BALLOTS:
+        snapshot = await sync_to_async(background_snapshot)(poll)
+        if snapshot is None:
+            return snapshot_pending()
+    allocation = await aproportional_allocation(
+        poll, method, seats, analytics_executor, snapshot=snapshot
+    )
+    seat_counts = Counter(allocation["winners"])
+    return JsonResponse(
+        {
+            "method": method,
+            "seats": seats,
+            "revision": poll.revision,
+            "choices": [
+                dict(choice, seats=seat_counts[choice["id"]])
+                for choice in allocation["choices"]
+            ],
+            "winners": allocation["winners"],
+        }
     )
 
 
-def update_ballot_votes(ballot, poll, request):
-    for counter, choice in enumerate(poll.choice_set.all()):
-        choice_key = f"choice{counter + 1}"
-        if choice_key in request.POST:
-            if not ballot.vote_set.filter(choice=choice).exists():
-                ballot.vote_set.create(choice=choice)
-        else:
-            ballot.vote_set.filter(choice=choice).delete()
-    handle_write_ins(ballot, poll, request)
+def ballot_approvals(poll, request):
+    """The choice IDs checked in the POST data, by their position on the form."""
+    return [
+        choice_id
+        for counter, choice_id in enumerate(
+            poll.choice_set.values_list("id", flat=True)
+        )
+        if f"choice{counter + 1}" in request.POST
+    ]
 
 
 def handle_email_opt_in(request):
     return "email_opt_in" in request.POST
 
 
+def too_many_votes(request, wait, poll_id):
+    messages.error(
+        request,
+        "Too many votes have come from your network. "
+        f"Please try again in {math.ceil(wait)} seconds.",
+    )
+    return HttpResponseRedirect(reverse("detail", args=(poll_id,)))
+
+
 @require_http_methods(["POST"])
+@rate_limit("vote", key=("user", "poll"), limited=too_many_votes)
 def vote(request, poll_id):
+    # Without the queue the vote is cast in the transaction that checks it,
+    # which then takes the write lock from the start. With it, the checks
+    # only read, and must not wait for the vote writer.
+    checks = transaction.atomic if settings.VOTE_QUEUE else write_transaction
     try:
-        with transaction.atomic():
+        with checks():
             poll = get_object_or_404(Poll, pk=poll_id)
 
             # Check if poll is closed
@@ -737,11 +1223,12 @@ def vote(request, poll_id):
 
             poll_vtype = poll.vtype
             user = request.user if request.user.is_authenticated else None
-            ballot = None
+            # Whose ballot the vote goes to, as arguments of Poll.cast_ballot
+            voter = None
 
             # Handle different voting types
             if poll_vtype == 1:
-                ballot = create_ballot(poll, permit_email=handle_email_opt_in(request))
+                voter = {}
             elif poll_vtype == 2:
                 if not user:
                     messages.error(
@@ -752,10 +1239,8 @@ def vote(request, poll_id):
                         + "?next="
                         + reverse("detail", args=(poll.id,))
                     )
-                ballot, created = poll.ballot_set.get_or_create(
-                    user=user, defaults={"permit_email": handle_email_opt_in(request)}
-                )
-                if not created:
+                voter = {"user": user}
+                if poll.ballot_set.filter(user=user).exists():
                     messages.warning(
                         request,
                         "You have already voted in this poll. Your vote will be updated.",
@@ -768,30 +1253,50 @@ def vote(request, poll_id):
                     messages.error(request, "Invalid invitation details provided.")
                     return HttpResponseRedirect(reverse("detail", args=(poll.id,)))
 
-                invitations = VoteInvitation.objects.filter(
+                invitation = VoteInvitation.objects.filter(
                     key=invitation_key, email=invitation_email, poll_id=poll.id
-                )
-                if invitations.exists():
-                    ballot = invitations.first().ballot
+                ).first()
+                if invitation is not None:
+                    if invitation.ballot_id:
+                        voter = {"ballot": invitation.ballot}
                 elif user:
                     if user.email not in poll.invited_emails():
                         messages.error(
                             request, "You are not invited to vote in this poll."
                         )
                         return HttpResponseRedirect(reverse("detail", args=(poll.id,)))
-                    ballot, created = poll.ballot_set.get_or_create(
-                        user=user,
-                        defaults={"permit_email": handle_email_opt_in(request)},
+                    voter = {"user": user}
+
+            if voter is not None:
+                vote = {
+                    "approvals": ballot_approvals(poll, request),
+                    "write_ins": write_ins(request),
+                    "permit_email": handle_email_opt_in(request),
+                    **voter,
+                }
+                if not settings.VOTE_QUEUE:
+                    if not use_vote_token(request, poll):
+                        return already_voted(request, poll)
+                    poll.cast_ballot(**vote)
+                    messages.success(
+                        request, "Your vote has been recorded successfully."
                     )
-
-            if ballot:
-                update_ballot_votes(ballot, poll, request)
-                messages.success(request, "Your vote has been recorded successfully.")
-                return HttpResponseRedirect(reverse("results", args=(poll.id,)))
+                    return HttpResponseRedirect(reverse("results", args=(poll.id,)))
             else:
                 messages.error(request, "Unable to record your vote. Please try again.")
                 return HttpResponseRedirect(reverse("detail", args=(poll.id,)))
 
+        # Queue the vote outside the transaction above, so that only these
+        # two inserts hold the write lock.
+        with write_transaction():
+            if not use_vote_token(request, poll):
+                return already_voted(request, poll)
+            QueuedVote.objects.create(poll=poll, **vote)
+        messages.success(
+            request, "Your vote has been received and will be counted in a few seconds."
+        )
+        return HttpResponseRedirect(reverse("results", args=(poll.id,)))
+
     except Exception as e:
         logger.error(f"Error processing vote: {str(e)}")
         messages.error(request, "An error occurred while processing your vote.")
@@ -802,44 +1307,49 @@ def vote(request, poll_id):
     )
 
 
-def handle_write_ins(ballot, poll, request):
-    with transaction.atomic():
-        for key, value in request.POST.items():
-            choice_txt = request.POST.get(f"{key}txt", "").strip()
-            if not choice_txt:
-                continue
+def use_vote_token(request, poll):
+    """
+    Record the vote form's idempotency token as used, in anonymous polls.
+    Returns False if the vote was already submitted with this token.
+    """
+    if poll.vtype != 1:
+        return True
+    try:
+        key = uuid.UUID(request.POST.get("vote_token", ""))
+    except ValueError:
+        # Forms rendered before tokens were added
+        return True
+    return VoteToken.use(key, poll)
 
-            # Validate write-in text length
-            if len(choice_txt) > 200:  # Match model's max_length
-                logger.warning(f"Write-in text too long: {choice_txt[:50]}...")
-                continue
 
-            try:
-                # Use select_for_update to prevent race conditions
-                choice = (
-                    poll.choice_set.select_for_update()
-                    .filter(choice_text=choice_txt)
-                    .first()
-                )
+def already_voted(request, poll):
+    messages.info(request, "Your vote has already been recorded.")
+    return HttpResponseRedirect(reverse("results", args=(poll.id,)))
 
-                if not choice:
-                    choice = poll.choice_set.create(
-                        choice_text=choice_txt,
-                        choice_link=request.POST.get(f"linkurl-{key}", "").strip(),
-                    )
 
-                # Create vote if it doesn't exist
-                if not ballot.vote_set.filter(choice=choice).exists():
-                    ballot.vote_set.create(choice=choice)
+def write_ins(request):
+    """The `(text, link)` of each checked write-in choice in the POST data."""
+    entries = []
+    for key in request.POST:
+        choice_txt = request.POST.get(f"{key}txt", "").strip()
+        if not choice_txt:
+            continue
 
-            except Exception as e:
-                logger.error(f"Error processing write-in vote: {str(e)}")
-                continue
+        # Validate write-in text length
+        if len(choice_txt) > 200:  # Match model's max_length
+            logger.warning(f"Write-in text too long: {choice_txt[:50]}...")
+            continue
+
+        entries.append((choice_txt, request.POST.get(f"linkurl-{key}", "").strip()))
+    return entries
 
 
-def embed_instructions(request, poll_id):
+async def embed_instructions(request, poll_id):
     link = request.build_absolute_uri("/{}".format(poll_id))
-    return render(request, "embed_instructions.html", {"link": link})
+    # The base template's context processors load the session and user
+    return await sync_to_async(render)(
+        request, "embed_instructions.html", {"link": link}
+    )
 
 
 class CreateView(generic.View):
@@ -0,0 +1,234 @@
+"""
+Compare how many concurrent connections the WSGI and ASGI servers keep up with.
+
+Usage:
+    python benchmarks/bench_asgi.py [--slow-clients 32] [--read-rate 65536]
+        [--ballots 50000] [--workers 1] [--seconds 10]
+
+Both modes serve a fresh SQLite database holding a poll with --ballots
+ballots, the way entrypoint.sh would: "wsgi" with Gunicorn's sync workers and
+"asgi" with uvicorn, --workers processes each. --slow-clients connections
+download the poll's raw ballots over and over, each reading at most
+--read-rate bytes per second like a client on a slow network, while a probe
+loads the embed instructions page one request at a time. A sync worker is
+held by a download until the client has read all of it, so the probe waits
+for a free worker; under ASGI a download waiting on its client only holds a
+coroutine.
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+DIRECTORY = tempfile.mkdtemp()
+settings.DATABASES["default"]["NAME"] = os.path.join(DIRECTORY, "bench.sqlite3")
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from approval_polls.models import Ballot, Poll, Vote  # noqa: E402
+
+# The servers import these settings instead, to use the benchmark database
+# without rate limits.
+SETTINGS_MODULE = f"""
+from approval_polls.settings import *
+
+DATABASES["default"]["NAME"] = {settings.DATABASES["default"]["NAME"]!r}
+DATABASES["default"]["CONN_MAX_AGE"] = 0
+RATE_LIMITS = {{}}
+"""
+
+SERVERS = {
+    "wsgi": ["gunicorn", "approval_polls.wsgi:application", "--worker-class", "sync"],
+    "asgi": ["uvicorn", "approval_polls.asgi:application", "--log-level", "warning"],
+}
+
+HOST = "127.0.0.1"
+
+
+def reset_database(num_choices, num_ballots):
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench", "bench@example.com", "bench")
+    poll = Poll.objects.create(
+        question="Benchmark poll", pub_date=timezone.now(), user=user, vtype=1
+    )
+    choices = [
+        poll.choice_set.create(choice_text=f"Choice {n}") for n in range(num_choices)
+    ]
+    ballots = Ballot.objects.bulk_create(
+        [Ballot(poll=poll) for _ in range(num_ballots)], batch_size=2000
+    )
+    Vote.objects.bulk_create(
+        [
+            Vote(ballot=ballot, choice=choice)
+            for n, ballot in enumerate(ballots)
+            for m, choice in enumerate(choices)
+            if (n + m) % 3 == 0
+        ],
+        batch_size=2000,
+    )
+    call_command("rebuild_tallies", stdout=io.StringIO())
+    connections.close_all()
+    return poll.id
+
+
+def start_server(mode, port, workers):
+    with open(os.path.join(DIRECTORY, "bench_settings.py"), "w") as module:
+        module.write(SETTINGS_MODULE)
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "bench_settings",
+        "PYTHONPATH": os.pathsep.join([DIRECTORY, ROOT]),
+    }
+    if mode == "wsgi":
+        address = ["--bind", f"{HOST}:{port}", "--workers", str(workers)]
+    else:
+        address = ["--host", HOST, "--port", str(port), "--workers", str(workers)]
+    server = subprocess.Popen(
+        SERVERS[mode] + address,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"The {mode} server didn't start")
+
+
+async def get(port, path, read_rate=None, timeout=30):
+    """
+    GET `path`, reading the response at up to `read_rate` bytes per second.
+    Returns the status and the number of bytes read.
+    """
+    sock = socket.socket()
+    # A small receive buffer, so a slow reader holds the server up as it
+    # would over a real network rather than the loopback interface.
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (HOST, port))
+    reader, writer = await asyncio.open_connection(sock=sock, limit=2**20)
+    try:
+        request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+        writer.write(request.encode())
+        async with asyncio.timeout(timeout):
+            status = int((await reader.readline()).split()[1])
+            received = 0
+            while chunk := await reader.read(16384):
+                received += len(chunk)
+                if read_rate:
+                    await asyncio.sleep(len(chunk) / read_rate)
+        return status, received
+    finally:
+        writer.close()
+
+
+async def slow_client(port, path, read_rate, deadline, results):
+    while time.monotonic() < deadline:
+        try:
+            status, received = await get(port, path, read_rate)
+            results.append(received if status == 200 else None)
+        except (OSError, TimeoutError, ValueError, IndexError):
+            results.append(None)
+
+
+async def probe(port, path, deadline, latencies, failures):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            status, _ = await get(port, path, timeout=10)
+        except (OSError, TimeoutError, ValueError, IndexError):
+            status = None
+        if status == 200:
+            latencies.append(time.monotonic() - started)
+        else:
+            failures.append(status)
+            await asyncio.sleep(0.1)
+
+
+async def load(port, poll_id, args):
+    raw = reverse("raw", args=(poll_id,))
+    embed = reverse("embed_instructions", args=(poll_id,))
+    deadline = time.monotonic() + args.seconds
+    downloads, latencies, failures = [], [], []
+    await asyncio.gather(
+        probe(port, embed, deadline, latencies, failures),
+        *(
+            slow_client(port, raw, args.read_rate, deadline, downloads)
+            for _ in range(args.slow_clients)
+        ),
+    )
+    return downloads, latencies, failures
+
+
+def run(mode, poll_id, args):
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        port = sock.getsockname()[1]
+    server = start_server(mode, port, args.workers)
+    try:
+        downloads, latencies, failures = asyncio.run(load(port, poll_id, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    completed = [received for received in downloads if received is not None]
+    print(f"{mode}:")
+    print(
+        f"  downloads: {len(completed)} completed,"
+        f" {len(downloads) - len(completed)} failed,"
+        f" {sum(completed) / args.seconds / 1024:.0f} KiB/s"
+    )
+    if latencies:
+        latencies.sort()
+        print(
+            f"  probe: {len(latencies)} requests, failed {len(failures)},"
+            f" latency median {statistics.median(latencies) * 1000:.1f}ms"
+            f" p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+        )
+    else:
+        print(f"  probe: no requests completed, failed {len(failures)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--slow-clients", type=int, default=32)
+    parser.add_argument("--read-rate", type=int, default=65536)
+    parser.add_argument("--ballots", type=int, default=50000)
+    parser.add_argument("--choices", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    poll_id = reset_database(args.choices, args.ballots)
+    for mode in SERVERS:
+        run(mode, poll_id, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Measure how fast cast vote records are imported, in ballots per second.
+
+Usage:
+    python benchmarks/bench_cvr_import.py [--ballots 50000] [--choices 10]
+        [--batch-sizes 500,2000,10000] [--votes 500]
+
+Writes --ballots random ballots to a CSV and an NDJSON file and imports each
+into a new poll of a fresh SQLite database file with every --batch-sizes,
+timing the whole import including the validation pass. For comparison,
+--votes of the same ballots are then cast one at a time through the vote
+view, the only way in before.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+DIRECTORY = tempfile.mkdtemp()
+settings.DATABASES["default"]["NAME"] = os.path.join(DIRECTORY, "bench.sqlite3")
+django.setup()
+settings.ALLOWED_HOSTS.append("testserver")
+settings.RATE_LIMITS = {}
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import reset_queries  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from approval_polls import cvr  # noqa: E402
+from approval_polls.models import Poll  # noqa: E402
+
+
+def create_poll(user, num_choices):
+    poll = Poll.objects.create(
+        question="Benchmark poll", pub_date=timezone.now(), user=user, vtype=1
+    )
+    for n in range(num_choices):
+        poll.choice_set.create(choice_text=f"Choice {n}")
+    return poll
+
+
+def write_files(ballots, num_choices):
+    names = [f"Choice {n}" for n in range(num_choices)]
+    paths = {
+        "csv": os.path.join(DIRECTORY, "ballots.csv"),
+        "ndjson": os.path.join(DIRECTORY, "ballots.ndjson"),
+    }
+    with open(paths["csv"], "w") as file:
+        file.write(",".join(names) + "\n")
+        for approved in ballots:
+            file.write(
+                ",".join("1" if n in approved else "" for n in range(num_choices))
+            )
+            file.write("\n")
+    with open(paths["ndjson"], "w") as file:
+        for approved in ballots:
+            file.write("[" + ", ".join(f'"{names[n]}"' for n in sorted(approved)))
+            file.write("]\n")
+    return paths
+
+
+def import_file(user, path, file_format, batch_size, num_choices):
+    poll = create_poll(user, num_choices)
+    started = time.perf_counter()
+    with open(path, "rb") as file:
+        ballot_import = cvr.import_ballots(
+            poll,
+            file,
+            os.path.basename(path),
+            file_format,
+            batch_size=batch_size,
+            # Stop DEBUG's query log from growing across batches
+            progress=lambda *args: reset_queries(),
+        )
+    return ballot_import.ballots, time.perf_counter() - started
+
+
+def cast_votes(user, ballots, num_choices):
+    poll = create_poll(user, num_choices)
+    client = Client()
+    url = reverse("vote", args=(poll.id,))
+    started = time.perf_counter()
+    for approved in ballots:
+        client.post(url, {f"choice{n + 1}": "" for n in approved})
+        reset_queries()
+    return len(ballots), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ballots", type=int, default=50000)
+    parser.add_argument("--choices", type=int, default=10)
+    parser.add_argument("--batch-sizes", default="500,2000,10000")
+    parser.add_argument("--votes", type=int, default=500)
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench", "bench@example.com", "bench")
+    rng = random.Random(0)
+    ballots = [
+        {n for n in range(args.choices) if rng.random() < 0.3}
+        for _ in range(args.ballots)
+    ]
+    paths = write_files(ballots, args.choices)
+
+    for file_format, path in paths.items():
+        for batch_size in map(int, args.batch_sizes.split(",")):
+            count, elapsed = import_file(
+                user, path, file_format, batch_size, args.choices
+            )
+            print(
+                f"import_cvr {file_format:>6}, batch {batch_size:>5}:"
+                f" {count} ballots in {elapsed:.1f}s ({count / elapsed:,.0f}/s)"
+            )
+
+    count, elapsed = cast_votes(user, ballots[: args.votes], args.choices)
+    print(
+        f"vote() per ballot:          {count} ballots in {elapsed:.1f}s"
+        f" ({count / elapsed:,.0f}/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Compare the proportional methods with straightforward per-ballot loops.
+
+Usage:
+    python benchmarks/bench_proportional.py [--choices 12] [--seats 10]
+        [--ballots 1000 10000 100000]
+
+Ballots are generated in memory, so no database is needed. The reference
+implementations walk every ballot in every round, the way the results page
+SPAV did in the browser. Their PAV is SPAV followed by the same single-seat
+swap search, scoring each candidate committee ballot by ballot. The timings
+for the library include building the BallotMatrix.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+
+django.setup()
+
+from approval_polls import proportional  # noqa: E402
+from approval_polls.tally import BallotMatrix  # noqa: E402
+
+
+def reference_spav(choice_ids, ballots, seats):
+    won = [0] * len(ballots)
+    winners = []
+    for _ in range(seats):
+        scores = dict.fromkeys(choice_ids, 0.0)
+        for ballot, count in zip(ballots, won):
+            for choice_id in ballot:
+                scores[choice_id] += 1 / (1 + count)
+        winner = max(choice_ids, key=scores.get)
+        winners.append(winner)
+        won = [count + (winner in ballot) for ballot, count in zip(ballots, won)]
+    return winners
+
+
+def reference_pav(choice_ids, ballots, seats):
+    def score(counts):
+        total = 0.0
+        for ballot in ballots:
+            total += sum(1 / n for n in range(1, sum(counts[c] for c in ballot) + 1))
+        return total
+
+    counts = dict.fromkeys(choice_ids, 0)
+    for winner in reference_spav(choice_ids, ballots, seats):
+        counts[winner] += 1
+    best = score(counts)
+    improved = True
+    while improved:
+        improved = False
+        for i in choice_ids:
+            for j in choice_ids:
+                if i == j or not counts[i]:
+                    continue
+                counts[i] -= 1
+                counts[j] += 1
+                moved = score(counts)
+                if moved > best + 1e-9:
+                    best, improved = moved, True
+                    break
+                counts[i] += 1
+                counts[j] -= 1
+            if improved:
+                break
+    return [c for c in choice_ids for _ in range(counts[c])]
+
+
+def reference_phragmen(choice_ids, ballots, seats):
+    loads = [0.0] * len(ballots)
+    winners = []
+    for _ in range(seats):
+        best, best_load = choice_ids[0], float("inf")
+        for choice_id in choice_ids:
+            total, approvers = 1.0, 0
+            for ballot, load in zip(ballots, loads):
+                if choice_id in ballot:
+                    total += load
+                    approvers += 1
+            if approvers and total / approvers < best_load:
+                best, best_load = choice_id, total / approvers
+        loads = [
+            best_load if best in ballot else load
+            for ballot, load in zip(ballots, loads)
+        ]
+        winners.append(best)
+    return winners
+
+
+def reference_allocated(choice_ids, ballots, seats):
+    weights = [1.0] * len(ballots)
+    quota = len(ballots) / seats
+    winners = []
+    for _ in range(seats):
+        support = dict.fromkeys(choice_ids, 0.0)
+        for ballot, weight in zip(ballots, weights):
+            for choice_id in ballot:
+                support[choice_id] += weight
+        best = max(choice_ids, key=support.get)
+        scale = 1 - quota / support[best] if support[best] > quota else 0
+        weights = [
+            weight * scale if best in ballot else weight
+            for ballot, weight in zip(ballots, weights)
+        ]
+        winners.append(best)
+    return winners
+
+
+REFERENCES = {
+    "spav": reference_spav,
+    "pav": reference_pav,
+    "phragmen": reference_phragmen,
+    "allocated": reference_allocated,
+}
+
+
+def generate(num_ballots, choice_ids, seed=0):
+    rng = random.Random(seed)
+    odds = {choice_id: rng.uniform(0.05, 0.6) for choice_id in choice_ids}
+    return [
+        {choice_id for choice_id in choice_ids if rng.random() < odds[choice_id]}
+        for _ in range(num_ballots)
+    ]
+
+
+def library(method, choice_ids, ballots, seats):
+    matrix = BallotMatrix.from_ballots(choice_ids, ballots)
+    return [choice_ids[i] for i in proportional.allocate(method, matrix, seats)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--choices", type=int, default=12)
+    parser.add_argument("--seats", type=int, default=10)
+    parser.add_argument(
+        "--ballots", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    args = parser.parse_args()
+
+    choice_ids = list(range(1, args.choices + 1))
+    print(
+        f"{'method':>10} {'ballots':>10} {'reference (s)':>14}"
+        f" {'library (s)':>12} {'speedup':>9}"
+    )
+    for num_ballots in args.ballots:
+        ballots = generate(num_ballots, choice_ids)
+        for method, reference in REFERENCES.items():
+            reference_time, expected = timed(reference, choice_ids, ballots, args.seats)
+            library_time, winners = timed(
+                library, method, choice_ids, ballots, args.seats
+            )
+            if sorted(winners) != sorted(expected):
+                print(f"  {method}: committees differ {winners} {expected}")
+            print(
+                f"{method:>10} {num_ballots:>10} {reference_time:>14.4f}"
+                f" {library_time:>12.4f} {reference_time / library_time:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Compare read and write throughput with and without the SQLite tuning.
+
+Usage:
+    python benchmarks/bench_sqlite.py [--readers 4] [--writers 4]
+        [--seconds 10] [--ballots 2000]
+
+Each mode migrates a fresh SQLite database file holding a poll with
+--ballots ballots. --readers processes then load its results page while
+--writers processes vote in it through the Django test client for
+--seconds, the way gunicorn workers would. "baseline" is the old
+configuration: a new connection per request, rollback journal and deferred
+transactions. "tuned" uses the DATABASES and SQLITE_PRAGMAS settings.
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.DATABASES["default"]["NAME"] = os.path.join(
+    tempfile.mkdtemp(), "bench.sqlite3"
+)
+django.setup()
+settings.ALLOWED_HOSTS.append("testserver")
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from approval_polls.models import Ballot, Poll, Vote  # noqa: E402
+
+TUNED = {
+    "database": dict(settings.DATABASES["default"]),
+    "pragmas": dict(settings.SQLITE_PRAGMAS),
+}
+BASELINE = {
+    "database": {
+        **TUNED["database"],
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+        "OPTIONS": {},
+    },
+    "pragmas": {},
+}
+
+
+def configure(mode):
+    settings.DATABASES["default"].clear()
+    settings.DATABASES["default"].update(mode["database"])
+    settings.SQLITE_PRAGMAS = mode["pragmas"]
+
+
+def reset_database(num_choices, num_ballots):
+    connections.close_all()
+    path = settings.DATABASES["default"]["NAME"]
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench", "bench@example.com", "bench")
+    poll = Poll.objects.create(
+        question="Benchmark poll", pub_date=timezone.now(), user=user, vtype=1
+    )
+    choices = [
+        poll.choice_set.create(choice_text=f"Choice {n}") for n in range(num_choices)
+    ]
+    rng = random.Random(0)
+    for _ in range(num_ballots):
+        ballot = Ballot.objects.create(poll=poll)
+        Vote.objects.bulk_create(
+            [Vote(ballot=ballot, choice=c) for c in choices if rng.random() < 0.4]
+        )
+    call_command("rebuild_tallies", stdout=io.StringIO())
+    connections.close_all()
+    return poll.id
+
+
+def client_loop(request, deadline, results):
+    client = Client()
+    succeeded = failed = 0
+    latencies = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        ok = request(client)
+        latencies.append(time.perf_counter() - started)
+        if ok:
+            succeeded += 1
+        else:
+            failed += 1
+    results.put((succeeded, failed, latencies))
+
+
+def read(poll_id):
+    url = reverse("results", args=(poll_id,))
+    return lambda client: client.get(url).status_code == 200
+
+
+def write(poll_id, num_choices, seed):
+    url = reverse("vote", args=(poll_id,))
+    results_url = reverse("results", args=(poll_id,))
+    rng = random.Random(seed)
+
+    def request(client):
+        data = {
+            f"choice{n}": "" for n in range(1, num_choices + 1) if rng.random() < 0.4
+        }
+        response = client.post(url, data)
+        return response.status_code == 302 and response["Location"] == results_url
+
+    return request
+
+
+def run(name, mode, args):
+    configure(mode)
+    poll_id = reset_database(args.choices, args.ballots)
+    context = multiprocessing.get_context("fork")
+    reads, writes = context.Queue(), context.Queue()
+
+    deadline = time.perf_counter() + args.seconds
+    processes = [
+        context.Process(target=client_loop, args=(read(poll_id), deadline, reads))
+        for _ in range(args.readers)
+    ] + [
+        context.Process(
+            target=client_loop,
+            args=(write(poll_id, args.choices, seed), deadline, writes),
+        )
+        for seed in range(args.writers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = {
+        "reads": [reads.get() for _ in range(args.readers)],
+        "writes": [writes.get() for _ in range(args.writers)],
+    }
+    for process in processes:
+        process.join()
+    connections.close_all()
+
+    print(f"{name}:")
+    for kind, results in outcomes.items():
+        succeeded = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        latencies = sorted(latency for result in results for latency in result[2])
+        if not latencies:
+            continue
+        print(
+            f"  {kind:>6}: {succeeded / args.seconds:7.1f}/s, failed {failed},"
+            f" latency median {statistics.median(latencies) * 1000:.1f}ms"
+            f" p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--choices", type=int, default=10)
+    parser.add_argument("--ballots", type=int, default=2000)
+    args = parser.parse_args()
+
+    run("baseline", BASELINE, args)
+    run("tuned", TUNED, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure how fast tag autocomplete suggestions are looked up.
+
+Usage:
+    python benchmarks/bench_tag_suggestions.py [--tags 1000,100000]
+        [--lookups 10000]
+
+For each --tags size, adds that many random tags with random public poll
+counts to a fresh SQLite database file, builds the tag index from them and
+times --lookups suggestions for random one to three letter prefixes. One
+letter prefixes match the most tags, so they would take the longest, but
+their suggestions are kept until the index changes; the first lookup of
+each is timed separately.
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+DIRECTORY = tempfile.mkdtemp()
+settings.DATABASES["default"]["NAME"] = os.path.join(DIRECTORY, "bench.sqlite3")
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+
+from approval_polls.models import PollTag, TagStats  # noqa: E402
+from approval_polls.tagindex import TagIndex  # noqa: E402
+
+
+def create_tags(rng, num_tags):
+    PollTag.objects.all().delete()
+    texts = set()
+    while len(texts) < num_tags:
+        texts.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12))))
+    tags = PollTag.objects.bulk_create(
+        [PollTag(tag_text=text) for text in texts], batch_size=2000
+    )
+    TagStats.objects.bulk_create(
+        [TagStats(tag=tag, public_polls=rng.randint(1, 1000)) for tag in tags],
+        batch_size=2000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tags", default="1000,100000")
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    rng = random.Random(0)
+    for num_tags in map(int, args.tags.split(",")):
+        create_tags(rng, num_tags)
+        index = TagIndex()
+        started = time.perf_counter()
+        index.sync()
+        print(f"{num_tags:>7} tags: built in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        for letter in string.ascii_lowercase:
+            index.suggest(letter, 10)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{num_tags:>7} tags, first 1 letter lookups:"
+            f" {elapsed / 26 * 1e6:,.1f}µs per lookup"
+        )
+
+        for length in (1, 2, 3):
+            prefixes = [
+                "".join(rng.choices(string.ascii_lowercase, k=length))
+                for _ in range(args.lookups)
+            ]
+            started = time.perf_counter()
+            for prefix in prefixes:
+                index.suggest(prefix, 10)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{num_tags:>7} tags, {length} letter prefixes:"
+                f" {elapsed / args.lookups * 1e6:,.1f}µs per lookup"
+            )
+
+
+if __name__ == "__main__":
+    main()
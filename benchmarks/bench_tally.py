@@ -0,0 +1,121 @@
+"""
+Compare the results-page analytics loop with the BallotMatrix tally engine.
+
+Usage:
+    python benchmarks/bench_tally.py [--choices 10] [--ballots 1000 10000 100000]
+
+Vote rows are generated in memory in the ``(ballot_id, choice_id)`` shape the
+database returns, so no database is needed. The legacy implementation below
+mirrors the loop that ``ResultsView`` used before the tally engine: per-ballot
+sets, then choices x choices x ballots membership tests for the co-approval
+matrix. It leaves out the per-ballot ``vote_set`` query the old view also
+issued, so the real-world gap is wider than the one reported here.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+
+django.setup()
+
+from approval_polls.tally import BallotMatrix  # noqa: E402
+
+
+def legacy(choice_ids, rows):
+    ballot_approvals = defaultdict(set)
+    for ballot_id, choice_id in rows:
+        ballot_approvals[ballot_id].add(choice_id)
+
+    approval_distribution = Counter()
+    candidate_approval_distributions = defaultdict(Counter)
+    for approved in ballot_approvals.values():
+        approval_distribution[len(approved)] += 1
+        for choice_id in approved:
+            candidate_approval_distributions[choice_id][len(approved)] += 1
+
+    co_approvals = {}
+    for a in choice_ids:
+        a_ballots = [b for b, approved in ballot_approvals.items() if a in approved]
+        if not a_ballots:
+            continue
+        for b in choice_ids:
+            if a != b:
+                co_approvals[a, b] = sum(
+                    1 for ballot in a_ballots if b in ballot_approvals[ballot]
+                )
+
+    anyone_but = Counter()
+    all_choices = set(choice_ids)
+    for approved in ballot_approvals.values():
+        if len(approved) == len(choice_ids) - 1:
+            anyone_but[next(iter(all_choices - approved))] += 1
+
+    return co_approvals, approval_distribution, anyone_but
+
+
+def engine(choice_ids, rows):
+    ballot_ids, vote_choice_ids = zip(*rows)
+    matrix = BallotMatrix.from_rows(choice_ids, ballot_ids, vote_choice_ids)
+    return (
+        matrix.co_approval_counts(),
+        matrix.approval_distribution(),
+        matrix.candidate_approval_distributions(),
+        matrix.anyone_but_counts(),
+        matrix.proportional_votes(),
+    )
+
+
+def generate(num_ballots, choice_ids, seed=0):
+    rng = random.Random(seed)
+    # Skew approval odds so the ballots look like a real poll rather than
+    # uniform noise.
+    odds = {choice_id: rng.uniform(0.05, 0.6) for choice_id in choice_ids}
+    return [
+        (ballot_id, choice_id)
+        for ballot_id in range(num_ballots)
+        for choice_id in choice_ids
+        if rng.random() < odds[choice_id]
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--choices", type=int, default=10)
+    parser.add_argument(
+        "--ballots", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    args = parser.parse_args()
+
+    choice_ids = list(range(1, args.choices + 1))
+    print(f"{'ballots':>10} {'legacy (s)':>12} {'engine (s)':>12} {'speedup':>9}")
+    for num_ballots in args.ballots:
+        rows = generate(num_ballots, choice_ids)
+        legacy_time, (co_approvals, _, _) = timed(legacy, choice_ids, rows)
+        engine_time, (co_matrix, *_) = timed(engine, choice_ids, rows)
+
+        for (a, b), count in co_approvals.items():
+            assert co_matrix[a - 1, b - 1] == count, (a, b)
+
+        print(
+            f"{num_ballots:>10} {legacy_time:>12.4f} {engine_time:>12.4f}"
+            f" {legacy_time / engine_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
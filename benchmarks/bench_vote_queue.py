@@ -0,0 +1,174 @@
+"""
+Compare sustained vote throughput with and without the vote queue.
+
+Usage:
+    python benchmarks/bench_vote_queue.py [--workers 8] [--seconds 10]
+        [--choices 10] [--batch-size 200]
+
+Each mode migrates a fresh SQLite database file and has --workers processes
+post votes to an open poll through the Django test client for --seconds, the
+way gunicorn workers would during a spike. Direct mode records every vote in
+its own transaction. Queue mode only appends the vote to the queue, while a
+separate writer process records the queue in batches; its throughput counts
+the votes recorded before the writer catches up with the queue.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.DATABASES["default"]["NAME"] = os.path.join(
+    tempfile.mkdtemp(), "bench.sqlite3"
+)
+django.setup()
+settings.ALLOWED_HOSTS.append("testserver")
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from approval_polls.models import Ballot, Poll, QueuedVote  # noqa: E402
+
+
+def reset_database(num_choices):
+    connections.close_all()
+    path = settings.DATABASES["default"]["NAME"]
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench", "bench@example.com", "bench")
+    poll = Poll.objects.create(
+        question="Benchmark poll", pub_date=timezone.now(), user=user, vtype=1
+    )
+    for n in range(num_choices):
+        poll.choice_set.create(choice_text=f"Choice {n}")
+    connections.close_all()
+    return poll.id
+
+
+def voter(poll_id, num_choices, deadline, seed, results):
+    client = Client()
+    rng = random.Random(seed)
+    url = reverse("vote", args=(poll_id,))
+    results_url = reverse("results", args=(poll_id,))
+    acknowledged = failed = 0
+    latencies = []
+    while time.perf_counter() < deadline:
+        data = {
+            f"choice{n}": "" for n in range(1, num_choices + 1) if rng.random() < 0.4
+        }
+        started = time.perf_counter()
+        response = client.post(url, data)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 302 and response["Location"] == results_url:
+            acknowledged += 1
+        else:
+            failed += 1
+    results.put((acknowledged, failed, latencies))
+
+
+def writer(batch_size, stop, results):
+    batches, delays = [], []
+    while True:
+        batch = QueuedVote.record_batch(batch_size)
+        if batch:
+            batches.append(len(batch))
+            delays.extend(
+                (queued.recorded_at - queued.queued_at).total_seconds()
+                for queued in batch
+                if queued.recorded_at is not None
+            )
+        elif stop.is_set():
+            break
+        else:
+            time.sleep(0.01)
+    results.put((batches, delays))
+
+
+def run(mode, args):
+    settings.VOTE_QUEUE = mode == "queue"
+    poll_id = reset_database(args.choices)
+    context = multiprocessing.get_context("fork")
+    results, writer_results = context.Queue(), context.Queue()
+    stop = context.Event()
+
+    started = time.perf_counter()
+    deadline = started + args.seconds
+    voters = [
+        context.Process(
+            target=voter, args=(poll_id, args.choices, deadline, seed, results)
+        )
+        for seed in range(args.workers)
+    ]
+    drain = context.Process(target=writer, args=(args.batch_size, stop, writer_results))
+    if settings.VOTE_QUEUE:
+        drain.start()
+    for process in voters:
+        process.start()
+    outcomes = [results.get() for _ in voters]
+    for process in voters:
+        process.join()
+    if settings.VOTE_QUEUE:
+        stop.set()
+        batches, delays = writer_results.get()
+        drain.join()
+    elapsed = time.perf_counter() - started
+
+    acknowledged = sum(outcome[0] for outcome in outcomes)
+    failed = sum(outcome[1] for outcome in outcomes)
+    latencies = sorted(latency for outcome in outcomes for latency in outcome[2])
+    recorded = Ballot.objects.filter(poll_id=poll_id).count()
+    connections.close_all()
+
+    print(f"{mode}:")
+    print(
+        f"  acknowledged {acknowledged} ({acknowledged / args.seconds:.0f}/s),"
+        f" failed {failed}"
+    )
+    print(
+        f"  request latency median {statistics.median(latencies) * 1000:.1f}ms"
+        f" p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+    )
+    print(f"  recorded {recorded} in {elapsed:.1f}s ({recorded / elapsed:.0f}/s)")
+    if settings.VOTE_QUEUE and batches:
+        delays.sort()
+        print(
+            f"  {len(batches)} batches, mean size {statistics.mean(batches):.1f},"
+            f" max {max(batches)}"
+        )
+        print(
+            f"  queue delay median {statistics.median(delays) * 1000:.1f}ms"
+            f" p99 {delays[int(len(delays) * 0.99)] * 1000:.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--choices", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    for mode in ("direct", "queue"):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
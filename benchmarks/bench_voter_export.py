@@ -0,0 +1,98 @@
+"""
+Measure the memory and time of a poll owner's voter roll and voter export.
+
+Usage:
+    python benchmarks/bench_voter_export.py [--ballots 10000,100000]
+
+For each --ballots size, creates a poll in a fresh SQLite database file with
+that many ballots cast by email, then loads the poll admin page and
+downloads the voters as CSV and NDJSON, reporting the time and the peak
+Python memory allocated (with tracemalloc) for each. The admin page shows
+one page of voters and the downloads stream a chunk at a time, so neither
+should grow with the number of ballots.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "approval_polls.settings")
+os.environ.setdefault("DEBUG", "True")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+DIRECTORY = tempfile.mkdtemp()
+settings.DATABASES["default"]["NAME"] = os.path.join(DIRECTORY, "bench.sqlite3")
+django.setup()
+settings.ALLOWED_HOSTS.append("testserver")
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import reset_queries  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from approval_polls.models import Ballot, Poll  # noqa: E402
+
+
+def create_poll(user, num_ballots):
+    poll = Poll.objects.create(
+        question="Benchmark poll", pub_date=timezone.now(), user=user, vtype=3
+    )
+    Ballot.objects.bulk_create(
+        [Ballot(poll=poll, email=f"voter{n}@example.com") for n in range(num_ballots)],
+        batch_size=2000,
+    )
+    return poll
+
+
+def measure(client, url, params=None):
+    reset_queries()
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url, params or {})
+    size = sum(
+        len(chunk)
+        for chunk in (
+            response.streaming_content if response.streaming else [response.content]
+        )
+    )
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ballots", default="10000,100000")
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench", "bench@example.com", "bench")
+    client = Client()
+    client.force_login(user)
+
+    for num_ballots in map(int, args.ballots.split(",")):
+        poll = create_poll(user, num_ballots)
+        export = reverse("export_voters", args=(poll.id,))
+        for name, url, params in [
+            ("poll_admin", reverse("poll_admin", args=(poll.id,)), None),
+            ("export csv", export, {"format": "csv"}),
+            ("export ndjson", export, {"format": "ndjson"}),
+        ]:
+            size, elapsed, peak = measure(client, url, params)
+            print(
+                f"{num_ballots:>7} ballots, {name:<13}: {size / 1024:>8,.0f} KiB"
+                f" in {elapsed:.2f}s, peak memory {peak / 2**20:.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
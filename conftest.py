@@ -0,0 +1,16 @@
+import pytest
+from django.core.cache import cache
+
+from approval_polls import ratelimit
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Poll IDs are reused once a test's transaction is rolled back, so
+    # revision-keyed entries from an earlier test could otherwise be served.
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    ratelimit.reset()
@@ -24,6 +24,44 @@ python manage.py collectstatic --noinput
 echo "Compressing static files..."
 python manage.py compress --force
 
-# Start Gunicorn server
+# Run a command in the background next to the web server, since they share
+# the SQLite database, starting it again whenever it exits
+supervise() {
+	(
+		set +e
+		while true; do
+			"$@"
+			echo "$* exited with status $?, restarting in 5 seconds..."
+			sleep 5
+		done
+	) &
+}
+
+# Start the background results worker, which also keeps SQLite's planner
+# statistics fresh and its write-ahead log short, and deletes expired vote
+# tokens and rate limit counters, every hour
+echo "Starting results worker..."
+supervise python manage.py run_results_worker
+
+# Record queued votes when the vote queue is enabled
+case "${VOTE_QUEUE}" in
+[Tt]rue | 1 | [Yy]es | on)
+	echo "Starting vote writer..."
+	supervise python manage.py run_vote_writer
+	;;
+esac
+
+# Serve with uvicorn when SERVER_MODE=asgi, so that slow requests to the async
+# views wait on the event loop instead of each holding a worker; otherwise
+# with Gunicorn's sync workers
+if [ "${SERVER_MODE}" = "asgi" ]; then
+	# Each ASGI request runs its database queries in a thread of its own,
+	# which can't reuse a persistent connection
+	export CONN_MAX_AGE="${CONN_MAX_AGE:-0}"
+	echo "Starting Uvicorn server..."
+	exec uvicorn "approval_polls.asgi:application" --host 0.0.0.0 --port 8000 \
+		--workers "${WEB_CONCURRENCY:-1}"
+fi
+
 echo "Starting Gunicorn server..."
 exec gunicorn "approval_polls.wsgi:application" "-b 0.0.0.0:8000"